@@ -0,0 +1,238 @@
+import os
+import re
+import socket
+import logging
+import mimetypes
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote, quote, urlparse
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_HOST = "0.0.0.0"
+DOWNLOAD_PORT = 8551
+DOWNLOAD_ROOT = "web_exports"          # 未注册的会话回退到该目录下的同名子目录
+DOWNLOAD_BACKLOG = 128                 # 监听队列长度，多人同时下载时避免连接被拒绝
+DOWNLOAD_IDLE_TIMEOUT = 60             # 长连接空闲超时（秒），避免空闲连接长期占用线程
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _make_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # 比较时忽略弱校验前缀 W/
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _parse_range(header, size):
+    # 只支持单个区间；返回 (start, end) 闭区间，None 表示忽略 Range 返回完整文件，
+    # 区间不可满足时返回 False
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N 表示最后 N 个字节
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class DownloadRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # 保持长连接，断点续传时复用同一连接
+    server_version = "FofaDownload/1.0"
+    timeout = DOWNLOAD_IDLE_TIMEOUT
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def do_HEAD(self):
+        self._serve(head_only=True)
+
+    def do_GET(self):
+        self._serve(head_only=False)
+
+    def _send_empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _serve(self, head_only):
+        path = self.server.download_server.resolve(urlparse(self.path).path)
+        if path is None:
+            self._send_empty(404)
+            return
+
+        # 客户端接受 gzip 且存在不早于原文件的 .gz 预压缩版本时直接发送该版本
+        content_path, encoding = path, None
+        accept_encoding = self.headers.get("Accept-Encoding", "")
+        if "gzip" in accept_encoding and not path.endswith(".gz"):
+            gz_path = path + ".gz"
+            try:
+                if os.stat(gz_path).st_mtime_ns >= os.stat(path).st_mtime_ns:
+                    content_path, encoding = gz_path, "gzip"
+            except OSError:
+                pass
+
+        try:
+            f = open(content_path, "rb")
+        except OSError:
+            self._send_empty(404)
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = _make_etag(stat)
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+            headers = {
+                "ETag": etag,
+                "Last-Modified": last_modified,
+                "Accept-Ranges": "bytes",
+                "Vary": "Accept-Encoding",
+            }
+
+            if _etag_matches(self.headers.get("If-None-Match"), etag):
+                self._send_empty(304, headers)
+                return
+            if self.headers.get("If-None-Match") is None and self.headers.get("If-Modified-Since"):
+                try:
+                    since = parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp()
+                    if int(stat.st_mtime) <= since:
+                        self._send_empty(304, headers)
+                        return
+                except (TypeError, ValueError):
+                    pass
+
+            status, start, end = 200, 0, size - 1
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            # If-Range 与当前版本不一致时说明文件已变化，返回完整内容
+            if range_header and (if_range is None or if_range.strip() == etag or if_range.strip() == last_modified):
+                byte_range = _parse_range(range_header, size)
+                if byte_range is False:
+                    headers["Content-Range"] = f"bytes */{size}"
+                    self._send_empty(416, headers)
+                    return
+                if byte_range is not None:
+                    status, (start, end) = 206, byte_range
+                    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            length = max(end - start + 1, 0)
+
+            filename = os.path.basename(path)
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(length))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if head_only or length == 0:
+                return
+
+            try:
+                self._send_file(f, start, length)
+            except (BrokenPipeError, ConnectionResetError, socket.timeout):
+                # 客户端中途断开属于正常情况（例如暂停下载），下次可用 Range 续传
+                self.close_connection = True
+                logger.debug(f"下载连接中断: {filename}")
+
+    def _send_file(self, f, offset, length):
+        self.wfile.flush()
+        # socket.sendfile 在支持的平台上使用 os.sendfile 零拷贝发送，不支持时（如 Windows）退回分块发送。
+        # 套接字处于超时模式（timeout = DOWNLOAD_IDLE_TIMEOUT），发送缓冲区写满时它会等待可写，
+        # 客户端读取较慢也不会因 EAGAIN 中断；超过空闲超时仍不可写时抛出 socket.timeout
+        sent = self.connection.sendfile(f, offset, length)
+        if sent < length:
+            # 发送过程中文件被截断
+            raise BrokenPipeError("文件在发送过程中被截断")
+
+
+class DownloadHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = DOWNLOAD_BACKLOG
+
+    def __init__(self, address, download_server):
+        self.download_server = download_server
+        super().__init__(address, DownloadRequestHandler)
+
+
+class DownloadServer:
+    """Web 模式下的文件下载服务：每个会话只能下载自己目录中的文件。
+
+    每个连接由独立线程处理，文件内容通过 socket.sendfile（底层为 os.sendfile）零拷贝发送，
+    支持 Range 断点续传、ETag/If-None-Match 缓存校验以及 .gz 预压缩版本。
+    """
+
+    def __init__(self, host=DOWNLOAD_HOST, port=DOWNLOAD_PORT, root=DOWNLOAD_ROOT):
+        self.host = host
+        self.port = port
+        self.root = root
+        self.session_dirs = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def add_session_dir(self, session_id, directory):
+        with self._lock:
+            self.session_dirs[session_id] = os.path.abspath(directory)
+
+    def remove_session_dir(self, session_id):
+        with self._lock:
+            self.session_dirs.pop(session_id, None)
+
+    def resolve(self, url_path):
+        # 把 /<session_id>/<文件名> 映射到磁盘路径；只允许会话目录下的普通文件
+        parts = [unquote(part) for part in url_path.strip("/").split("/")]
+        if len(parts) != 2:
+            return None
+        session_id, filename = parts
+        if not session_id or not filename or filename != os.path.basename(filename) or filename in (".", ".."):
+            return None
+        with self._lock:
+            directory = self.session_dirs.get(session_id)
+        if directory is None:
+            if session_id != os.path.basename(session_id) or session_id in (".", ".."):
+                return None
+            directory = os.path.abspath(os.path.join(self.root, session_id))
+        path = os.path.join(directory, filename)
+        if os.path.dirname(os.path.abspath(path)) != directory or not os.path.isfile(path):
+            return None
+        return path
+
+    def start(self):
+        if self._httpd is not None:
+            return
+        self._httpd = DownloadHTTPServer((self.host, self.port), self)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="download-server", daemon=True)
+        self._thread.start()
+        logger.info(f"下载服务器已启动: http://{self.host}:{self.port}/")
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+        self._thread = None
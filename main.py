@@ -1,6 +1,7 @@
 # === 在文件最顶部添加以下修复代码 ===
 import sys
 import os
+import asyncio
 # 修复：防止 sys.stdout / sys.stderr 为 None（常见于 PyInstaller --noconsole）
 if sys.stdout is None:
     sys.stdout = open(os.devnull, "w")
@@ -16,7 +17,23 @@ import time
 import logging
 import shutil
 import zipfile
-from datetime import datetime
+import tempfile
+import uuid
+import queue
+import hashlib
+import re
+import sqlite3
+import zlib
+import gzip
+import io
+import math
+import bisect
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, date, timedelta
+from email.utils import parsedate_to_datetime
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from functools import wraps
@@ -24,6 +41,17 @@ from functools import wraps
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+# === 列式导出相关导入（可选依赖）===
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 # === HTTP服务器相关导入 ===
 import threading
 from download_server import DownloadServer
@@ -33,7 +61,7 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler("fofa_gui.log", encoding='utf-8'),
+        logging.FileHandler("fofa_gui.log", encoding='utf-8', delay=True),   # 首次写入日志时才创建文件
         logging.StreamHandler()
     ]
 )
@@ -55,35 +83,2651 @@ def _derive_key(password: bytes, salt: bytes) -> bytes:
     )
     return base64.urlsafe_b64encode(kdf.derive(password))
 
+# PBKDF2 派生开销较大，每个进程只派生一次，之后复用内存中的 Fernet 实例
+_fernet = None
+_fernet_lock = threading.Lock()
+
+def _get_fernet() -> Fernet:
+    global _fernet
+    if _fernet is None:
+        with _fernet_lock:
+            if _fernet is None:
+                start = time.perf_counter()
+                _fernet = Fernet(_derive_key(PASSWORD, SALT))
+                logger.info(f"加密密钥派生完成，耗时 {(time.perf_counter() - start) * 1000:.0f} ms（每个进程仅一次）")
+    return _fernet
+
 def encrypt_data(data: str) -> bytes:
-    key = _derive_key(PASSWORD, SALT)
-    f = Fernet(key)
-    return f.encrypt(data.encode('utf-8'))
+    return _get_fernet().encrypt(data.encode('utf-8'))
 
 def decrypt_data(encrypted_data: bytes) -> str:
-    key = _derive_key(PASSWORD, SALT)
-    f = Fernet(key)
-    return f.decrypt(encrypted_data).decode('utf-8')
+    return _get_fernet().decrypt(encrypted_data).decode('utf-8')
+
+# 已解密的 API 密钥缓存：绝对路径 -> ((修改时间, 文件大小), 密钥)，文件变化后自动失效
+_api_key_cache = {}
+_api_key_cache_lock = threading.Lock()
 
 def save_api_key_encrypted(api_key: str, filename: str = "key.enc"):
     encrypted = encrypt_data(api_key)
     with open(filename, "wb") as f:
         f.write(encrypted)
+    with _api_key_cache_lock:
+        _api_key_cache.pop(os.path.abspath(filename), None)
     logger.info("API密钥已加密保存到 key.enc")
 
 def load_api_key_encrypted(filename: str = "key.enc") -> str | None:
-    if not os.path.exists(filename):
+    path = os.path.abspath(filename)
+    try:
+        st = os.stat(path)
+    except OSError:
+        with _api_key_cache_lock:
+            _api_key_cache.pop(path, None)
         return None
+    signature = (st.st_mtime_ns, st.st_size)
+    with _api_key_cache_lock:
+        cached = _api_key_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
     try:
-        with open(filename, "rb") as f:
+        with open(path, "rb") as f:
             encrypted = f.read()
-        return decrypt_data(encrypted)
+        api_key = decrypt_data(encrypted)
     except Exception as e:
         logger.error(f"解密密钥失败: {e}")
         return None
+    with _api_key_cache_lock:
+        _api_key_cache[path] = (signature, api_key)
+    return api_key
+
+# === HTTP 连接池配置 ===
+FOFA_API_BASE = os.environ.get("FOFA_API_BASE", "https://fofa.info")  # 可指向本地模拟服务器做测试
+HTTP_POOL_SIZE = 20  # 单个主机最多保持的长连接数
+
+class FofaHttpClient:
+    """进程级共享的 FOFA HTTP 客户端：跨调用、跨实例、跨 Web 会话复用 TCP/TLS 连接"""
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, base_url=FOFA_API_BASE):
+        self.pool_size = pool_size
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        # 429 不在此重试，交给按密钥共享的限速调度器统一退避
+        retry_strategy = Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[500, 502, 503, 504]
+        )
+        # pool_block=True：并发超过连接池大小时等待空闲连接，而不是新建后丢弃
+        self.adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry_strategy
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def get(self, path, params=None, timeout=15):
+        return self.session.get(f"{self.base_url}{path}", params=params, timeout=timeout)
+
+    def stats(self):
+        # urllib3 的每个连接池都记录了新建连接数和请求数，二者之差即为复用次数
+        total_requests = 0
+        total_connections = 0
+        pools = self.adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+        reused = max(0, total_requests - total_connections)
+        return {
+            'pool_size': self.pool_size,
+            'requests': total_requests,
+            'connections': total_connections,
+            'reused': reused,
+            'reuse_ratio': reused / total_requests if total_requests else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+def get_http_client() -> FofaHttpClient:
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = FofaHttpClient()
+    return _http_client
+
+def configure_http_client(pool_size: int = HTTP_POOL_SIZE, base_url: str = FOFA_API_BASE) -> FofaHttpClient:
+    global _http_client
+    with _http_client_lock:
+        old_client = _http_client
+        _http_client = FofaHttpClient(pool_size=pool_size, base_url=base_url)
+    if old_client is not None:
+        old_client.close()
+    logger.info(f"HTTP 客户端已重新配置: 连接池大小 {pool_size}, 地址 {base_url}")
+    return _http_client
+
+def log_http_stats(prefix="HTTP连接统计"):
+    stats = get_http_client().stats()
+    logger.info(
+        f"{prefix}: 请求 {stats['requests']} 次, 新建连接 {stats['connections']} 个, "
+        f"复用 {stats['reused']} 次 (复用率 {stats['reuse_ratio']:.1%})"
+    )
+    return stats
+
+# 单个查询允许全量拉取的最大记录数
+FULL_FETCH_LIMIT = 100000
+
+# 全量拉取引擎：按页码分页 (search/all) 或游标分页 (search/next)
+ENGINE_PAGE = "page"
+ENGINE_CURSOR = "next"
+
+# === 异步客户端配置 ===
+try:
+    import httpx
+except ImportError:  # httpx 随 flet 一起安装，缺失时仅异步接口不可用
+    httpx = None
+
+ASYNC_POOL_SIZE = 50         # 异步连接池的最大连接数，所有会话共用
+ASYNC_SERVER_RETRIES = 3     # 5xx 或网络错误时的重试次数
+
+class AsyncFofaClient:
+    """基于 httpx.AsyncClient 的异步 FOFA 客户端，运行在进程唯一的事件循环上"""
+
+    def __init__(self, pool_size=ASYNC_POOL_SIZE, base_url=FOFA_API_BASE):
+        if httpx is None:
+            raise RuntimeError("异步客户端需要安装 httpx")
+        self.pool_size = pool_size
+        self.base_url = base_url.rstrip('/')
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=15,
+            transport=httpx.AsyncHTTPTransport(retries=2),
+        )
+
+    async def get(self, path, params=None):
+        return await self.client.get(path, params=params)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+_async_loop = None
+_async_client = None
+_async_lock = threading.Lock()
+
+def get_async_loop() -> asyncio.AbstractEventLoop:
+    # 后台线程上运行的唯一事件循环，所有会话的异步请求都调度到这里
+    global _async_loop
+    if _async_loop is None:
+        with _async_lock:
+            if _async_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="fofa-async-loop", daemon=True).start()
+                _async_loop = loop
+    return _async_loop
+
+def get_async_client() -> AsyncFofaClient:
+    # 只应在 get_async_loop() 的事件循环中调用；地址跟随 configure_http_client 的设置
+    global _async_client
+    base_url = get_http_client().base_url
+    if _async_client is not None and _async_client.base_url != base_url:
+        old_client, _async_client = _async_client, None
+        asyncio.get_running_loop().create_task(old_client.aclose())
+    if _async_client is None:
+        _async_client = AsyncFofaClient(base_url=base_url)
+    return _async_client
+
+def run_async(coro, timeout=None):
+    # 供同步代码调用：在共享事件循环上执行协程并等待结果
+    return asyncio.run_coroutine_threadsafe(coro, get_async_loop()).result(timeout)
+
+async def run_on_async_loop(coro):
+    # 供其他事件循环（如 Flet 的异步事件处理器）调用：在共享事件循环上执行协程并等待结果
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, get_async_loop()))
+
+# === 限速与并发分页配置 ===
+FOFA_RATE_LIMIT = 2.0   # FOFA API 每秒允许的请求数（令牌桶填充速率）
+FOFA_RATE_BURST = 2     # 令牌桶容量，即允许的瞬时突发请求数
+PAGE_FETCH_WORKERS = 4  # 全量获取时同时拉取的页数
+
+class TokenBucket:
+    """线程安全的令牌桶限速器，按固定速率发放请求许可"""
+
+    def __init__(self, rate=FOFA_RATE_LIMIT, capacity=FOFA_RATE_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        # 成功取得令牌返回 0，否则返回还需等待的秒数
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def drain(self):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+# === 按 API 密钥共享的限速调度配置 ===
+RATE_LIMIT_MAX_RETRIES = 3         # 收到 429 后最多重新排队的次数
+RATE_LIMIT_DEFAULT_BACKOFF = 5.0   # 429 未携带 Retry-After 时的默认退避秒数
+
+def _parse_retry_after(value, default=RATE_LIMIT_DEFAULT_BACKOFF):
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class KeyRateScheduler:
+    """单个 API 密钥的请求调度：令牌桶限速，按会话轮转公平分配请求许可"""
+
+    def __init__(self, rate=FOFA_RATE_LIMIT, capacity=FOFA_RATE_BURST):
+        self.bucket = TokenBucket(rate, capacity)
+        self.cond = threading.Condition()
+        self.pending = {}          # 会话ID -> 等待中的请求票据队列
+        self.rotation = deque()    # 有请求在排队的会话，按轮转顺序
+        self.granted = set()
+        self.blocked_until = 0.0
+        self.total_granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def _dispatch_locked(self):
+        # 在持有锁的情况下发放许可，返回下一次可发放前需等待的秒数
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        while self.rotation:
+            wait = self.bucket.try_acquire()
+            if wait > 0:
+                return wait
+            session_id = self.rotation.popleft()
+            tickets = self.pending[session_id]
+            self.granted.add(tickets.popleft())
+            if tickets:
+                self.rotation.append(session_id)
+            else:
+                del self.pending[session_id]
+            self.cond.notify_all()
+        return None
+
+    def _enqueue_locked(self, session_id, ticket):
+        if session_id not in self.pending:
+            self.pending[session_id] = deque()
+            self.rotation.append(session_id)
+        self.pending[session_id].append(ticket)
+
+    def _finish_locked(self, ticket, start):
+        self.granted.discard(ticket)
+        waited = time.monotonic() - start
+        self.total_granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def acquire(self, session_id=None):
+        ticket = object()
+        start = time.monotonic()
+        with self.cond:
+            self._enqueue_locked(session_id, ticket)
+            while ticket not in self.granted:
+                wait = self._dispatch_locked()
+                if ticket in self.granted:
+                    break
+                self.cond.wait(wait)
+            return self._finish_locked(ticket, start)
+
+    async def acquire_async(self, session_id=None):
+        # 协程版本：与线程版本共用同一队列和令牌桶，等待时让出事件循环而不是阻塞线程
+        ticket = object()
+        start = time.monotonic()
+        with self.cond:
+            self._enqueue_locked(session_id, ticket)
+        while True:
+            with self.cond:
+                if ticket not in self.granted:
+                    wait = self._dispatch_locked()
+                if ticket in self.granted:
+                    return self._finish_locked(ticket, start)
+            await asyncio.sleep(wait if wait is not None else 0.05)
+
+    def penalize(self, retry_after):
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.throttled += 1
+            self.bucket.drain()
+            self.cond.notify_all()
+
+    def backlog(self):
+        # 估算新请求需要等待的秒数：暂停剩余时间加上排在前面的请求按速率发放所需的时间
+        with self.cond:
+            queued = sum(len(t) for t in self.pending.values())
+            blocked_for = max(0.0, self.blocked_until - time.monotonic())
+        return blocked_for + queued / self.bucket.rate
+
+    def stats(self):
+        with self.cond:
+            return {
+                'queue_depth': sum(len(t) for t in self.pending.values()),
+                'waiting_sessions': len(self.pending),
+                'granted': self.total_granted,
+                'avg_wait': self.total_wait / self.total_granted if self.total_granted else 0.0,
+                'max_wait': self.max_wait,
+                'throttled': self.throttled,
+                'blocked_for': max(0.0, self.blocked_until - time.monotonic()),
+            }
+
+class RateLimitScheduler:
+    """进程内按 API 密钥划分的调度器注册表，所有会话的 fofa_search 都经由这里"""
+
+    def __init__(self, rate=FOFA_RATE_LIMIT, capacity=FOFA_RATE_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.schedulers = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key_id(api_key):
+        return hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:16]
+
+    def for_key(self, api_key) -> KeyRateScheduler:
+        key_id = self._key_id(api_key)
+        with self.lock:
+            scheduler = self.schedulers.get(key_id)
+            if scheduler is None:
+                scheduler = KeyRateScheduler(self.rate, self.capacity)
+                self.schedulers[key_id] = scheduler
+            return scheduler
+
+    def acquire(self, api_key, session_id=None):
+        return self.for_key(api_key).acquire(session_id)
+
+    async def acquire_async(self, api_key, session_id=None):
+        return await self.for_key(api_key).acquire_async(session_id)
+
+    def penalize(self, api_key, retry_after):
+        self.for_key(api_key).penalize(retry_after)
+
+    def stats(self, api_key):
+        return self.for_key(api_key).stats()
+
+# 全局调度器：同一进程内所有会话共用
+rate_scheduler = RateLimitScheduler()
+
+def log_rate_stats(api_key, prefix="限速调度统计"):
+    stats = rate_scheduler.stats(api_key)
+    logger.info(
+        f"{prefix}: 已放行 {stats['granted']} 次, 排队 {stats['queue_depth']} 个, "
+        f"平均等待 {stats['avg_wait']:.2f}s, 最长等待 {stats['max_wait']:.2f}s, 429 次数 {stats['throttled']}"
+    )
+    return stats
+
+# === 多密钥池配置 ===
+# 密钥池保存在本机、由进程内所有会话共享，只在桌面模式下提供，Web 访问者不能使用或管理池中的账号；
+# 默认关闭，需要在密钥池窗口中勾选后才按池轮询（池中没有可用密钥时使用界面中填写的单个密钥）
+KEY_POOL_ENABLED = False
+KEY_POOL_PATH = "keys.enc"
+KEY_POOL_MAX_ERRORS = 3            # 连续出错达到该次数后暂停使用该密钥
+KEY_POOL_ERROR_COOLDOWN = 120      # 暂停使用的秒数
+KEY_POOL_CURSOR_PINS = 1024        # 记住游标所属密钥的数量，游标只能由发起查询的账号继续翻页
+# FOFA 返回这些错误码时说明账号额度耗尽或已失效，直接移出轮询（见 FOFA API 文档的错误码表）：
+#   -700    Account Invalid，密钥错误或账号已失效
+#   820031  F点余额不足
+KEY_EXHAUSTED_CODES = frozenset({-700, 820031})
+KEY_POOL_CACHE_SCOPE = "key-pool"  # 使用密钥池时缓存键的账号作用域，见 FofaGUIApp._cache_scope
+_ERRMSG_CODE_RE = re.compile(r'^\s*\[(-?\d+)\]')
+
+def fofa_error_code(result):
+    # 优先读取响应中的 errno 字段；旧版接口只在 errmsg 开头给出 "[820031] ..."，此时从中解析
+    code = result.get('errno')
+    if code is None:
+        match = _ERRMSG_CODE_RE.match(str(result.get('errmsg', '')))
+        code = match.group(1) if match else None
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def mask_api_key(api_key: str) -> str:
+    return f"{api_key[:4]}…{api_key[-4:]}" if len(api_key) > 8 else "****"
+
+class PooledKey:
+    """密钥池中的单个密钥及其使用情况"""
+
+    def __init__(self, key, label=""):
+        self.key = key
+        self.label = label
+        self.remaining = None        # 剩余 F 点，尚未查询额度时为 None
+        self.remaining_queries = None
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.waiting = 0             # 已选中该密钥、仍在限速队列中等待的请求数
+        self.exhausted = False
+        self.last_error = ""
+        self.paused_until = 0.0
+
+    def usable(self, now):
+        return not self.exhausted and now >= self.paused_until
+
+    def status(self):
+        if self.exhausted:
+            return "已耗尽"
+        if time.monotonic() < self.paused_until:
+            return "暂停"
+        return "可用"
+
+class KeyPool:
+    """多个 FOFA 账号的密钥池，加密保存在 keys.enc。
+
+    每个密钥使用 rate_scheduler 中独立的限速调度器，请求总是分给预计等待最短的密钥，
+    等待相同时按轮询顺序分配；额度耗尽或失效的密钥自动移出轮询，连续出错的密钥暂停一段时间。
+    """
+
+    def __init__(self, path=KEY_POOL_PATH, scheduler=None):
+        self.path = path
+        self.scheduler = scheduler or rate_scheduler
+        self.lock = threading.Lock()
+        self.keys = []
+        self.rotation = 0
+        self.cursor_keys = OrderedDict()
+        self._load()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                entries = json.loads(decrypt_data(f.read()))
+        except Exception as e:
+            logger.error(f"读取密钥池失败: {e}")
+            return
+        self.keys = [PooledKey(entry['key'], entry.get('label', "")) for entry in entries if entry.get('key')]
+        logger.info(f"已加载密钥池，共 {len(self.keys)} 个密钥")
+
+    def _save_locked(self):
+        data = json.dumps([{'key': k.key, 'label': k.label} for k in self.keys], ensure_ascii=False)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encrypt_data(data))
+        os.replace(tmp_path, self.path)
+
+    def _find_locked(self, key):
+        for pooled in self.keys:
+            if pooled.key == key:
+                return pooled
+        return None
+
+    def add(self, key, label=""):
+        key = key.strip()
+        with self.lock:
+            pooled = self._find_locked(key)
+            if pooled is None:
+                pooled = PooledKey(key, label)
+                self.keys.append(pooled)
+            else:
+                pooled.label = label or pooled.label
+            self._save_locked()
+        logger.info(f"密钥池已添加密钥 {mask_api_key(key)}")
+        return pooled
+
+    def remove(self, key):
+        with self.lock:
+            self.keys = [k for k in self.keys if k.key != key]
+            for cursor in [c for c, k in self.cursor_keys.items() if k == key]:
+                del self.cursor_keys[cursor]
+            self._save_locked()
+
+    def reset(self, key):
+        # 充值或更换账号后手动恢复使用
+        with self.lock:
+            pooled = self._find_locked(key)
+            if pooled is not None:
+                pooled.exhausted = False
+                pooled.consecutive_errors = 0
+                pooled.paused_until = 0.0
+                pooled.last_error = ""
+
+    def usable_count(self):
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for k in self.keys if k.usable(now))
+
+    def _pick_locked(self, cursor):
+        if cursor is not None and cursor in self.cursor_keys:
+            pooled = self._find_locked(self.cursor_keys[cursor])
+            if pooled is not None:
+                return pooled
+        now = time.monotonic()
+        best, best_wait, best_index = None, None, 0
+        count = len(self.keys)
+        for offset in range(count):
+            index = (self.rotation + offset) % count
+            pooled = self.keys[index]
+            if not pooled.usable(now):
+                continue
+            scheduler = self.scheduler.for_key(pooled.key)
+            wait = scheduler.backlog() + pooled.waiting / scheduler.bucket.rate
+            if best is None or wait < best_wait:
+                best, best_wait, best_index = pooled, wait, index
+        if best is not None:
+            self.rotation = best_index + 1
+        return best
+
+    def _checkout(self, cursor):
+        with self.lock:
+            pooled = self._pick_locked(cursor)
+            if pooled is not None:
+                pooled.waiting += 1
+            return pooled
+
+    def _checkin(self, pooled):
+        with self.lock:
+            pooled.waiting -= 1
+            pooled.requests += 1
+
+    def acquire(self, session_id=None, cursor=None):
+        # 选出密钥并在其限速队列中等到放行，返回密钥；没有可用密钥时返回 None
+        pooled = self._checkout(cursor)
+        if pooled is None:
+            return None
+        try:
+            self.scheduler.acquire(pooled.key, session_id)
+        finally:
+            self._checkin(pooled)
+        return pooled.key
+
+    async def acquire_async(self, session_id=None, cursor=None):
+        pooled = self._checkout(cursor)
+        if pooled is None:
+            return None
+        try:
+            await self.scheduler.acquire_async(pooled.key, session_id)
+        finally:
+            self._checkin(pooled)
+        return pooled.key
+
+    def pin_cursor(self, cursor, key):
+        with self.lock:
+            self.cursor_keys[cursor] = key
+            while len(self.cursor_keys) > KEY_POOL_CURSOR_PINS:
+                self.cursor_keys.popitem(last=False)
+
+    def report_success(self, key, result):
+        with self.lock:
+            pooled = self._find_locked(key)
+            if pooled is None:
+                return
+            pooled.consecutive_errors = 0
+            consumed = result.get('consumed_fpoint') or 0
+            if pooled.remaining is not None and consumed:
+                pooled.remaining = max(0, pooled.remaining - consumed)
+
+    def report_error(self, key, error_msg, code=None):
+        # code 为 FOFA 的错误码（HTTP 错误等没有错误码时为 None）
+        # 返回 True 表示该密钥已耗尽并移出轮询，调用方可以换下一个密钥重试
+        with self.lock:
+            pooled = self._find_locked(key)
+            if pooled is None:
+                return False
+            pooled.errors += 1
+            pooled.last_error = error_msg
+            if code in KEY_EXHAUSTED_CODES:
+                pooled.exhausted = True
+                logger.warning(f"密钥 {mask_api_key(key)} 额度已耗尽或失效，移出轮询: {error_msg}")
+                return True
+            pooled.consecutive_errors += 1
+            if pooled.consecutive_errors >= KEY_POOL_MAX_ERRORS:
+                pooled.paused_until = time.monotonic() + KEY_POOL_ERROR_COOLDOWN
+                pooled.consecutive_errors = 0
+                logger.warning(f"密钥 {mask_api_key(key)} 连续出错，暂停使用 {KEY_POOL_ERROR_COOLDOWN} 秒")
+            return False
+
+    def refresh_quota(self, key):
+        # 通过账号信息接口更新剩余 F 点和 API 查询次数，返回错误信息或 None
+        # 与搜索请求共用该密钥的限速调度器，批量刷新额度不会挤占或突破账号的请求速率
+        try:
+            self.scheduler.acquire(key)
+            response = get_http_client().get("/api/v1/info/my", params={"key": key}, timeout=15)
+            response.raise_for_status()
+            info = response.json()
+        except Exception as e:
+            return str(e)
+        if info.get("error", False):
+            error_msg = info.get('errmsg', '未知错误')
+            self.report_error(key, error_msg, fofa_error_code(info))
+            return error_msg
+        with self.lock:
+            pooled = self._find_locked(key)
+            if pooled is None:
+                return None
+            pooled.remaining = info.get('fofa_point', pooled.remaining)
+            pooled.remaining_queries = info.get('remain_api_query', pooled.remaining_queries)
+            if pooled.remaining_queries == 0 and not pooled.remaining:
+                pooled.exhausted = True
+                pooled.last_error = "API 查询次数和 F 点均已用完"
+        return None
+
+    def entries(self):
+        with self.lock:
+            return [
+                {
+                    'key': k.key,
+                    'label': k.label,
+                    'masked': mask_api_key(k.key),
+                    'status': k.status(),
+                    'remaining': k.remaining,
+                    'remaining_queries': k.remaining_queries,
+                    'requests': k.requests,
+                    'errors': k.errors,
+                    'last_error': k.last_error,
+                }
+                for k in self.keys
+            ]
+
+_key_pool = None
+_key_pool_lock = threading.Lock()
+
+def get_key_pool() -> KeyPool:
+    global _key_pool
+    if _key_pool is None:
+        with _key_pool_lock:
+            if _key_pool is None:
+                _key_pool = KeyPool()
+    return _key_pool
+
+# === 查询结果缓存配置 ===
+CACHE_ENABLED = True
+CACHE_PATH = "fofa_cache.sqlite3"
+CACHE_TTL = 6 * 3600                   # 缓存有效期（秒）
+CACHE_MAX_BYTES = 200 * 1024 * 1024    # 缓存总大小上限，超出后按最近最少使用淘汰
+
+_QUOTED_RE = re.compile(r'("(?:[^"\\]|\\.)*")')
+_OPERATOR_SPACE_RE = re.compile(r'\s*(&&|\|\||!==|==|!=|=|\(|\))\s*')
+
+def normalize_query(query: str) -> str:
+    # 引号外的空白统一折叠，运算符两侧的空白去掉；引号内的内容原样保留
+    parts = _QUOTED_RE.split(query.strip())
+    for i in range(0, len(parts), 2):
+        part = " ".join(parts[i].split())
+        parts[i] = _OPERATOR_SPACE_RE.sub(r"\1", part)
+    return "".join(parts)
+
+class ResponseCache:
+    """基于 SQLite 的 fofa_search 响应缓存：按规范化查询、字段、页码和每页数量索引，支持 TTL 与 LRU 淘汰"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+
+    @staticmethod
+    def make_key(scope, query, fields, page, size):
+        # scope 为账号作用域：单个密钥时为该密钥，使用密钥池时为 KEY_POOL_CACHE_SCOPE
+        key_id = hashlib.sha256((scope or "").encode('utf-8')).hexdigest()[:16]
+        raw = json.dumps([key_id, normalize_query(query), fields, page, size], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT payload, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def put(self, key, value):
+        payload = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._evict_locked(now)
+
+    def _evict_locked(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            entries, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': total,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache | None:
+    global _response_cache
+    if not CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                try:
+                    _response_cache = ResponseCache()
+                except sqlite3.Error as e:
+                    logger.error(f"初始化查询缓存失败，将不使用缓存: {e}")
+                    return None
+    return _response_cache
+
+def configure_response_cache(path: str = CACHE_PATH, ttl: int = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES) -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        old_cache = _response_cache
+        _response_cache = ResponseCache(path=path, ttl=ttl, max_bytes=max_bytes)
+    if old_cache is not None:
+        old_cache.close()
+    logger.info(f"查询缓存已重新配置: {path}, 有效期 {ttl} 秒, 上限 {max_bytes} 字节")
+    return _response_cache
+
+def log_cache_stats(prefix="查询缓存统计"):
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    stats = cache.stats()
+    logger.info(
+        f"{prefix}: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次 (命中率 {stats['hit_ratio']:.1%}), "
+        f"条目 {stats['entries']} 个, 占用 {stats['bytes']} 字节, 淘汰 {stats['evictions']} 个"
+    )
+    return stats
+
+# === 本地资产库配置 ===
+ASSET_DB_ENABLED = False                 # 默认不记录，可在界面中按会话开启
+ASSET_DB_PATH = "fofa_assets.sqlite3"
+ASSET_DB_QUEUE_SIZE = 64                 # 等待写入的页数上限，写入跟不上时拉取线程会等待
+ASSET_SEARCH_LIMIT = 200                 # 资产搜索最多返回的行数
+
+_IP_RE = re.compile(r'^\d{1,3}(\.\d{1,3}){3}$')
+
+def _host_name(host):
+    # 从 host 字段（可能带协议和端口）中取出主机名，IP 返回空
+    name = host.split("://", 1)[-1].split("/", 1)[0]
+    if name.startswith("["):
+        return ""
+    name = name.rsplit(":", 1)[0] if name.count(":") == 1 else name
+    name = name.strip(".").lower()
+    return "" if not name or _IP_RE.match(name) or ":" in name else name
+
+def _reverse_domain(name):
+    return ".".join(reversed(name.split("."))) if name else ""
+
+class AssetDatabase:
+    """本地资产库：每页拉取结果批量写入 SQLite，按 ip/port/host/domain 建索引，并记录来源查询与时间。
+
+    写入由后台线程完成，拉取线程只把页面放入队列；查询使用单独的只读连接，不受写入事务阻塞（WAL）。
+    """
+
+    def __init__(self, path=ASSET_DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "id INTEGER PRIMARY KEY, query TEXT NOT NULL UNIQUE, first_seen REAL NOT NULL, last_seen REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS assets ("
+            "id INTEGER PRIMARY KEY, ip TEXT NOT NULL, port INTEGER NOT NULL, host TEXT NOT NULL, "
+            "domain TEXT NOT NULL, rdomain TEXT NOT NULL, data TEXT NOT NULL, "
+            "first_seen REAL NOT NULL, last_seen REAL NOT NULL, UNIQUE (ip, port, host));"
+            "CREATE TABLE IF NOT EXISTS asset_queries ("
+            "asset_id INTEGER NOT NULL, query_id INTEGER NOT NULL, first_seen REAL NOT NULL, last_seen REAL NOT NULL, "
+            "PRIMARY KEY (asset_id, query_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS idx_assets_port ON assets(port, last_seen);"
+            "CREATE INDEX IF NOT EXISTS idx_assets_host ON assets(host);"
+            "CREATE INDEX IF NOT EXISTS idx_assets_rdomain ON assets(rdomain);"
+            "CREATE INDEX IF NOT EXISTS idx_assets_last_seen ON assets(last_seen);"
+            "CREATE INDEX IF NOT EXISTS idx_asset_queries_query ON asset_queries(query_id);"
+        )
+        self.read_conn = sqlite3.connect(path, check_same_thread=False)
+        self.read_conn.execute(f"PRAGMA mmap_size={256 * 1024 * 1024}")
+        self.lock = threading.Lock()        # 保护写连接
+        self.read_lock = threading.Lock()   # 保护读连接
+        self.pages_written = 0
+        self.rows_written = 0
+        self.queue = queue.Queue(maxsize=ASSET_DB_QUEUE_SIZE)
+        self._writer = threading.Thread(target=self._write_loop, name="asset-db-writer", daemon=True)
+        self._writer.start()
+
+    def record_page(self, query, fields_list, rows):
+        if rows:
+            self.queue.put((query, list(fields_list), rows, time.time()))
+
+    def flush(self):
+        # 等待队列中的页面全部写入
+        self.queue.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < ASSET_DB_QUEUE_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch([item for item in batch if item is not None])
+            except Exception as e:
+                # 写入线程不能退出，否则队列写满后 record_page 会一直阻塞拉取线程
+                logger.error(f"写入资产库失败: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if any(item is None for item in batch):
+                return
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN")
+            try:
+                for query, fields_list, rows, seen in batch:
+                    conn.execute(
+                        "INSERT INTO queries (query, first_seen, last_seen) VALUES (?, ?, ?) "
+                        "ON CONFLICT(query) DO UPDATE SET last_seen = excluded.last_seen",
+                        (query, seen, seen)
+                    )
+                    query_id = conn.execute("SELECT id FROM queries WHERE query = ?", (query,)).fetchone()[0]
+                    records = [self._record(fields_list, row, seen) for row in rows]
+                    conn.executemany(
+                        "INSERT INTO assets (ip, port, host, domain, rdomain, data, first_seen, last_seen) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(ip, port, host) DO UPDATE SET "
+                        "data = excluded.data, last_seen = excluded.last_seen, "
+                        "domain = CASE WHEN excluded.domain != '' THEN excluded.domain ELSE domain END, "
+                        "rdomain = CASE WHEN excluded.rdomain != '' THEN excluded.rdomain ELSE rdomain END",
+                        records
+                    )
+                    conn.executemany(
+                        "INSERT INTO asset_queries (asset_id, query_id, first_seen, last_seen) "
+                        "SELECT id, ?, ?, ? FROM assets WHERE ip = ? AND port = ? AND host = ? "
+                        "ON CONFLICT(asset_id, query_id) DO UPDATE SET last_seen = excluded.last_seen",
+                        [(query_id, seen, seen, record[0], record[1], record[2]) for record in records]
+                    )
+                    self.pages_written += 1
+                    self.rows_written += len(records)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            # 更新索引统计信息，让查询规划器在多个条件时选择区分度更高的索引
+            conn.execute("PRAGMA optimize")
+
+    @staticmethod
+    def _record(fields_list, row, seen):
+        values = _stringify_row(row)
+        data = dict(zip(fields_list, values))
+        port = data.get('port', "")
+        host = data.get('host', "")
+        name = _host_name(host)
+        domain = data.get('domain', "") or name
+        return (
+            data.get('ip', ""),
+            int(port) if port.isdigit() else 0,
+            host,
+            domain,
+            _reverse_domain(name or domain.lower()),
+            json.dumps(data, ensure_ascii=False),
+            seen,
+            seen,
+        )
+
+    def search(self, ip=None, port=None, host=None, domain=None, query=None, limit=ASSET_SEARCH_LIMIT):
+        """按条件查找资产，条件之间为“且”。
+
+        ip 以 . 或 * 结尾时按前缀匹配（如 10.0.），单独的 * 不按 IP 筛选；domain 同时匹配该域名及其子域名，
+        query 为来源查询语句的子串。返回 (匹配总数, [资产字典])，每个资产附带命中过它的查询。
+        """
+        where, params = [], []
+        if ip:
+            if ip.endswith(".") or ip.endswith("*"):
+                prefix = ip.rstrip("*")
+                if prefix:
+                    where.append("a.ip >= ? AND a.ip < ?")
+                    params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+            else:
+                where.append("a.ip = ?")
+                params.append(ip)
+        if port not in (None, ""):
+            where.append("a.port = ?")
+            params.append(int(port))
+        if host:
+            where.append("a.host = ?")
+            params.append(host)
+        if domain:
+            # 反转后的域名按前缀做范围查询，可以走索引：b.com -> moc.b 及 moc.b.*
+            reversed_domain = _reverse_domain(domain.strip(".").lower())
+            where.append("(a.rdomain = ? OR (a.rdomain >= ? AND a.rdomain < ?))")
+            params += [reversed_domain, reversed_domain + ".", reversed_domain + "/"]
+        if query:
+            where.append(
+                "a.id IN (SELECT asset_id FROM asset_queries WHERE query_id IN "
+                "(SELECT id FROM queries WHERE instr(query, ?) > 0))"
+            )
+            params.append(query)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self.read_lock:
+            total = self.read_conn.execute(f"SELECT COUNT(*) FROM assets a {clause}", params).fetchone()[0]
+            # 先在子查询中排序截断，再只为返回的行拼接来源查询
+            rows = self.read_conn.execute(
+                f"SELECT a.id, a.ip, a.port, a.host, a.domain, a.data, a.first_seen, a.last_seen, "
+                f"(SELECT group_concat(q.query, char(10)) FROM asset_queries aq JOIN queries q ON q.id = aq.query_id "
+                f"WHERE aq.asset_id = a.id) "
+                f"FROM assets a WHERE a.id IN (SELECT a.id FROM assets a {clause} ORDER BY a.last_seen DESC LIMIT ?) "
+                f"ORDER BY a.last_seen DESC",
+                params + [limit]
+            ).fetchall()
+        return total, [
+            {
+                'id': row[0],
+                'ip': row[1],
+                'port': row[2] or "",
+                'host': row[3],
+                'domain': row[4],
+                'data': json.loads(row[5]),
+                'first_seen': row[6],
+                'last_seen': row[7],
+                'queries': row[8].split("\n") if row[8] else [],
+            }
+            for row in rows
+        ]
+
+    def stats(self):
+        with self.read_lock:
+            assets, queries = self.read_conn.execute(
+                "SELECT (SELECT COUNT(*) FROM assets), (SELECT COUNT(*) FROM queries)"
+            ).fetchone()
+        return {
+            'assets': assets,
+            'queries': queries,
+            'pages_written': self.pages_written,
+            'rows_written': self.rows_written,
+            'pending_pages': self.queue.qsize(),
+        }
+
+    def close(self):
+        self.queue.put(None)
+        self._writer.join()
+        with self.lock:
+            self.conn.close()
+        with self.read_lock:
+            self.read_conn.close()
+
+_asset_db = None
+_asset_db_lock = threading.Lock()
+
+def get_asset_db() -> AssetDatabase | None:
+    global _asset_db
+    if _asset_db is None:
+        with _asset_db_lock:
+            if _asset_db is None:
+                try:
+                    _asset_db = AssetDatabase()
+                except sqlite3.Error as e:
+                    logger.error(f"初始化资产库失败: {e}")
+                    return None
+    return _asset_db
+
+def configure_asset_db(path: str = ASSET_DB_PATH) -> AssetDatabase:
+    global _asset_db
+    with _asset_db_lock:
+        old_db = _asset_db
+        _asset_db = AssetDatabase(path)
+    if old_db is not None:
+        old_db.close()
+    logger.info(f"资产库已重新配置: {path}")
+    return _asset_db
+
+# === 批量导出配置 ===
+BATCH_EXPORT_LIMIT = 200000   # 批量模式下单个查询允许导出的最大记录数
+BATCH_EXPORT_WORKERS = 3      # 同时处理的查询数
+BATCH_PAGE_WORKERS = 2        # 每个查询同时拉取的页数
+BATCH_PREVIEW_WORKERS = 4     # 批量预览时同时查询数据量的请求数
+
+# === 断点续传页面日志配置 ===
+JOURNAL_DIR = "fofa_journal"
+JOURNAL_MAX_AGE = 7 * 24 * 3600  # 超过该时长的日志视为过期，重新拉取
+
+_swept_journal_roots = set()
+_journal_sweep_lock = threading.Lock()
+
+def sweep_page_journals(root=JOURNAL_DIR, max_age=JOURNAL_MAX_AGE):
+    # 清理过期或损坏的页面日志，返回删除的目录数；被放弃的查询不会再被续传，只能靠这里回收
+    removed = 0
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return 0
+    now = time.time()
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            with open(os.path.join(entry.path, "meta.json"), "r", encoding="utf-8") as f:
+                created = json.load(f).get('created', 0)
+        except (OSError, ValueError, AttributeError):
+            # 没有可读的元数据时按目录修改时间判断
+            try:
+                created = entry.stat(follow_symlinks=False).st_mtime
+            except OSError:
+                continue
+        if now - created > max_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"已清理 {removed} 个过期的页面日志")
+    return removed
+
+def _sweep_journal_root_once(root):
+    # 每个日志目录在进程内首次打开时清理一次
+    with _journal_sweep_lock:
+        key = os.path.abspath(root)
+        if key in _swept_journal_roots:
+            return
+        _swept_journal_roots.add(key)
+    sweep_page_journals(root)
+
+class PageJournal:
+    """按 (查询, 字段, 每页数量) 把已完成的页面写入本地磁盘，中断后只补拉缺失页"""
+
+    def __init__(self, query, fields, page_size, root=JOURNAL_DIR):
+        self.query = query
+        self.fields = fields
+        self.page_size = page_size
+        _sweep_journal_root_once(root)
+        digest = hashlib.sha256(
+            json.dumps([query, fields, page_size], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:24]
+        self.path = os.path.join(root, digest)
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.meta = self._load_meta()
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if time.time() - meta.get('created', 0) <= JOURNAL_MAX_AGE:
+                    return meta
+                logger.info(f"页面日志已过期，重新开始: {self.query}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取页面日志失败，重新开始: {e}")
+            shutil.rmtree(self.path, ignore_errors=True)
+        return {
+            'query': self.query,
+            'fields': self.fields,
+            'page_size': self.page_size,
+            'total': None,
+            'fields_list': None,
+            'created': time.time(),
+        }
+
+    def _write_json(self, path, data):
+        # 先写临时文件再原子替换，进程中途退出也不会留下半截页面
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _page_path(self, page):
+        return os.path.join(self.path, f"page_{page:06d}.json")
+
+    @property
+    def total(self):
+        return self.meta.get('total')
+
+    @property
+    def fields_list(self):
+        return self.meta.get('fields_list')
+
+    @property
+    def total_pages(self):
+        if self.total is None:
+            return None
+        return (self.total + self.page_size - 1) // self.page_size
+
+    def set_totals(self, total, fields_list):
+        self.meta['total'] = total
+        self.meta['fields_list'] = fields_list
+        self._write_json(self.meta_path, self.meta)
+
+    def has_page(self, page):
+        return os.path.exists(self._page_path(page))
+
+    def load_page(self, page):
+        try:
+            with open(self._page_path(page), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取第 {page} 页日志失败，将重新拉取: {e}")
+            return None
+
+    def save_page(self, page, results):
+        self._write_json(self._page_path(page), results)
+
+    def missing_pages(self):
+        if self.total_pages is None:
+            return None
+        return [p for p in range(1, self.total_pages + 1) if not self.has_page(p)]
+
+    def is_complete(self):
+        return self.missing_pages() == []
+
+    def clear_if_complete(self):
+        # 所有页面都已拉取完成时删除日志，有失败页时保留以便下次补拉
+        if self.is_complete():
+            self.clear()
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+# === 超量查询自动分区配置 ===
+PARTITION_START_DATE = date(2010, 1, 1)  # 时间分区的起始日期
+PARTITION_WORKERS = 2                     # 同时拉取的分区数
+# 单日数据仍超过上限时，依次按这些维度的取值继续切分，最后一个分区为“其余取值”
+PARTITION_DIMENSIONS = [
+    ("country", ["CN", "US", "JP", "KR", "DE", "HK", "SG", "GB", "FR", "RU", "NL", "IN", "BR", "CA", "TW", "AU"]),
+    ("port", ["80", "443", "8080", "22", "21", "3389", "8443", "8000", "8888", "3306", "25", "110"]),
+]
+
+class QueryPartitioner:
+    """把超过全量上限的查询切分为互不重叠、各自不超过上限的子查询"""
+
+    def __init__(self, app, fields="host,ip,port", limit=FULL_FETCH_LIMIT):
+        self.app = app
+        self.fields = fields
+        self.limit = limit
+        self.probes = 0
+
+    def count(self, query):
+        self.probes += 1
+        result, error = self.app.fofa_search(query, self.fields, page=1, size=1)
+        if error:
+            return None, error
+        return result.get('size', 0), None
+
+    @staticmethod
+    def _date_query(query, start, end):
+        # after/before 均按不含边界处理：窗口 [start, end) 对应 after=start-1 天、before=end
+        after = (start - timedelta(days=1)).strftime("%Y-%m-%d")
+        before = end.strftime("%Y-%m-%d")
+        return f'({query}) && after="{after}" && before="{before}"'
+
+    def _split_by_dimension(self, query, dim_index, partitions):
+        if dim_index >= len(PARTITION_DIMENSIONS):
+            return f"无法继续切分的子查询仍超过 {self.limit} 条: {query}"
+        name, values = PARTITION_DIMENSIONS[dim_index]
+        sub_queries = [f'{query} && {name}="{value}"' for value in values]
+        sub_queries.append(query + "".join(f' && {name}!="{value}"' for value in values))
+        for sub_query in sub_queries:
+            total, error = self.count(sub_query)
+            if error:
+                return error
+            if total == 0:
+                continue
+            if total <= self.limit:
+                partitions.append((sub_query, total))
+                continue
+            error = self._split_by_dimension(sub_query, dim_index + 1, partitions)
+            if error:
+                return error
+        return None
+
+    def partition(self, query):
+        # 先按更新时间二分切分，单日仍超限再按国家、端口切分
+        partitions = []
+        windows = [(PARTITION_START_DATE, date.today() + timedelta(days=1))]
+        while windows:
+            start, end = windows.pop()
+            sub_query = self._date_query(query, start, end)
+            total, error = self.count(sub_query)
+            if error:
+                return None, error
+            if total == 0:
+                continue
+            if total <= self.limit:
+                partitions.append((sub_query, total))
+                continue
+            if (end - start).days > 1:
+                middle = start + (end - start) // 2
+                windows.append((middle, end))
+                windows.append((start, middle))
+                continue
+            error = self._split_by_dimension(sub_query, 0, partitions)
+            if error:
+                return None, error
+        logger.info(f"查询已切分为 {len(partitions)} 个分区，探测请求 {self.probes} 次: {query}")
+        return partitions, None
+
+# === 保存的查询与增量同步配置 ===
+SAVED_QUERIES_PATH = "saved_queries.json"
+SNAPSHOT_DIR = "fofa_snapshots"
+SNAPSHOT_KEY_FIELDS = ("ip", "port", "host")   # 快照中判断同一资产的字段
+SYNC_OVERLAP_DAYS = 1                          # after= 只到天，多回退一天避免漏掉同步当天后半段的更新
+
+class SavedQueryStore:
+    """保存的监控查询：记录上次同步时间，快照以 CSV 存放在本地，增量结果按资产键合并进快照"""
+
+    def __init__(self, path=SAVED_QUERIES_PATH, snapshot_dir=SNAPSHOT_DIR):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取保存的查询失败: {e}")
+            return {}
+
+    def _save(self, data):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def entries(self):
+        with self._lock:
+            return sorted(self._load().values(), key=lambda item: item['name'])
+
+    def get(self, name):
+        with self._lock:
+            return self._load().get(name)
+
+    def save(self, name, query, fields):
+        # 查询语句或字段变化后旧快照不再适用，清空同步记录
+        with self._lock:
+            data = self._load()
+            old = data.get(name)
+            entry = {
+                'name': name,
+                'query': query,
+                'fields': fields,
+                'created': old['created'] if old else time.time(),
+                'last_sync': None,
+                'record_count': 0,
+            }
+            if old and old['query'] == query and old['fields'] == fields:
+                entry.update({k: old[k] for k in ('last_sync', 'record_count', 'last_new', 'last_updated', 'last_fetched')
+                              if k in old})
+            elif os.path.exists(self.snapshot_path(name)):
+                os.remove(self.snapshot_path(name))
+            data[name] = entry
+            self._save(data)
+            return entry
+
+    def update(self, name, **values):
+        with self._lock:
+            data = self._load()
+            if name in data:
+                data[name].update(values)
+                self._save(data)
+
+    def remove(self, name):
+        with self._lock:
+            data = self._load()
+            data.pop(name, None)
+            self._save(data)
+        if os.path.exists(self.snapshot_path(name)):
+            os.remove(self.snapshot_path(name))
+
+    def snapshot_path(self, name):
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.snapshot_dir, f"{digest}.csv")
+
+    def merge_snapshot(self, name, fields_list, rows, key_fields=SNAPSHOT_KEY_FIELDS):
+        # 增量结果覆盖快照中同一资产的旧记录；rows 可以是逐页产出的迭代器，拉取到的行直接写入新快照，
+        # 内存中只保留每个资产键 8 字节的摘要，随后逐行流式读取旧快照，跳过已被覆盖的资产。
+        # 旧快照表头与当前字段不一致时按字段名重排各列，缺少的字段留空
+        # 返回 (新增数, 更新数, 快照总数)
+        path = self.snapshot_path(name)
+        fields_list = list(fields_list)
+        positions = dedup_key_positions(fields_list, key_fields)
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fetched = RowKeySet()
+        updated = 0
+        try:
+            with open(tmp_path, "w", newline="", encoding="utf-8") as out:
+                writer = csv.writer(out)
+                writer.writerow(fields_list)
+                for row in rows:
+                    values = _stringify_row(row)
+                    if fetched.add(row_key_digest(values, positions))[1]:
+                        writer.writerow(values)
+                total = fetched.count
+                if os.path.exists(path):
+                    with open(path, "r", newline="", encoding="utf-8") as old:
+                        reader = csv.reader(old)
+                        header = next(reader, None) or fields_list
+                        remap = None
+                        if header != fields_list:
+                            logger.info(f"快照表头与当前字段不一致，按字段名重排: {header} -> {fields_list}")
+                            old_positions = {field: i for i, field in enumerate(header)}
+                            remap = [old_positions.get(field) for field in fields_list]
+                        for values in reader:
+                            if remap is not None:
+                                values = ["" if i is None or i >= len(values) else values[i] for i in remap]
+                            if row_key_digest(values, positions) in fetched:
+                                updated += 1
+                            else:
+                                writer.writerow(values)
+                                total += 1
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return fetched.count - updated, updated, total
+
+saved_query_store = SavedQueryStore()
+
+# === 列式结果存储配置 ===
+INT_COLUMN_FIELDS = {"port", "asn"}                 # 以 64 位整数数组存储的字段
+FLOAT_COLUMN_FIELDS = {"longitude", "latitude"}     # 以双精度数组存储的字段
+
+class _DictColumn:
+    # 字典编码列：重复字符串只存一份，每行只占 4 字节编号
+    __slots__ = ("values", "lookup", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+        self.codes = array('I')
+
+    def append(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+        self.codes.append(code)
+
+    def __getitem__(self, index):
+        return self.values[self.codes[index]]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + sum(len(v) for v in self.values)
+
+class _IntColumn:
+    # 整数列：无法无损还原成原字符串的取值会触发 ValueError，由调用方改用字典编码
+    __slots__ = ("data",)
+    MISSING = -(2 ** 63)
+
+    def __init__(self):
+        self.data = array('q')
+
+    def append(self, value):
+        if value == "":
+            self.data.append(self.MISSING)
+            return
+        number = int(value)
+        if str(number) != value or number == self.MISSING:
+            raise ValueError(value)
+        self.data.append(number)
+
+    def __getitem__(self, index):
+        number = self.data[index]
+        return "" if number == self.MISSING else str(number)
+
+    def __len__(self):
+        return len(self.data)
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data)
+
+class _FloatColumn:
+    # 浮点列：缺失值在数组中存为 NaN 以便排序，另记在位图中，真实的 "nan" 取值仍能原样还原
+    __slots__ = ("data", "missing")
+
+    def __init__(self):
+        self.data = array('d')
+        self.missing = bytearray()
+
+    def append(self, value):
+        index = len(self.data)
+        if index % 8 == 0:
+            self.missing.append(0)
+        if value == "":
+            self.missing[index >> 3] |= 1 << (index & 7)
+            self.data.append(math.nan)
+            return
+        number = float(value)
+        if repr(number) != value:
+            raise ValueError(value)
+        self.data.append(number)
+
+    def is_missing(self, index):
+        return bool(self.missing[index >> 3] & (1 << (index & 7)))
+
+    def __getitem__(self, index):
+        if self.is_missing(index):
+            return ""
+        return repr(self.data[index])
+
+    def __len__(self):
+        return len(self.data)
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + len(self.missing)
+
+class ResultStore:
+    """列式结果容器：字符串字典编码，端口与经纬度存为定长数组，按行读取时与原始列表一致"""
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.columns = [self._new_column(name) for name in self.fields]
+        self.length = 0
+
+    @staticmethod
+    def _new_column(name):
+        if name in INT_COLUMN_FIELDS:
+            return _IntColumn()
+        if name in FLOAT_COLUMN_FIELDS:
+            return _FloatColumn()
+        return _DictColumn()
+
+    def _demote(self, position):
+        # 数值列遇到无法无损存储的取值时，整列改为字典编码
+        old = self.columns[position]
+        column = _DictColumn()
+        for i in range(len(old)):
+            column.append(old[i])
+        self.columns[position] = column
+        return column
+
+    def append(self, row):
+        if isinstance(row, str):
+            # 只查询一个字段时 FOFA 直接返回字符串而不是列表
+            row = [row]
+        for position, column in enumerate(self.columns):
+            value = row[position] if position < len(row) else None
+            value = "" if value is None else str(value)
+            try:
+                column.append(value)
+            except ValueError:
+                self._demote(position).append(value)
+        self.length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self.length
+
+    def row(self, index):
+        return [column[index] for column in self.columns]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.row(index)
+
+    def __iter__(self):
+        columns = self.columns
+        for i in range(self.length):
+            yield [column[i] for column in columns]
+
+    def column(self, name, start=0, stop=None):
+        column = self.columns[self.fields.index(name)]
+        return [column[i] for i in range(*slice(start, stop).indices(self.length))]
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns)
+
+RESULTS_PAGE_SIZE = 50                    # 结果浏览器每页显示的行数
+RESULTS_PAGE_SIZES = [20, 50, 100, 200]
+
+class ResultPager:
+    """结果集的服务端分页：界面只构建并发送当前页的行，翻页时替换这些行"""
+
+    def __init__(self, store, page_size=RESULTS_PAGE_SIZE, rows=None):
+        self.store = store
+        self.page_size = page_size
+        self.rows = rows    # 行号序列（筛选或排序后的视图），None 表示按原顺序显示全部
+        self.page = 0
+
+    def __len__(self):
+        return len(self.store) if self.rows is None else len(self.rows)
+
+    @property
+    def page_count(self):
+        return max(1, math.ceil(len(self) / self.page_size))
+
+    def set_page(self, page):
+        self.page = min(max(page, 0), self.page_count - 1)
+
+    def set_page_size(self, page_size):
+        # 保持当前页第一行仍然可见
+        first = self.page * self.page_size
+        self.page_size = page_size
+        self.set_page(first // page_size)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.page = 0
+
+    def window(self):
+        # 返回当前页的 [(行号, 行数据)]
+        start = self.page * self.page_size
+        stop = min(start + self.page_size, len(self))
+        if self.rows is None:
+            return list(zip(range(start, stop), self.store[start:stop]))
+        return [(index, self.store[index]) for index in self.rows[start:stop]]
+
+# 关键词检索时建立倒排索引的文本字段（cert.* 前缀的证书字段同样建立）
+TEXT_INDEX_FIELDS = {"title", "server", "org", "product", "os", "domain", "icp", "banner", "header", "jarm"}
+_TOKEN_RE = re.compile(r'\w+')
+_FILTER_TERM_RE = re.compile(r'^([\w.]+)(>=|<=|>|<|=|:)(.*)$')
+
+def _tokenize(value):
+    return _TOKEN_RE.findall(value.lower())
+
+def _number_or_none(value):
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return None if math.isnan(number) else number
+
+class ResultIndex:
+    """ResultStore 上的会话内查询层：筛选和排序不再调用 API，也不需要先导出。
+
+    文本字段按单词建倒排索引（单词 -> 取值编号），关键词按单词前缀匹配；子串和等值匹配
+    只扫描字典编码列的不重复取值；数值列建排序索引，范围查询用二分查找。索引在首次使用时构建。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._length = None
+        self._code_rows = {}
+        self._tokens = {}
+        self._orders = {}
+
+    def _column(self, field):
+        if field not in self.store.fields:
+            raise ValueError(f"结果中没有字段: {field}")
+        position = self.store.fields.index(field)
+        if self._length != len(self.store):
+            # 结果集有新增行时丢弃已建好的索引
+            self._length = len(self.store)
+            self._code_rows.clear()
+            self._tokens.clear()
+            self._orders.clear()
+        return self.store.columns[position]
+
+    def _rows_for_codes(self, field, column, codes):
+        # 字典编码列：每个取值编号对应的行号列表只构建一次
+        code_rows = self._code_rows.get(field)
+        if code_rows is None:
+            code_rows = [array('I') for _ in column.values]
+            for row, code in enumerate(column.codes):
+                code_rows[code].append(row)
+            self._code_rows[field] = code_rows
+        rows = set()
+        for code in codes:
+            rows.update(code_rows[code])
+        return rows
+
+    def _scan_rows(self, column, predicate):
+        return {row for row in range(len(column)) if predicate(column[row])}
+
+    def text_fields(self):
+        return [f for f in self.store.fields if f in TEXT_INDEX_FIELDS or f.startswith("cert")]
+
+    def match_word(self, word):
+        # 在所有文本字段中按单词前缀匹配，例如 admin 可以匹配 "Administrator Login"
+        fields = [f for f in self.text_fields() if isinstance(self._column(f), _DictColumn)]
+        if not fields:
+            return self.contains(None, word)
+        prefix = word.lower()
+        rows = set()
+        for field in fields:
+            column = self._column(field)
+            tokens = self._tokens.get(field)
+            if tokens is None:
+                postings = {}
+                for code, value in enumerate(column.values):
+                    for token in set(_tokenize(value)):
+                        postings.setdefault(token, array('I')).append(code)
+                tokens = (sorted(postings), postings)
+                self._tokens[field] = tokens
+            keys, postings = tokens
+            codes = []
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and keys[position].startswith(prefix):
+                codes.extend(postings[keys[position]])
+                position += 1
+            rows |= self._rows_for_codes(field, column, codes)
+        return rows
+
+    def contains(self, field, needle):
+        # 不区分大小写的子串匹配；field 为 None 时匹配任意字段
+        needle = needle.lower()
+        rows = set()
+        for name in ([field] if field else self.store.fields):
+            column = self._column(name)
+            if isinstance(column, _DictColumn):
+                codes = [code for code, value in enumerate(column.values) if needle in value.lower()]
+                rows |= self._rows_for_codes(name, column, codes)
+            else:
+                rows |= self._scan_rows(column, lambda value: needle in value)
+        return rows
+
+    def equals(self, field, value):
+        column = self._column(field)
+        if isinstance(column, _DictColumn):
+            code = column.lookup.get(value)
+            return self._rows_for_codes(field, column, [] if code is None else [code])
+        return self._scan_rows(column, lambda item: item == value)
+
+    def _sorted(self, field):
+        # 返回 (按值升序的行号, 对应的排序键, 可比较数值在 order 中的起止位置)；空值排在最前。
+        # 先经过 _column 检查结果集是否有新增行，再使用缓存的排序
+        column = self._column(field)
+        cached = self._orders.get(field)
+        if cached is not None:
+            return cached
+        if isinstance(column, _IntColumn):
+            data = column.data
+            order = array('I', sorted(range(len(data)), key=data.__getitem__))
+            keys = array('q', (data[row] for row in order))
+            cached = (order, keys, bisect.bisect_right(keys, column.MISSING), len(keys))
+        elif isinstance(column, _FloatColumn):
+            # 真实的 NaN 无法与数字比较，单独排在所有数字之后，不参与范围查询
+            data = column.data
+
+            def rank(row):
+                value = data[row]
+                if math.isnan(value):
+                    return (0, 0.0) if column.is_missing(row) else (2, 0.0)
+                return (1, value)
+            order = array('I', sorted(range(len(data)), key=rank))
+            missing = sum(1 for row in range(len(data)) if column.is_missing(row))
+            nans = sum(1 for value in data if math.isnan(value)) - missing
+            cached = (order, array('d', (data[row] for row in order)), missing, len(order) - nans)
+        else:
+            # 字典编码列先对不重复取值排序，全部是数字时按数值排序，否则按字符串（适用于日期时间）
+            numbers = [_number_or_none(value) for value in column.values]
+            numeric = all(number is not None or value == "" for number, value in zip(numbers, column.values))
+            if numeric:
+                value_key = lambda code: -math.inf if numbers[code] is None else numbers[code]
+            else:
+                value_key = lambda code: column.values[code]
+            ranked = sorted(range(len(column.values)), key=value_key)
+            rank = array('I', bytes(4 * len(ranked)))
+            for position, code in enumerate(ranked):
+                rank[code] = position
+            codes = column.codes
+            order = array('I', sorted(range(len(codes)), key=lambda row: rank[codes[row]]))
+            cached = (order, None, None, None)
+        self._orders[field] = cached
+        return cached
+
+    def in_range(self, field, low=None, high=None, include_low=True, include_high=True):
+        column = self._column(field)
+        if isinstance(column, _DictColumn):
+            # 边界是数字时按数值比较，否则按字符串比较（例如 lastupdatetime>=2024-01-01）
+            bounds = [bound for bound in (low, high) if bound is not None]
+            numeric = all(_number_or_none(bound) is not None for bound in bounds)
+            def convert(value):
+                return _number_or_none(value) if numeric else value
+            low_key = convert(low) if low is not None else None
+            high_key = convert(high) if high is not None else None
+            codes = []
+            for code, value in enumerate(column.values):
+                key = convert(value)
+                if key is None or value == "":
+                    continue
+                if low_key is not None and (key < low_key or (key == low_key and not include_low)):
+                    continue
+                if high_key is not None and (key > high_key or (key == high_key and not include_high)):
+                    continue
+                codes.append(code)
+            return self._rows_for_codes(field, column, codes)
+        order, keys, lo, hi = self._sorted(field)
+        start, stop = lo, hi
+        try:
+            low = None if low is None else float(low)
+            high = None if high is None else float(high)
+        except ValueError:
+            raise ValueError(f"字段 {field} 只能按数字范围筛选")
+        if low is not None:
+            start = (bisect.bisect_left if include_low else bisect.bisect_right)(keys, low, lo, hi)
+        if high is not None:
+            stop = (bisect.bisect_right if include_high else bisect.bisect_left)(keys, high, lo, hi)
+        return set(order[start:stop])
+
+    def search(self, text="", sort_field=None, descending=False):
+        """按筛选表达式返回行号列表，各条件之间为“且”的关系；没有条件且不排序时返回 None。
+
+        表达式：关键词（文本字段单词前缀）、字段:子串、字段=值、字段>=值 / > / <= / <
+        """
+        rows = None
+        for term in text.split():
+            match = _FILTER_TERM_RE.match(term)
+            # 前缀不是结果中的字段时（例如 http://）整体按关键词处理
+            if match and match.group(3) and match.group(1) in self.store.fields:
+                field, operator, value = match.groups()
+                if operator == ":":
+                    matched = self.contains(field, value)
+                elif operator == "=":
+                    matched = self.equals(field, value)
+                elif operator.startswith(">"):
+                    matched = self.in_range(field, low=value, include_low=operator == ">=")
+                else:
+                    matched = self.in_range(field, high=value, include_high=operator == "<=")
+            else:
+                matched = self.match_word(term)
+            rows = matched if rows is None else rows & matched
+            if not rows:
+                return []
+
+        if sort_field:
+            order = self._sorted(sort_field)[0]
+            if descending:
+                order = reversed(order)
+            if rows is None:
+                return list(order)
+            return [row for row in order if row in rows]
+        if rows is None:
+            return None
+        return sorted(rows)
+
+# === 导出格式配置 ===
+EXPORT_FORMAT_CSV = "csv"
+EXPORT_FORMAT_PARQUET = "parquet"
+EXPORT_FORMAT_ARROW = "arrow"
+EXPORT_FORMAT_CSV_GZIP = "csv.gz"
+EXPORT_FORMAT_CSV_ZSTD = "csv.zst"
+EXPORT_FORMAT_NDJSON = "ndjson"
+EXPORT_FORMAT_NDJSON_GZIP = "ndjson.gz"
+EXPORT_FORMAT_NDJSON_ZSTD = "ndjson.zst"
+EXPORT_WRITE_BUFFER = 1024 * 1024   # 文本导出的写缓冲大小，减少系统调用次数
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COLUMNAR_ROW_GROUP_SIZE = 50000     # 列式导出每个行组（批次）的行数
+COLUMNAR_COMPRESSION = "zstd"
+
+def _stringify_row(row):
+    if isinstance(row, str):
+        # 只查询一个字段时 FOFA 直接返回字符串而不是列表
+        return [row]
+    return [str(item) if item is not None else "" for item in row]
+
+def _open_export_stream(path, compression=None):
+    # 返回 (可写入字节的流, 需要按顺序关闭的对象列表)；压缩在写入时实时完成
+    # path 也可以是已打开的可写流（如 ZIP 条目），关闭写入器时一并关闭
+    raw = path if hasattr(path, 'write') else open(path, 'wb', buffering=EXPORT_WRITE_BUFFER)
+    if compression is None:
+        return raw, [raw]
+    if compression == "gzip":
+        stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL)
+        return stream, [stream, raw]
+    if compression == "zstd":
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+        return stream, [stream, raw]
+    raw.close()
+    raise ValueError(f"不支持的压缩方式: {compression}")
+
+class TextResultWriter(ABC):
+    # 文本导出基类：每批行先在内存中格式化，再一次性写入（可压缩的）输出流
+    # query 为 None 时不附加 fofa_query 列（例如合并导出自带来源列）
+    extension = ""
+    compression = None
+
+    def __init__(self, path, fields, query):
+        self.fields = list(fields)
+        self.query = query
+        self.stream, self._closers = _open_export_stream(path, self.compression)
+        header = self.format_header()
+        if header:
+            self.stream.write(header.encode('utf-8'))
+
+    def format_header(self):
+        return ""
+
+    @abstractmethod
+    def format_rows(self, rows):
+        # 由子类把一批行格式化为输出文本
+        ...
+
+    def write_rows(self, rows):
+        if rows:
+            self.stream.write(self.format_rows(rows).encode('utf-8'))
+
+    def close(self):
+        for closer in self._closers:
+            closer.close()
+
+class CsvResultWriter(TextResultWriter):
+    extension = ".csv"
+
+    def format_header(self):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(self.fields + ['fofa_query'] if self.query is not None else self.fields)
+        return buffer.getvalue()
+
+    def format_rows(self, rows):
+        query = self.query
+        buffer = io.StringIO()
+        if query is None:
+            csv.writer(buffer).writerows(_stringify_row(row) for row in rows)
+        else:
+            csv.writer(buffer).writerows(_stringify_row(row) + [query] for row in rows)
+        return buffer.getvalue()
+
+class GzipCsvResultWriter(CsvResultWriter):
+    extension = ".csv.gz"
+    compression = "gzip"
+
+class ZstdCsvResultWriter(CsvResultWriter):
+    extension = ".csv.zst"
+    compression = "zstd"
+
+class NdjsonResultWriter(TextResultWriter):
+    # 每行一个 JSON 对象，字段名为键，附带 fofa_query 与 CSV 导出保持一致
+    extension = ".ndjson"
+
+    def format_rows(self, rows):
+        fields = self.fields
+        query = self.query
+        lines = []
+        for row in rows:
+            record = dict(zip(fields, _stringify_row(row)))
+            if query is not None:
+                record['fofa_query'] = query
+            lines.append(json.dumps(record, ensure_ascii=False))
+        lines.append("")
+        return "\n".join(lines)
+
+class GzipNdjsonResultWriter(NdjsonResultWriter):
+    extension = ".ndjson.gz"
+    compression = "gzip"
+
+class ZstdNdjsonResultWriter(NdjsonResultWriter):
+    extension = ".ndjson.zst"
+    compression = "zstd"
+
+class ColumnarResultWriter:
+    """Parquet / Arrow IPC 导出：按行组流式写入，查询语句作为文件元数据只存一份"""
+
+    def __init__(self, path, fields, query, export_format=EXPORT_FORMAT_PARQUET, row_group_size=COLUMNAR_ROW_GROUP_SIZE):
+        if pa is None:
+            raise RuntimeError("列式导出需要安装 pyarrow")
+        self.fields = list(fields)
+        self.row_group_size = row_group_size
+        metadata = {b"exported_at": datetime.now().isoformat(timespec="seconds").encode('utf-8')}
+        if query is not None:
+            metadata[b"fofa_query"] = query.encode('utf-8')
+        self.schema = pa.schema([pa.field(name, pa.string()) for name in self.fields], metadata=metadata)
+        if export_format == EXPORT_FORMAT_PARQUET:
+            self.writer = pq.ParquetWriter(path, self.schema, compression=COLUMNAR_COMPRESSION)
+            self._write_batch = lambda batch: self.writer.write_batch(batch, row_group_size=self.row_group_size)
+        else:
+            self.writer = pa.ipc.new_file(
+                path, self.schema, options=pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)
+            )
+            self._write_batch = self.writer.write_batch
+        self.buffer = [[] for _ in self.fields]
+        self.buffered = 0
+        # pyarrow 不会关闭调用方传入的流，由写入器负责关闭
+        self._owned_stream = path if hasattr(path, 'write') else None
+
+    def write_rows(self, rows):
+        width = len(self.fields)
+        for row in rows:
+            values = _stringify_row(row)
+            for position in range(width):
+                self.buffer[position].append(values[position] if position < len(values) else "")
+            self.buffered += 1
+            if self.buffered >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        if not self.buffered:
+            return
+        batch = pa.record_batch([pa.array(column, pa.string()) for column in self.buffer], schema=self.schema)
+        self._write_batch(batch)
+        self.buffer = [[] for _ in self.fields]
+        self.buffered = 0
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        if self._owned_stream is not None:
+            self._owned_stream.close()
+
+class ParquetResultWriter(ColumnarResultWriter):
+    extension = ".parquet"
+
+    def __init__(self, path, fields, query):
+        super().__init__(path, fields, query, EXPORT_FORMAT_PARQUET)
+
+class ArrowResultWriter(ColumnarResultWriter):
+    extension = ".arrow"
+
+    def __init__(self, path, fields, query):
+        super().__init__(path, fields, query, EXPORT_FORMAT_ARROW)
+
+EXPORT_WRITERS = {
+    EXPORT_FORMAT_CSV: CsvResultWriter,
+    EXPORT_FORMAT_CSV_GZIP: GzipCsvResultWriter,
+    EXPORT_FORMAT_CSV_ZSTD: ZstdCsvResultWriter,
+    EXPORT_FORMAT_NDJSON: NdjsonResultWriter,
+    EXPORT_FORMAT_NDJSON_GZIP: GzipNdjsonResultWriter,
+    EXPORT_FORMAT_NDJSON_ZSTD: ZstdNdjsonResultWriter,
+    EXPORT_FORMAT_PARQUET: ParquetResultWriter,
+    EXPORT_FORMAT_ARROW: ArrowResultWriter,
+}
+
+def get_result_writer(export_format=EXPORT_FORMAT_CSV):
+    writer_class = EXPORT_WRITERS.get(export_format)
+    if writer_class is None:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+    if issubclass(writer_class, ColumnarResultWriter) and pa is None:
+        raise RuntimeError("列式导出需要安装 pyarrow")
+    if getattr(writer_class, "compression", None) == "zstd" and zstandard is None:
+        raise RuntimeError("zstd 压缩导出需要安装 zstandard")
+    return writer_class
+
+# 已经压缩过的导出文件放入 ZIP 时不再重复压缩
+PRECOMPRESSED_EXTENSIONS = {".parquet", ".arrow", ".gz", ".zst"}
+
+# === 批量导出 ZIP 配置 ===
+ZIP_BATCH_COMPRESSION = "deflate"          # "stored" 不压缩，"deflate" 按 ZIP_DEFLATE_LEVEL 压缩
+ZIP_DEFLATE_LEVEL = 6                      # 1 最快，9 压缩率最高
+ZIP_SPOOL_MAX_MEMORY = 16 * 1024 * 1024    # 等待写入 ZIP 的条目在内存中缓冲的上限，超出后转存临时文件
+
+class ZipEntryStream:
+    """ZIP 中单个条目的可写流：拿到写入权时直接写入 ZIP，否则先缓冲，ZIP 空闲后再拷入。
+
+    导出中途失败时调用 abort() 丢弃该条目，归档中不会留下不完整的文件。
+    """
+
+    def __init__(self, sink, arcname):
+        self.sink = sink
+        self.arcname = arcname
+        self.closed = False
+        self.aborted = False
+        self._written = 0
+        self._spool = None
+        if sink._writing.acquire(blocking=False):
+            try:
+                self._target = sink._open_entry_locked(arcname)
+            except Exception:
+                sink._release()
+                raise
+        else:
+            self._spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_MEMORY)
+            self._target = self._spool
+        sink._track(self)
+
+    def _promote(self):
+        # 已持有写入权：先写入等待中的条目，再把已缓冲的内容拷入 ZIP，之后直接写入
+        self.sink._flush_pending_locked()
+        target = self.sink._open_entry_locked(self.arcname)
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, target, EXPORT_WRITE_BUFFER)
+        self._spool.close()
+        self._spool = None
+        self._target = target
+
+    def write(self, data):
+        if self.aborted:
+            # 丢弃后写入器关闭时仍可能写出压缩尾部，直接忽略
+            return len(data)
+        if self._spool is not None and self.sink._writing.acquire(blocking=False):
+            try:
+                self._promote()
+            except Exception:
+                self.sink._release()
+                raise
+        self._target.write(data)
+        self._written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.sink._untrack(self)
+        if self._spool is None:
+            try:
+                self._target.close()
+            finally:
+                self.sink._release()
+        else:
+            self.sink._submit(self.arcname, self._spool)
+
+    def abort(self):
+        # 缓冲中的内容直接丢弃；已直接写入 ZIP 的条目是归档中的最后一个条目，从文件末尾截掉
+        if self.closed:
+            return
+        self.closed = True
+        self.aborted = True
+        self.sink._untrack(self)
+        if self._spool is None:
+            try:
+                self.sink._discard_entry_locked(self._target)
+            finally:
+                self.sink._release()
+        else:
+            self._spool.close()
+        logger.info(f"已丢弃不完整的 ZIP 条目: {self.arcname}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ZipBatchSink:
+    """批量导出直接写入同一个 ZIP：每个查询一个条目，边拉取边压缩，不再生成中间文件再二次打包。
+
+    ZipFile 同一时间只允许一个条目处于写入状态。拿到写入权的查询直接写入 ZIP，
+    其余并行的查询先写入 SpooledTemporaryFile，ZIP 空闲后转为直接写入或在完成时整体拷入。
+    """
+
+    def __init__(self, path, compression=ZIP_BATCH_COMPRESSION, level=ZIP_DEFLATE_LEVEL):
+        if compression == "stored":
+            self.compress_type, self.compresslevel = zipfile.ZIP_STORED, None
+        elif compression == "deflate":
+            self.compress_type, self.compresslevel = zipfile.ZIP_DEFLATED, level
+        else:
+            raise ValueError(f"不支持的 ZIP 压缩方式: {compression}")
+        self.path = path
+        self.zf = zipfile.ZipFile(path, 'w', self.compress_type, compresslevel=self.compresslevel)
+        self._writing = threading.Lock()   # 写入权：持有者可以直接向 ZIP 写入条目
+        self._lock = threading.Lock()      # 保护等待队列和条目名集合
+        self._pending = deque()
+        self._names = set()
+        self._open_entries = set()
+        self.entry_count = 0
+
+    def reserve_name(self, query, prefix="fofa_search", ext=".csv"):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        query_hash = hash(query)
+        with self._lock:
+            suffix = 0
+            while True:
+                name = f"{prefix}_{timestamp}_{query_hash}{f'_{suffix}' if suffix else ''}{ext}"
+                if name not in self._names:
+                    self._names.add(name)
+                    return name
+                suffix += 1
+
+    def open_entry(self, arcname):
+        return ZipEntryStream(self, arcname)
+
+    def _track(self, entry):
+        with self._lock:
+            self._open_entries.add(entry)
+
+    def _untrack(self, entry):
+        with self._lock:
+            self._open_entries.discard(entry)
+
+    def _discard_entry_locked(self, target):
+        # 关闭后该条目位于归档末尾（持有写入权期间没有其他条目写入），截断文件并从目录中移除
+        zinfo = target._zinfo
+        target.close()
+        self.zf.filelist.remove(zinfo)
+        self.zf.NameToInfo.pop(zinfo.filename, None)
+        self.zf.fp.seek(zinfo.header_offset)
+        self.zf.fp.truncate()
+        self.zf.start_dir = zinfo.header_offset
+        self.entry_count -= 1
+
+    def _open_entry_locked(self, arcname):
+        zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        if os.path.splitext(arcname)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+            # 已经压缩过的格式直接存储
+            zinfo.compress_type = zipfile.ZIP_STORED
+        else:
+            zinfo.compress_type = self.compress_type
+            zinfo._compresslevel = self.compresslevel  # 与 ZipFile.open(name, 'w') 内部的做法一致
+        zinfo.external_attr = 0o644 << 16
+        self.entry_count += 1
+        # 条目大小事先未知，统一启用 ZIP64 以免超过 4GB 时出错
+        return self.zf.open(zinfo, 'w', force_zip64=True)
+
+    def _flush_pending_locked(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                arcname, spool = self._pending.popleft()
+            try:
+                spool.seek(0)
+                with self._open_entry_locked(arcname) as target:
+                    shutil.copyfileobj(spool, target, EXPORT_WRITE_BUFFER)
+            finally:
+                spool.close()
+
+    def _drain(self):
+        # 释放写入权与入队之间存在竞争，循环检查直到队列为空或写入权被其他线程拿走
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+            if not self._writing.acquire(blocking=False):
+                return
+            try:
+                self._flush_pending_locked()
+            finally:
+                self._writing.release()
+
+    def _release(self):
+        self._writing.release()
+        self._drain()
+
+    def _submit(self, arcname, spool):
+        with self._lock:
+            self._pending.append((arcname, spool))
+        self._drain()
+
+    def close(self):
+        # 异常路径上没有关闭的条目会一直持有写入权，先丢弃它们，否则这里会永远等待
+        with self._lock:
+            orphaned = list(self._open_entries)
+        for entry in orphaned:
+            logger.warning(f"ZIP 条目未正常关闭，已丢弃: {entry.arcname}")
+            entry.abort()
+        with self._writing:
+            self._flush_pending_locked()
+            self.zf.close()
+        logger.info(f"ZIP 写入完成: {self.path}, 条目数: {self.entry_count}, 大小: {os.path.getsize(self.path)} 字节")
+
+# === 批量合并去重配置 ===
+DEDUP_KEY_FIELDS = ("ip", "port", "host")   # 判断重复资产的字段，结果中都不存在时按整行去重
+DEDUP_INITIAL_CAPACITY = 1 << 16
+
+class RowKeySet:
+    """开放寻址哈希表：只保存每个键的 8 字节摘要和资产编号，百万级资产约占 30MB"""
+
+    EMPTY = 0
+
+    def __init__(self, capacity=DEDUP_INITIAL_CAPACITY):
+        self._allocate(capacity)
+        self.count = 0
+
+    def _allocate(self, capacity):
+        self.slots = array('Q', bytes(8 * capacity))
+        self.ids = array('I', bytes(4 * capacity))
+        self.mask = capacity - 1
+
+    def _grow(self):
+        slots, ids = self.slots, self.ids
+        self._allocate(len(slots) * 2)
+        for digest, asset in zip(slots, ids):
+            if digest != self.EMPTY:
+                self._insert(digest, asset)
+
+    def _insert(self, digest, asset):
+        position = digest & self.mask
+        while self.slots[position] != self.EMPTY:
+            position = (position + 1) & self.mask
+        self.slots[position] = digest
+        self.ids[position] = asset
+
+    def add(self, digest):
+        # 返回 (资产编号, 是否新资产)；摘要 0 保留给空槽位
+        digest = digest or 1
+        slots = self.slots
+        position = digest & self.mask
+        while True:
+            current = slots[position]
+            if current == digest:
+                return self.ids[position], False
+            if current == self.EMPTY:
+                break
+            position = (position + 1) & self.mask
+        asset = self.count
+        slots[position] = digest
+        self.ids[position] = asset
+        self.count += 1
+        if self.count * 10 > len(slots) * 7:
+            self._grow()
+        return asset, True
+
+    def __contains__(self, digest):
+        digest = digest or 1
+        slots = self.slots
+        position = digest & self.mask
+        while True:
+            current = slots[position]
+            if current == digest:
+                return True
+            if current == self.EMPTY:
+                return False
+            position = (position + 1) & self.mask
+
+    def nbytes(self):
+        return len(self.slots) * 8 + len(self.ids) * 4
+
+def dedup_key_positions(fields_list, key_fields=DEDUP_KEY_FIELDS):
+    # 键字段在结果行中的位置，结果中都不存在时按整行去重
+    positions = [fields_list.index(name) for name in key_fields if name in fields_list]
+    return positions or list(range(len(fields_list)))
+
+def row_key_digest(values, positions):
+    # 资产键的 8 字节摘要，作为 RowKeySet 的键；values 为 _stringify_row 转换后的行
+    key = "\x1f".join(values[p] if p < len(values) else "" for p in positions)
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class BatchMerger:
+    """跨查询合并去重：各查询的行在拉取时按键字段去重，只有首次出现的资产写入临时文件，
+    并记录每个资产被哪些查询命中；全部完成后顺序读出临时文件，附上来源写成一个合并文件。
+    """
+
+    def __init__(self, queries, key_fields=DEDUP_KEY_FIELDS):
+        self.queries = list(queries)
+        self.key_fields = list(key_fields)
+        self.fields = None
+        self.key_positions = None
+        self.keys = RowKeySet()
+        self.matches = array('Q')   # 每个资产一个位图，记录前 64 个查询的命中情况
+        self.extra_matches = {}     # 第 64 个之后的查询命中记录 {资产编号: {查询序号}}
+        self.total_rows = 0
+        self._spool = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+        self._spool_writer = csv.writer(self._spool)
+        self._lock = threading.Lock()
+
+    def _set_fields(self, fields_list):
+        self.fields = list(fields_list)
+        self.key_positions = dedup_key_positions(self.fields, self.key_fields)
+
+    def add_rows(self, query_index, fields_list, rows):
+        with self._lock:
+            if self.fields is None:
+                self._set_fields(fields_list)
+            key_positions = self.key_positions
+            for row in rows:
+                values = _stringify_row(row)
+                asset, is_new = self.keys.add(row_key_digest(values, key_positions))
+                if is_new:
+                    self.matches.append(0)
+                    self._spool_writer.writerow(values)
+                if query_index < 64:
+                    self.matches[asset] |= 1 << query_index
+                else:
+                    self.extra_matches.setdefault(asset, set()).add(query_index)
+            self.total_rows += len(rows)
+
+    @property
+    def unique_count(self):
+        return self.keys.count
+
+    def matched_queries(self, asset):
+        bits = self.matches[asset]
+        indexes = [i for i in range(64) if bits >> i & 1]
+        return indexes + sorted(self.extra_matches.get(asset, ()))
+
+    def write(self, target, export_format=EXPORT_FORMAT_CSV, batch_size=10000):
+        # 按资产编号顺序读出临时文件，追加命中查询数与命中的查询语句（换行分隔）
+        writer = get_result_writer(export_format)(target, self.fields + ['query_count', 'matched_queries'], None)
+        try:
+            with self._lock:
+                self._spool.flush()
+                self._spool.seek(0)
+                batch = []
+                for asset, values in enumerate(csv.reader(self._spool)):
+                    indexes = self.matched_queries(asset)
+                    batch.append(values + [str(len(indexes)), "\n".join(self.queries[i] for i in indexes)])
+                    if len(batch) >= batch_size:
+                        writer.write_rows(batch)
+                        batch = []
+                writer.write_rows(batch)
+        finally:
+            writer.close()
+        logger.info(f"合并去重完成: 原始 {self.total_rows} 条，去重后 {self.unique_count} 条，"
+                    f"哈希表占用 {(self.keys.nbytes() + len(self.matches) * 8) / 1024 / 1024:.1f} MB")
+        return self.unique_count
+
+    def close(self):
+        self._spool.close()
+
+_export_path_lock = threading.Lock()
+
+# === 后台任务配置 ===
+JOB_WORKERS = 4                  # 同时运行的线程任务数，所有会话共用
+JOB_ASYNC_WORKERS = 16           # 同时运行的协程任务数；协程等待网络时不占线程，可以比线程任务多
+JOB_MAX_PENDING = 32             # 排队加运行中的任务上限，超出后拒绝提交
+JOB_RESULT_TTL = 30 * 60         # 已结束任务的结果保留时长（秒），期间浏览器重连仍可取回
+JOB_MAX_RESULTS = 64             # 进程内保留的已结束任务数上限，超出后先丢弃最早结束的
+JOB_MAX_RESULTS_PER_OWNER = 4    # 每个会话保留的已结束任务数上限
+JOB_POLL_INTERVAL = 0.2          # 界面轮询任务状态的间隔（秒）
+JOB_STORAGE_KEY = "fofa_jobs"    # 浏览器端 client_storage 中保存任务 ID 的键
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+class Job:
+    def __init__(self, kind, owner=None, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.params = dict(params or {})
+        self.status = JOB_QUEUED
+        self.progress = {}
+        self.result = None
+        self.result_taken = False
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def update(self, **progress):
+        with self._lock:
+            self.progress.update(progress)
+
+    def take_result(self):
+        # 取出结果后任务不再持有它：全量获取的 ResultStore 交给界面后即可释放，不必等到过期
+        with self._lock:
+            result, self.result = self.result, None
+            self.result_taken = True
+        return result
+
+    def update_entry(self, name, key, value):
+        # 记录分项进度，例如批量导出中每个查询的进度
+        with self._lock:
+            self.progress.setdefault(name, {})[key] = value
+
+    def snapshot(self):
+        with self._lock:
+            progress = {k: dict(v) if isinstance(v, dict) else v for k, v in self.progress.items()}
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'params': dict(self.params),
+            'progress': progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+class JobManager:
+    """后台任务引擎：全量获取和导出在后台运行，不占用 Flet 的事件处理函数。
+
+    普通函数在有界线程池中执行；协程函数在共享事件循环上执行，等待网络期间不占用线程。
+    任务按 ID 保存在进程内，界面轮询状态；浏览器断开重连后凭 ID 仍可取回进度和结果。
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl=JOB_RESULT_TTL,
+                 async_workers=JOB_ASYNC_WORKERS, max_results=JOB_MAX_RESULTS,
+                 max_results_per_owner=JOB_MAX_RESULTS_PER_OWNER):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fofa-job")
+        self.async_slots = asyncio.Semaphore(async_workers)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_results = max_results
+        self.max_results_per_owner = max_results_per_owner
+        self.jobs = {}
+        self._queue = deque()   # 排队中的任务 ID，用于计算排队位置
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, owner=None, params=None):
+        # func(job) 的返回值保存为 job.result，可通过 job.update 上报进度；
+        # func 为协程函数时在共享事件循环上运行，否则在工作线程中运行
+        with self._lock:
+            self._prune_locked(time.time())
+            pending = sum(1 for job in self.jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise RuntimeError(f"后台任务已达上限（{self.max_pending} 个），请稍后再试")
+            job = Job(kind, owner, params)
+            self.jobs[job.id] = job
+            self._queue.append(job.id)
+        if asyncio.iscoroutinefunction(func):
+            asyncio.run_coroutine_threadsafe(self._run_async(job, func), get_async_loop())
+        else:
+            self.executor.submit(self._run, job, func)
+        logger.info(f"后台任务已提交: {job.kind} {job.id} ({owner or '桌面'})")
+        return job
+
+    def _start(self, job):
+        with self._lock:
+            self._queue.remove(job.id)
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+
+    def _finish(self, job, result=None, error=None):
+        if error is not None:
+            logger.error(f"后台任务失败: {job.kind} {job.id}: {error}")
+        with self._lock:
+            # 结束的同时按保留数量清理，其他线程不会看到超出上限的任务列表
+            if error is None:
+                job.result = result
+            else:
+                job.error = str(error)
+            job.finished_at = time.time()
+            job.status = JOB_DONE if error is None else JOB_FAILED
+            self._prune_locked(job.finished_at)
+        logger.info(f"后台任务结束: {job.kind} {job.id} {job.status}，耗时 {job.finished_at - job.started_at:.1f} 秒")
+
+    def _run(self, job, func):
+        self._start(job)
+        try:
+            result = func(job)
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+        self._finish(job, result)
+
+    async def _run_async(self, job, func):
+        async with self.async_slots:
+            self._start(job)
+            try:
+                result = await func(job)
+            except Exception as e:
+                self._finish(job, error=e)
+                return
+            self._finish(job, result)
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            position = self._queue.index(job_id) + 1 if job_id in self._queue else 0
+        snapshot = job.snapshot()
+        snapshot['queue_position'] = position
+        return snapshot
+
+    def _prune_locked(self, now):
+        # 丢弃过期的任务；已结束的任务超过每个会话或全局的保留数量时，从最早结束的开始丢弃
+        finished = sorted((job for job in self.jobs.values() if job.finished),
+                          key=lambda job: job.finished_at, reverse=True)
+        kept_per_owner = {}
+        kept = 0
+        for job in finished:
+            owner_count = kept_per_owner.get(job.owner, 0)
+            if (now - job.finished_at > self.ttl or owner_count >= self.max_results_per_owner
+                    or kept >= self.max_results):
+                del self.jobs[job.id]
+                continue
+            kept_per_owner[job.owner] = owner_count + 1
+            kept += 1
+
+job_manager = JobManager()
+
+# === 界面进度刷新 ===
+UI_REFRESH_HZ = 8   # 进度类界面刷新的最高频率（次/秒）
+
+def _control_value(control, name):
+    # 数值属性设为 None 后 flet 内部存的是空字符串，读取时转换失败会抛出 ValueError
+    # （如进度条由确定进度切换为不确定进度），这里按 None 处理
+    try:
+        return getattr(control, name)
+    except ValueError:
+        return None
+
+class ProgressThrottle:
+    """合并高频进度回调：只记录发生变化的控件，按固定最高频率一次性推送。
+
+    Web 模式下每次 page.update() 都是一次完整的 websocket 往返，逐条回调刷新会拖慢导出本身。
+    set() 可在任意线程调用；结束时调用 flush() 推送最后的状态。
+    """
+
+    def __init__(self, page, hz=UI_REFRESH_HZ):
+        self.page = page
+        self.interval = 1.0 / hz
+        self._dirty = {}
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, control, **props):
+        changed = False
+        for name, value in props.items():
+            if _control_value(control, name) != value:
+                setattr(control, name, value)
+                changed = True
+        if changed:
+            with self._lock:
+                self._dirty[id(control)] = control
+        self.maybe_flush()
+
+    def maybe_flush(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not self._dirty or (not force and now - self._last_flush < self.interval):
+                return
+            controls = list(self._dirty.values())
+            self._dirty.clear()
+            self._last_flush = now
+        self.page.update(*controls)
+
+    def flush(self):
+        self.maybe_flush(force=True)
 
 class FofaGUIApp:
     def __init__(self, is_web=False, session_id=None):
+        init_start = time.perf_counter()
         self.is_web = is_web
         self.session_id = session_id
         self.api_key = load_api_key_encrypted() or ""
@@ -93,6 +2737,12 @@ class FofaGUIApp:
         self.results_data = []
         self.fields_list = []
         self.total_results = 0
+        self.use_cache = CACHE_ENABLED
+        self.use_asset_db = ASSET_DB_ENABLED
+        # 密钥池为本机共享的账号，Web 模式下不使用
+        self.use_key_pool = KEY_POOL_ENABLED and not is_web
+        # 限速调度时用于区分会话的标识，桌面模式下按实例区分
+        self.scheduler_session = self.session_id or f"app-{id(self)}"
 
         # 初始化下载服务器会话目录
         if self.is_web and self.session_id:
@@ -101,6 +2751,8 @@ class FofaGUIApp:
                 os.makedirs(session_dir)
             download_server.add_session_dir(self.session_id, session_dir)
 
+        logger.info(f"会话初始化完成 ({self.session_id or '桌面'})，耗时 {(time.perf_counter() - init_start) * 1000:.1f} ms")
+
     @staticmethod
     def retry_decorator(max_retries=3, delay=2):
         def decorator(func):
@@ -120,20 +2772,118 @@ class FofaGUIApp:
             return wrapper
         return decorator
 
+    def _key_pool(self):
+        # 启用密钥池且池中有可用密钥时返回密钥池，否则使用单个密钥；Web 会话始终使用自己的密钥
+        if not self.use_key_pool or self.is_web:
+            return None
+        pool = get_key_pool()
+        return pool if pool.usable_count() else None
+
+    def _cache_scope(self):
+        # 缓存按账号隔离：不同会员等级可见的字段和结果可能不同。使用密钥池时同一查询的各页会轮流
+        # 由池中不同的密钥拉取，统一使用固定的池作用域，池中任一密钥的结果都可以复用，
+        # 也不随表单中的密钥变化（仅用密钥池时表单可以不填）
+        return KEY_POOL_CACHE_SCOPE if self._key_pool() is not None else self.api_key
+
+    def _page_journal(self, query, fields, page_size, resume=True, engine=ENGINE_PAGE):
+        # 续传时才需要页面日志；启用响应缓存时每页已写入缓存，续传重新请求会直接命中缓存且不消耗
+        # F 点，不再重复写一份日志。游标分页依赖服务端游标，也不写页面日志
+        if not resume or engine != ENGINE_PAGE:
+            return None
+        if self.use_cache and get_response_cache() is not None:
+            return None
+        return PageJournal(query, fields, page_size)
+
+    def _resume_journal(self, query, fields, page_size, total, resume=True, engine=ENGINE_PAGE):
+        journal = self._page_journal(query, fields, page_size, resume, engine)
+        if journal is not None and journal.total is not None and journal.total != total:
+            # 总量变化说明日志与当前结果集不一致，从头开始
+            journal.clear()
+            journal = PageJournal(query, fields, page_size)
+        return journal
+
+    def key_count(self):
+        # 当前参与轮询的密钥数，批量任务按此放大并发
+        pool = self._key_pool()
+        return pool.usable_count() if pool is not None else 1
+
+    def log_key_pool_stats(self, prefix="密钥池统计"):
+        if not self.use_key_pool or self.is_web or not len(get_key_pool()):
+            return
+        for entry in get_key_pool().entries():
+            logger.info(
+                f"{prefix}: {entry['label'] or entry['masked']} {entry['status']}, 请求 {entry['requests']} 次, "
+                f"出错 {entry['errors']} 次, 剩余F点 {entry['remaining'] if entry['remaining'] is not None else '未知'}"
+            )
+
+    def _handle_api_response(self, pool, api_key, response, cursor):
+        # 返回 (结果, 错误, 是否应换密钥重试)
+        if pool is not None and response.status_code >= 400:
+            pool.report_error(api_key, f"HTTP {response.status_code}")
+        response.raise_for_status()
+        result = response.json()
+        if result.get("error", False):
+            error_msg = result.get('errmsg', '未知错误')
+            logger.error(f"API错误: {error_msg}")
+            if pool is not None and pool.report_error(api_key, error_msg, fofa_error_code(result)):
+                # 游标属于原账号，换密钥无法继续翻页
+                return None, error_msg, cursor is None and pool.usable_count() > 0
+            return None, error_msg, False
+        if pool is not None:
+            pool.report_success(api_key, result)
+            if result.get("next"):
+                pool.pin_cursor(result["next"], api_key)
+        return result, None, False
+
+    def _request_api(self, path, params):
+        # 经限速调度器发起请求，429 时按 Retry-After 暂停该密钥的所有会话后重新排队；
+        # 使用密钥池时每个请求交给预计等待最短的密钥，密钥额度耗尽时换下一个密钥重试
+        client = get_http_client()
+        pool = self._key_pool()
+        cursor = params.get("next")
+        attempt = 0
+        while True:
+            if pool is not None:
+                api_key = pool.acquire(self.scheduler_session, cursor)
+                if api_key is None:
+                    return None, "密钥池中没有可用的密钥"
+            else:
+                api_key = self.api_key
+                rate_scheduler.acquire(api_key, self.scheduler_session)
+            response = client.get(path, params=dict(params, key=api_key), timeout=15)
+            if response.status_code == 429 and attempt < RATE_LIMIT_MAX_RETRIES:
+                attempt += 1
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                logger.warning(f"触发限速 (429)，该密钥所有会话暂停 {retry_after:.1f} 秒后重新排队")
+                rate_scheduler.penalize(api_key, retry_after)
+                continue
+            result, error, switch_key = self._handle_api_response(pool, api_key, response, cursor)
+            if not switch_key:
+                return result, error
+
+    def _record_assets(self, query, fields, result):
+        # 从网络拉取的页面写入本地资产库（缓存命中的页面此前已经记录过）
+        if not self.use_asset_db or not result or not result.get('results'):
+            return
+        asset_db = get_asset_db()
+        if asset_db is not None:
+            asset_db.record_page(query, result.get('fields') or fields.split(','), result['results'])
+
     @retry_decorator(max_retries=3, delay=3)
-    def fofa_search(self, query, fields="host,ip,port", page=1, size=10):
+    def fofa_search(self, query, fields="host,ip,port", page=1, size=10, use_cache=None):
         try:
-            session = requests.Session()
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504]
-            )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("https://", adapter)
+            cache = get_response_cache() if (self.use_cache if use_cache is None else use_cache) else None
+            cache_key = None
+            if cache is not None:
+                cache_key = ResponseCache.make_key(self._cache_scope(), query, fields, page, size)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    # 命中缓存不消耗 F 点
+                    cached['consumed_fpoint'] = 0
+                    logger.info(f"命中缓存: {query}, 字段: {fields}, 页码: {page}, 每页: {size}")
+                    return cached, None
             query_bytes = query.encode('utf-8')
             qbase64 = base64.b64encode(query_bytes).decode('utf-8')
-            url = "https://fofa.info/api/v1/search/all"
             params = {
                 "key": self.api_key,
                 "qbase64": qbase64,
@@ -142,14 +2892,13 @@ class FofaGUIApp:
                 "size": size
             }
             logger.info(f"正在查询: {query}, 字段: {fields}, 页码: {page}, 每页: {size}")
-            response = session.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            result = response.json()
-            if result.get("error", False):
-                error_msg = result.get('errmsg', '未知错误')
-                logger.error(f"API错误: {error_msg}")
-                return None, error_msg
+            result, error = self._request_api("/api/v1/search/all", params)
+            if error:
+                return None, error
             logger.info(f"成功获取第 {page} 页数据，共 {len(result.get('results', []))} 条记录")
+            if cache is not None:
+                cache.put(cache_key, result)
+            self._record_assets(query, fields, result)
             return result, None
         except requests.exceptions.RequestException as e:
             logger.error(f"请求出错: {str(e)}")
@@ -161,88 +2910,504 @@ class FofaGUIApp:
             logger.error(f"发生错误: {str(e)}")
             return None, str(e)
 
-    def get_all_results(self, query, fields="host,ip,port", page_size=1000):
-        all_results = []
-        current_page = 1
-        first_page, error = self.fofa_search(query, fields, current_page, page_size)
-        if error:
-            return None, None, error
-        if not first_page:
-            return None, None, "无法获取初始数据"
-
-        total = first_page.get('size', 0)
-        fields_list = first_page.get('fields', fields.split(','))
-        if total > 100000:
-            logger.warning(f"数据量过大: {total} 条，超过10万条限制")
-            return None, None, f"数据量过大: {total} 条，超过10万条限制，请缩小查询范围"
+    @retry_decorator(max_retries=3, delay=3)
+    def fofa_search_next(self, query, fields="host,ip,port", size=1000, next_cursor=None):
+        # 游标分页接口：每次返回一批结果和下一批的游标，结果集在整个拉取过程中保持一致
+        try:
+            params = {
+                "key": self.api_key,
+                "qbase64": base64.b64encode(query.encode('utf-8')).decode('utf-8'),
+                "fields": fields,
+                "size": size
+            }
+            if next_cursor:
+                params["next"] = next_cursor
+            logger.info(f"正在游标查询: {query}, 字段: {fields}, 每批: {size}, 游标: {next_cursor or '起始'}")
+            result, error = self._request_api("/api/v1/search/next", params)
+            if error:
+                return None, error
+            logger.info(f"成功获取游标批次，共 {len(result.get('results', []))} 条记录")
+            self._record_assets(query, fields, result)
+            return result, None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"请求出错: {str(e)}")
+            return None, str(e)
+        except json.JSONDecodeError:
+            logger.error("无法解析API返回的JSON数据")
+            return None, "无法解析API返回的JSON数据"
+        except Exception as e:
+            logger.error(f"发生错误: {str(e)}")
+            return None, str(e)
+
+    def open_result_stream(self, query, fields="host,ip,port", page_size=1000, max_workers=PAGE_FETCH_WORKERS,
+                           journal=None, limit=FULL_FETCH_LIMIT, page_errors=None, engine=ENGINE_PAGE):
+        # 先取第一页确定总量，返回 (总数, 字段列表, 按页码顺序产出 (页码, 结果) 的迭代器, 错误)
+        # 传入 journal 时，已记录的页面直接从磁盘读取，新拉取的页面写入日志
+        if engine == ENGINE_CURSOR:
+            return self._open_cursor_stream(query, fields, page_size, limit, page_errors)
+        first_results = None
+        if journal is not None and journal.total is not None and journal.has_page(1):
+            first_results = journal.load_page(1)
+        if first_results is not None:
+            total = journal.total
+            fields_list = journal.fields_list or fields.split(',')
+            logger.info(f"从页面日志恢复: {query}, 已完成 {journal.total_pages - len(journal.missing_pages())}/{journal.total_pages} 页")
+        else:
+            first_page, error = self.fofa_search(query, fields, 1, page_size)
+            if error:
+                return 0, None, None, error
+            if not first_page:
+                return 0, None, None, "无法获取初始数据"
+            total = first_page.get('size', 0)
+            fields_list = first_page.get('fields', fields.split(','))
+            first_results = first_page.get('results', [])
+
+        if total > limit:
+            logger.warning(f"数据量过大: {total} 条，超过 {limit} 条限制")
+            return total, None, None, f"数据量过大: {total} 条，超过 {limit} 条限制，请缩小查询范围"
         if total == 0:
-            return [], fields_list, "没有找到匹配的结果"
+            return 0, fields_list, None, "没有找到匹配的结果"
+
+        if journal is not None and not journal.has_page(1):
+            journal.set_totals(total, fields_list)
+            journal.save_page(1, first_results)
 
-        all_results.extend(first_page.get('results', []))
         total_pages = (total + page_size - 1) // page_size
-        for page in range(2, total_pages + 1):
-            time.sleep(1.5)
-            page_data, error = self.fofa_search(query, fields, page, page_size)
-            if error:
-                logger.error(f"获取第 {page} 页数据失败: {error}")
-                continue
-            if not page_data:
-                logger.warning(f"第 {page} 页数据为空，跳过该页")
-                continue
-            all_results.extend(page_data.get('results', []))
+        pages = self._iter_result_pages(
+            query, fields, page_size, total_pages, first_results, max_workers, journal, page_errors
+        )
+        return total, fields_list, pages, None
 
-        logger.info(f"全量数据获取完成，共 {len(all_results)} 条记录")
-        return all_results, fields_list, None
+    def _iter_result_pages(self, query, fields, page_size, total_pages, first_results, max_workers,
+                           journal=None, page_errors=None):
+        yield 1, first_results
+        if total_pages <= 1:
+            return
+        # 第 2..N 页并发拉取，请求节奏由限速调度器控制；
+        # 只保留有限的预取窗口，按页码顺序产出，内存占用与总数据量无关
+        workers = max(1, min(max_workers, total_pages - 1))
+        window = workers * 2
+        pending = {}
+        next_page = 2
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fofa-page")
+        try:
+            for page in range(2, total_pages + 1):
+                while next_page <= total_pages and next_page < page + window:
+                    if journal is None or not journal.has_page(next_page):
+                        pending[next_page] = executor.submit(self.fofa_search, query, fields, next_page, page_size)
+                    next_page += 1
+                if page not in pending:
+                    results = journal.load_page(page)
+                    if results is not None:
+                        yield page, results
+                        continue
+                    pending[page] = executor.submit(self.fofa_search, query, fields, page, page_size)
+                try:
+                    page_data, error = pending.pop(page).result()
+                except Exception as e:
+                    page_data, error = None, str(e)
+                if error:
+                    logger.error(f"获取第 {page} 页数据失败: {error}")
+                    if page_errors is not None:
+                        page_errors.append((page, error))
+                    continue
+                if not page_data:
+                    logger.warning(f"第 {page} 页数据为空，跳过该页")
+                    continue
+                results = page_data.get('results', [])
+                if journal is not None:
+                    journal.save_page(page, results)
+                yield page, results
+        finally:
+            # 调用方提前结束迭代时取消尚未开始的页面请求
+            for future in pending.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _open_cursor_stream(self, query, fields, page_size, limit=FULL_FETCH_LIMIT, page_errors=None):
+        first_batch, error = self.fofa_search_next(query, fields, page_size)
+        if error:
+            return 0, None, None, error
+        if not first_batch:
+            return 0, None, None, "无法获取初始数据"
+        total = first_batch.get('size', 0)
+        fields_list = first_batch.get('fields', fields.split(','))
+        if total > limit:
+            logger.warning(f"数据量过大: {total} 条，超过 {limit} 条限制")
+            return total, None, None, f"数据量过大: {total} 条，超过 {limit} 条限制，请缩小查询范围"
+        if total == 0:
+            return 0, fields_list, None, "没有找到匹配的结果"
+        return total, fields_list, self._iter_cursor_pages(query, fields, page_size, first_batch, page_errors), None
+
+    def _iter_cursor_pages(self, query, fields, page_size, first_batch, page_errors=None):
+        # 游标只能顺序读取：后台线程预取下一批，当前批次交给调用方处理，读写重叠进行
+        batch_no = 1
+        current = first_batch
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fofa-cursor")
+        try:
+            while current:
+                results = current.get('results', [])
+                next_cursor = current.get('next')
+                future = None
+                if results and next_cursor:
+                    future = executor.submit(self.fofa_search_next, query, fields, page_size, next_cursor)
+                if results:
+                    yield batch_no, results
+                if future is None:
+                    return
+                try:
+                    current, error = future.result()
+                except Exception as e:
+                    current, error = None, str(e)
+                if error:
+                    # 游标中断后无法跳过，只能结束本次读取
+                    logger.error(f"获取第 {batch_no + 1} 批游标数据失败: {error}")
+                    if page_errors is not None:
+                        page_errors.append((batch_no + 1, error))
+                    return
+                batch_no += 1
+        finally:
+            executor.shutdown(wait=True)
+
+    def get_all_results(self, query, fields="host,ip,port", page_size=1000, max_workers=PAGE_FETCH_WORKERS, resume=True,
+                        engine=ENGINE_PAGE):
+        # 返回 (结果, 字段列表, 错误, 拉取失败的页码列表)；有失败页时结果不完整，页面日志保留以便下次补拉
+        journal = self._page_journal(query, fields, page_size, resume, engine)
+        page_errors = []
+        total, fields_list, pages, error = self.open_result_stream(
+            query, fields, page_size, max_workers, journal, engine=engine, page_errors=page_errors
+        )
+        if error:
+            return ([] if fields_list is not None else None), fields_list, error, []
 
-    def export_to_csv(self, data, fields, query, progress_callback=None):
-        if not data:
-            return None, "没有数据可导出"
+        all_results = ResultStore(fields_list)
+        for _, results in pages:
+            all_results.extend(results)
+        failed_pages = self._log_failed_pages(query, page_errors)
+
+        # 全部页面都已拿到才删除日志，否则保留以便下次只补拉缺失页
+        if journal is not None:
+            journal.clear_if_complete()
+
+        logger.info(f"全量数据获取完成，共 {len(all_results)} 条记录，列式存储约 {all_results.nbytes() // 1024} KB")
+        log_http_stats()
+        log_rate_stats(self.api_key)
+        log_cache_stats()
+        return all_results, fields_list, None, failed_pages
+
+    @staticmethod
+    def _log_failed_pages(query, page_errors):
+        # 记录拉取失败的页面，返回按顺序排列的页码
+        for page, page_error in page_errors:
+            logger.error(f"第{page}页拉取失败: {query} - {page_error}")
+        return sorted(page for page, _ in page_errors)
+
+    def _export_dir(self):
+        if self.is_web and self.session_id:
+            output_dir = os.path.join("web_exports", self.session_id)
+        else:
+            output_dir = "fofa_results"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        return output_dir
+
+    def _export_path(self, query, prefix="fofa_search", ext=".csv"):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        query_hash = hash(query)
+        output_dir = self._export_dir()
+        # 并行导出时同一秒内可能出现同名文件，创建空文件占位并在重名时追加序号
+        with _export_path_lock:
+            suffix = 0
+            while True:
+                filename = f"{prefix}_{timestamp}_{query_hash}{f'_{suffix}' if suffix else ''}{ext}"
+                full_path = os.path.join(output_dir, filename)
+                if not os.path.exists(full_path):
+                    open(full_path, 'wb').close()
+                    return filename, full_path
+                suffix += 1
+
+    @staticmethod
+    def _discard_export(full_path):
+        # 导出失败时删除 _export_path 创建的占位文件或写了一半的文件
+        if full_path is None:
+            return
         try:
-            if self.is_web and self.session_id:
-                output_dir = os.path.join("web_exports", self.session_id)
-            else:
-                output_dir = "fofa_results"
+            os.remove(full_path)
+        except OSError:
+            pass
 
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+    def _export_location(self, filename, full_path):
+        # 如果是Web模式，返回下载URL
+        if self.is_web and self.session_id:
+            return f"http://localhost:8551/{self.session_id}/{filename}"
+        return full_path
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            query_hash = hash(query)
-            filename = f"fofa_search_{timestamp}_{query_hash}.csv"
-            full_path = os.path.join(output_dir, filename)
+    def export_to_csv(self, data, fields, query, progress_callback=None, export_format=EXPORT_FORMAT_CSV):
+        if not data:
+            return None, "没有数据可导出"
+        full_path = None
+        try:
+            writer_class = get_result_writer(export_format)
+            filename, full_path = self._export_path(query, ext=writer_class.extension)
 
             total_records = len(data)
             progress_update_interval = max(1, total_records // 100)  # 最多100次进度更新
 
-            with open(full_path, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                header = fields + ['fofa_query']
-                writer.writerow(header)
-
+            writer = writer_class(full_path, fields, query)
+            try:
+                chunk = []
                 for i, row in enumerate(data):
-                    str_row = [str(item) if item is not None else "" for item in row]
-                    writer.writerow(str_row + [query])
+                    chunk.append(row)
 
                     # 定期更新进度
-                    if progress_callback and i % progress_update_interval == 0:
-                        progress_callback(i)
+                    if i % progress_update_interval == 0:
+                        writer.write_rows(chunk)
+                        chunk = []
+                        if progress_callback:
+                            progress_callback(i)
+                writer.write_rows(chunk)
+            finally:
+                writer.close()
 
             # 确保进度条显示100%
             if progress_callback:
                 progress_callback(total_records)
 
             logger.info(f"数据已成功导出到: {full_path}")
+            return self._export_location(filename, full_path), None
+        except Exception as e:
+            logger.error(f"导出失败: {str(e)}")
+            self._discard_export(full_path)
+            return None, str(e)
+
+    def _write_pages(self, target, fields_list, query, pages, on_page=None, export_format=EXPORT_FORMAT_CSV):
+        # 逐页写入导出文件；写盘期间后续页面仍在预取窗口中并发拉取
+        # target 为可调用对象（如打开 ZIP 条目）时，拿到第一页非空数据后才调用它打开输出流
+        record_count = 0
+        writer_class = get_result_writer(export_format)
+        writer = None if callable(target) else writer_class(target, fields_list, query)
+        stream = None
+        try:
+            for _, results in pages:
+                if writer is None:
+                    if not results:
+                        continue
+                    stream = target()
+                    writer = writer_class(stream, fields_list, query)
+                writer.write_rows(results)
+                record_count += len(results)
+                if on_page:
+                    on_page(record_count)
+        except Exception:
+            if isinstance(stream, ZipEntryStream):
+                # 中途失败的查询不在 ZIP 中留下不完整的条目
+                stream.abort()
+            raise
+        finally:
+            if writer is not None:
+                writer.close()
+        return record_count
+
+    def fetch_and_export(self, query, fields="host,ip,port", page_size=1000, progress_callback=None, resume=True,
+                         engine=ENGINE_PAGE, export_format=EXPORT_FORMAT_CSV):
+        # 流式模式：每页到达后立即写入 CSV，不在内存中累积全量结果
+        # 返回 (文件路径或下载URL, 记录数, 错误, 拉取失败的页码列表)
+        journal = self._page_journal(query, fields, page_size, resume, engine)
+        page_errors = []
+        total, fields_list, pages, error = self.open_result_stream(
+            query, fields, page_size, journal=journal, engine=engine, page_errors=page_errors
+        )
+        if error:
+            return None, 0, error, []
+        full_path = None
+        try:
+            filename, full_path = self._export_path(query, ext=get_result_writer(export_format).extension)
+            record_count = self._write_pages(
+                full_path, fields_list, query, pages,
+                on_page=(lambda count: progress_callback(count, total)) if progress_callback else None,
+                export_format=export_format
+            )
 
-            # 如果是Web模式，返回下载URL
-            if self.is_web and self.session_id:
-                download_url = f"http://localhost:8551/{self.session_id}/{filename}"
-                return download_url, None
+            logger.info(f"流式导出完成: {full_path}, 共 {record_count} 条记录")
+            failed_pages = self._log_failed_pages(query, page_errors)
+            if journal is not None:
+                journal.clear_if_complete()
+            log_http_stats()
+            log_rate_stats(self.api_key)
+            return self._export_location(filename, full_path), record_count, None, failed_pages
+        except Exception as e:
+            logger.error(f"流式导出失败: {str(e)}")
+            self._discard_export(full_path)
+            return None, 0, str(e), []
+        finally:
+            pages.close()
+
+    def export_partitioned(self, query, fields="host,ip,port", page_size=1000, progress_callback=None,
+                           max_workers=PARTITION_WORKERS, engine=ENGINE_PAGE, export_format=EXPORT_FORMAT_CSV,
+                           key_fields=DEDUP_KEY_FIELDS):
+        # 超过全量上限的查询：切分为多个子查询并行拉取，按资产键字段去重后写入同一个导出文件
+        # 返回 (文件路径或下载URL, 去重后记录数, 错误, 失败的分区或页面列表)；
+        # 失败列表非空时导出文件只包含成功拉取的部分
+        partitioner = QueryPartitioner(self, fields)
+        partitions, error = partitioner.partition(query)
+        if error:
+            return None, 0, error, []
+        if not partitions:
+            return None, 0, "没有找到匹配的结果", []
+
+        estimated_total = sum(count for _, count in partitions)
+        # 与批量合并去重相同，按资产键字段去重：只保存每个资产 8 字节摘要的开放寻址表，按行计约 17~34 字节
+        seen = RowKeySet()
+        write_lock = threading.Lock()
+        counters = {'written': 0, 'duplicates': 0, 'processed': 0}
+        errors = []
+        full_path = None
+        output = {'writer': None, 'fields': None, 'positions': None}
 
-            return full_path, None
+        try:
+            writer_class = get_result_writer(export_format)
+            filename, full_path = self._export_path(query, prefix="fofa_partitioned", ext=writer_class.extension)
+            try:
+                def fetch_partition(sub_query):
+                    journal = self._page_journal(sub_query, fields, page_size, engine=engine)
+                    page_errors = []
+                    _, fields_list, pages, error = self.open_result_stream(
+                        sub_query, fields, page_size, journal=journal, engine=engine, page_errors=page_errors
+                    )
+                    if error:
+                        errors.append(f"{sub_query}: {error}")
+                        return
+                    fields_list = list(fields_list)
+                    remap = None
+                    for _, results in pages:
+                        with write_lock:
+                            if output['writer'] is None:
+                                # 表头使用 FOFA 返回的字段列表，与各行的列顺序一致
+                                output['fields'] = fields_list
+                                output['positions'] = dedup_key_positions(fields_list, key_fields)
+                                output['writer'] = writer_class(full_path, fields_list, query)
+                            if remap is None and fields_list != output['fields']:
+                                remap = [fields_list.index(f) if f in fields_list else None for f in output['fields']]
+                            positions = output['positions']
+                            fresh_rows = []
+                            for row in results:
+                                values = _stringify_row(row)
+                                if remap is not None:
+                                    values = ["" if i is None or i >= len(values) else values[i] for i in remap]
+                                if not seen.add(row_key_digest(values, positions))[1]:
+                                    counters['duplicates'] += 1
+                                    continue
+                                fresh_rows.append(values)
+                            output['writer'].write_rows(fresh_rows)
+                            counters['written'] += len(fresh_rows)
+                            counters['processed'] += len(results)
+                            if progress_callback:
+                                progress_callback(counters['processed'], estimated_total)
+                    errors.extend(f"{sub_query}: 第{page}页失败: {page_error}" for page, page_error in page_errors)
+                    if journal is not None:
+                        journal.clear_if_complete()
+
+                with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="fofa-partition") as executor:
+                    list(executor.map(fetch_partition, [sub_query for sub_query, _ in partitions]))
+            finally:
+                if output['writer'] is not None:
+                    output['writer'].close()
+
+            for message in errors:
+                logger.error(f"分区拉取失败: {message}")
+            if counters['written'] == 0:
+                self._discard_export(full_path)
+                return None, 0, errors[0] if errors else "未获取到任何数据", errors
+            logger.info(
+                f"分区导出完成: {full_path}, {len(partitions)} 个分区, 写入 {counters['written']} 条, "
+                f"去除重复 {counters['duplicates']} 条, 失败 {len(errors)} 处, 去重表 {seen.nbytes() // 1024} KB"
+            )
+            log_http_stats()
+            log_rate_stats(self.api_key)
+            return self._export_location(filename, full_path), counters['written'], None, errors
         except Exception as e:
-            logger.error(f"导出CSV失败: {str(e)}")
+            logger.error(f"分区导出失败: {str(e)}")
+            self._discard_export(full_path)
+            return None, 0, str(e), errors
+
+    def sync_saved_query(self, name, page_size=1000, progress_callback=None, engine=ENGINE_PAGE,
+                         store=None):
+        # 增量同步：首次拉取全量，之后只拉取上次同步以来更新的记录（after=），按资产合并进本地快照
+        # 返回 (统计字典, 错误)；有页面失败时不推进同步时间，下次同步会重新覆盖这段时间
+        store = store or saved_query_store
+        entry = store.get(name)
+        if entry is None:
+            return None, f"没有名为 {name} 的保存查询"
+        sync_started = datetime.now()
+        query = entry['query']
+        incremental = bool(entry.get('last_sync')) and os.path.exists(store.snapshot_path(name))
+        if incremental:
+            since = datetime.fromisoformat(entry['last_sync']).date() - timedelta(days=SYNC_OVERLAP_DAYS)
+            query = f'({query}) && after="{since.strftime("%Y-%m-%d")}"'
+        logger.info(f"同步保存的查询 {name}: {query}")
+
+        page_errors = []
+        total, fields_list, pages, error = self.open_result_stream(
+            query, entry['fields'], page_size, page_errors=page_errors, engine=engine
+        )
+        if error and not (total == 0 and fields_list is not None):
+            return None, error
+        fetched = 0
+
+        def fetched_rows():
+            # 逐页产出，拉取到的行直接写入快照，首次同步也不在内存中累积全量结果
+            nonlocal fetched
+            if pages is None:
+                return
+            for _, results in pages:
+                yield from results
+                fetched += len(results)
+                if progress_callback:
+                    progress_callback(fetched, total)
+
+        try:
+            new, updated, record_count = store.merge_snapshot(name, fields_list, fetched_rows())
+        finally:
+            if pages is not None:
+                pages.close()
+        stats = {
+            'incremental': incremental,
+            'fetched': fetched,
+            'new': new,
+            'updated': updated,
+            'record_count': record_count,
+            'page_errors': len(page_errors),
+        }
+        values = {'record_count': record_count, 'last_new': new, 'last_updated': updated, 'last_fetched': fetched}
+        if not page_errors:
+            values['last_sync'] = sync_started.isoformat(timespec="seconds")
+        store.update(name, **values)
+        logger.info(f"同步完成 {name}: 拉取 {fetched} 条，新增 {new}，更新 {updated}，快照共 {record_count} 条")
+        log_rate_stats(self.api_key, "增量同步 限速调度统计")
+        return stats, None
+
+    def export_snapshot(self, name, store=None):
+        # 把本地快照复制到导出目录，Web 模式下返回下载地址
+        store = store or saved_query_store
+        path = store.snapshot_path(name)
+        if not os.path.exists(path):
+            return None, "该查询还没有同步过"
+        full_path = None
+        try:
+            filename, full_path = self._export_path(name, prefix="snapshot", ext=".csv")
+            shutil.copyfile(path, full_path)
+            return self._export_location(filename, full_path), None
+        except Exception as e:
+            logger.error(f"导出快照失败: {e}")
+            self._discard_export(full_path)
             return None, str(e)
 
+    @staticmethod
+    def _zip_compress_type(path):
+        if os.path.splitext(path)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
     def create_zip_for_batch(self, file_paths, base_name="batch_export"):
         if not self.is_web or not self.session_id:
             return None, "仅 Web 模式支持批量 ZIP"
@@ -262,7 +3427,7 @@ class FofaGUIApp:
                         full_path = os.path.join(zip_dir, file_name)
                         if os.path.exists(full_path):
                             arcname = os.path.basename(full_path)
-                            zf.write(full_path, arcname)
+                            zf.write(full_path, arcname, compress_type=self._zip_compress_type(full_path))
                             logger.info(f"已添加文件到压缩包: {full_path} -> {arcname}")
                         else:
                             logger.warning(f"文件不存在: {full_path}")
@@ -270,7 +3435,7 @@ class FofaGUIApp:
                         # 如果是普通路径
                         if os.path.exists(fp):
                             arcname = os.path.basename(fp)
-                            zf.write(fp, arcname)
+                            zf.write(fp, arcname, compress_type=self._zip_compress_type(fp))
                             logger.info(f"已添加文件到压缩包: {fp} -> {arcname}")
                         else:
                             logger.warning(f"文件不存在: {fp}")
@@ -346,160 +3511,711 @@ class FofaGUIApp:
         ]
         return fields_info
 
-    def batch_preview_queries(self, queries, fields="host,ip,port"):
-        preview_results = []
-        errors = []
+    def batch_preview_queries(self, queries, fields="host,ip,port", on_result=None, max_workers=BATCH_PREVIEW_WORKERS):
+        # 规范化后相同的查询只请求一次，各查询并发获取数据量；
+        # 每得到一个结果就调用 on_result(查询序号, 结果字典)，无需等待整批完成
+        groups = {}
         for i, query in enumerate(queries):
             query = query.strip()
             if not query:
                 continue
+            groups.setdefault(normalize_query(query), []).append((i, query))
+
+        def preview(query):
             try:
                 result, error = self.fofa_search(query, fields, page=1, size=1)
                 if error:
-                    errors.append(f"查询 {i+1}: {query} - 错误: {error}")
-                    preview_results.append({
-                        'query': query,
-                        'total': 0,
-                        'error': error,
-                        'valid': False
-                    })
-                else:
-                    total = result.get('size', 0)
-                    preview_results.append({
-                        'query': query,
-                        'total': total,
-                        'error': None,
-                        'valid': total <= 200000 and total > 0
-                    })
+                    return 0, error, "错误"
+                return result.get('size', 0), None, None
             except Exception as e:
-                error_msg = f"查询 {i+1}: {query} - 异常: {str(e)}"
-                errors.append(error_msg)
-                preview_results.append({
-                    'query': query,
-                    'total': 0,
-                    'error': str(e),
-                    'valid': False
-                })
+                return 0, str(e), "异常"
+
+        outcomes = {}
+        error_by_index = {}
+        if groups:
+            workers = max(1, min(max_workers * self.key_count(), len(groups)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fofa-preview") as executor:
+                futures = {executor.submit(preview, members[0][1]): members for members in groups.values()}
+                for future in as_completed(futures):
+                    total, error, error_kind = future.result()
+                    for i, query in futures[future]:
+                        outcome = {
+                            'query': query,
+                            'total': total,
+                            'error': error,
+                            'valid': error is None and total <= BATCH_EXPORT_LIMIT and total > 0
+                        }
+                        outcomes[i] = outcome
+                        if error:
+                            error_by_index[i] = f"查询 {i+1}: {query} - {error_kind}: {error}"
+                        if on_result:
+                            on_result(i, outcome)
+
+        preview_results = [outcomes[i] for i in sorted(outcomes)]
+        errors = [error_by_index[i] for i in sorted(error_by_index)]
+        duplicates = len(outcomes) - len(groups)
+        if duplicates:
+            logger.info(f"批量预览合并了 {duplicates} 个重复查询")
+        log_http_stats("批量预览 HTTP连接统计")
+        log_rate_stats(self.api_key, "批量预览 限速调度统计")
+        log_cache_stats("批量预览 查询缓存统计")
         return preview_results, errors
 
-    def batch_export_queries(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None):
-        export_results = []
+    def _export_single_query(self, index, query, fields, page_size, resume=True, query_progress_callback=None,
+                             engine=ENGINE_PAGE, export_format=EXPORT_FORMAT_CSV, zip_sink=None, merger=None):
+        # 导出单个批量查询：预览检查数据量，然后按页流式写入导出文件；指定 zip_sink 时写入 ZIP 中的条目，
+        # 指定 merger 时各页只并入合并去重结果，不单独生成文件
+        # 返回 (结果字典, 错误日志列表)
         error_logs = []
-        exported_files = []
+
+        def failed(message, record_count=0):
+            return {
+                'query': query,
+                'success': False,
+                'filename': None,
+                'record_count': record_count,
+                'error': message
+            }, error_logs
+
+        preview_result, error = self.fofa_search(query, fields, page=1, size=1)
+        if error:
+            error_logs.append(f"查询 {index+1}: {query} - 预览失败: {error}")
+            return failed(error)
+        total = preview_result.get('size', 0)
+        if total > BATCH_EXPORT_LIMIT:
+            error_logs.append(f"查询 {index+1}: {query} - 数据量过大: {total}条")
+            return failed(f"数据量过大: {total}条")
+        if total == 0:
+            error_logs.append(f"查询 {index+1}: {query} - 没有找到结果")
+            return failed("没有找到结果")
+
+        logger.info(f"开始导出查询 {index+1}: {query}, 总数据量: {total}条, 分页大小: {page_size}")
+        journal = self._resume_journal(query, fields, page_size, total, resume, engine)
+
+        page_errors = []
+        _, fields_list, pages, error = self.open_result_stream(
+            query, fields, page_size, max_workers=BATCH_PAGE_WORKERS,
+            journal=journal, limit=BATCH_EXPORT_LIMIT, page_errors=page_errors, engine=engine
+        )
+        if error:
+            error_logs.append(f"查询 {index+1}: {query} - 获取数据失败: {error}")
+            return failed(error)
+
+        def on_page(record_count):
+            if query_progress_callback:
+                query_progress_callback(index, record_count, total)
+
+        full_path = None
+        try:
+            extension = get_result_writer(export_format).extension
+            if merger is not None:
+                filename = full_path = None
+                record_count = 0
+                for _, results in pages:
+                    merger.add_rows(index, fields_list, results)
+                    record_count += len(results)
+                    on_page(record_count)
+            else:
+                if zip_sink is not None:
+                    # ZIP 条目在第一页非空数据到达后才打开：没有数据的查询不留下空条目，拉取期间也不占用写入权
+                    filename = zip_sink.reserve_name(query, ext=extension)
+                    target = lambda: zip_sink.open_entry(filename)
+                else:
+                    filename, full_path = self._export_path(query, ext=extension)
+                    target = full_path
+                record_count = self._write_pages(
+                    target, fields_list, query, pages, on_page=on_page, export_format=export_format
+                )
+        except Exception as e:
+            error_logs.append(f"查询 {index+1}: {query} - 导出失败: {str(e)}")
+            self._discard_export(full_path)
+            return failed(str(e))
+        finally:
+            pages.close()
+
+        for page, page_error in page_errors:
+            error_logs.append(f"查询 {index+1}: {query} - 第{page}页失败: {page_error}")
+        if record_count == 0:
+            self._discard_export(full_path)
+            error_logs.append(f"查询 {index+1}: {query} - 未获取到任何数据")
+            return failed("未获取到任何数据")
+
+        if journal is not None:
+            journal.clear_if_complete()
+        if merger is not None:
+            location = None
+        elif zip_sink is not None:
+            location = filename
+        else:
+            location = self._export_location(filename, full_path)
+        logger.info(f"查询 {index+1}导出成功: {location}, 记录数: {record_count}")
+        return {
+            'query': query,
+            'success': True,
+            'filename': location,
+            'record_count': record_count,
+            'error': None
+        }, error_logs
+
+    def batch_export_queries(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None,
+                             resume=True, max_workers=BATCH_EXPORT_WORKERS, query_progress_callback=None,
+                             engine=ENGINE_PAGE, export_format=EXPORT_FORMAT_CSV, zip_sink=None, merger=None):
+        # 多个查询由工作线程池并行处理，所有请求共享同一密钥的限速调度器；
+        # progress_callback(已完成进度, 查询总数)，query_progress_callback(查询序号, 已获取条数, 总条数)
+        # 指定 zip_sink 时各查询直接写入 ZIP 条目，exported_files 为条目名；
+        # 指定 merger 时只做合并去重，exported_files 为空
         total_queries = len(queries)
+        jobs = [(i, query.strip()) for i, query in enumerate(queries) if query.strip()]
+        outcomes = {}
+        query_fractions = {}
+        progress_lock = threading.Lock()
 
-        for i, query in enumerate(queries):
-            # 更新进度
+        def report_progress():
             if progress_callback:
-                progress_callback(i, total_queries)
-            query = query.strip()
-            if not query:
-                continue
+                with progress_lock:
+                    current = len(outcomes) + sum(query_fractions.values())
+                progress_callback(current, total_queries)
+
+        def on_query_progress(index, fetched, total):
+            with progress_lock:
+                query_fractions[index] = min(fetched / total, 1.0) if total else 0.0
+            if query_progress_callback:
+                query_progress_callback(index, fetched, total)
+            report_progress()
+
+        def run(index, query):
             try:
-                preview_result, error = self.fofa_search(query, fields, page=1, size=1)
-                if error:
-                    error_logs.append(f"查询 {i+1}: {query} - 预览失败: {error}")
-                    export_results.append({
-                        'query': query,
-                        'success': False,
-                        'filename': None,
-                        'record_count': 0,
-                        'error': error
-                    })
-                    continue
-                total = preview_result.get('size', 0)
-                if total > 200000:
-                    error_logs.append(f"查询 {i+1}: {query} - 数据量过大: {total}条")
-                    export_results.append({
-                        'query': query,
-                        'success': False,
-                        'filename': None,
-                        'record_count': 0,
-                        'error': f"数据量过大: {total}条"
-                    })
-                    continue
-                if total == 0:
-                    error_logs.append(f"查询 {i+1}: {query} - 没有找到结果")
-                    export_results.append({
-                        'query': query,
-                        'success': False,
-                        'filename': None,
-                        'record_count': 0,
-                        'error': "没有找到结果"
-                    })
-                    continue
-
-                all_data = []
-                current_page = 1
-                total_pages = (total + page_size - 1) // page_size
-                logger.info(f"开始导出查询 {i+1}: {query}, 总数据量: {total}条, 分页大小: {page_size}")
-
-                while current_page <= total_pages:
-                    try:
-                        page_data, error = self.fofa_search(query, fields, current_page, page_size)
-                        if error:
-                            error_logs.append(f"查询 {i+1}: {query} - 第{current_page}页失败: {error}")
-                            break
-                        if page_data:
-                            results = page_data.get('results', [])
-                            all_data.extend(results)
-                            logger.info(f"查询 {i+1} - 第{current_page}页获取成功: {len(results)}条")
-                        current_page += 1
-                        time.sleep(1.5)
-                    except Exception as e:
-                        error_logs.append(f"查询 {i+1}: {query} - 第{current_page}页异常: {str(e)}")
-                        break
-
-                if all_data:
-                    # 为单个查询导出创建进度回调
-                    def single_query_progress(current):
-                        # 将单个查询的进度映射到整体进度中
-                        if progress_callback:
-                            # 计算当前查询在整体进度中的位置
-                            base_progress = i / total_queries
-                            # 计算当前查询的进度比例
-                            query_progress = current / len(all_data) if all_data else 0
-                            # 计算整体进度
-                            overall_progress = base_progress + (query_progress / total_queries)
-                            progress_callback(int(overall_progress * total_queries), total_queries)
-
-                    filename, error = self.export_to_csv(all_data, fields.split(','), query, progress_callback=single_query_progress)
-                    if error:
-                        error_logs.append(f"查询 {i+1}: {query} - 导出失败: {error}")
-                        export_results.append({
-                            'query': query,
-                            'success': False,
-                            'filename': None,
-                            'record_count': len(all_data),
-                            'error': error
-                        })
-                    else:
-                        export_results.append({
-                            'query': query,
-                            'success': True,
-                            'filename': filename,
-                            'record_count': len(all_data),
-                            'error': None
-                        })
-                        exported_files.append(filename)
-                        logger.info(f"查询 {i+1}导出成功: {filename}, 记录数: {len(all_data)}")
+                return self._export_single_query(
+                    index, query, fields, page_size, resume, on_query_progress, engine, export_format, zip_sink,
+                    merger
+                )
             except Exception as e:
-                error_msg = f"查询 {i+1}: {query} - 处理异常: {str(e)}"
-                error_logs.append(error_msg)
-                export_results.append({
+                return {
                     'query': query,
                     'success': False,
                     'filename': None,
                     'record_count': 0,
                     'error': str(e)
-                })
+                }, [f"查询 {index+1}: {query} - 处理异常: {str(e)}"]
+
+        if progress_callback:
+            progress_callback(0, total_queries)
+        if jobs:
+            # 每个密钥有独立的限速额度，密钥池中的密钥越多可同时处理的查询越多
+            workers = max(1, min(max_workers * self.key_count(), len(jobs)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fofa-batch") as executor:
+                futures = {executor.submit(run, index, query): index for index, query in jobs}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    with progress_lock:
+                        outcomes[index] = future.result()
+                        query_fractions.pop(index, None)
+                    report_progress()
+
+        export_results = []
+        error_logs = []
+        exported_files = []
+        for index in sorted(outcomes):
+            result, logs = outcomes[index]
+            export_results.append(result)
+            error_logs.extend(logs)
+            if result['success'] and result['filename']:
+                exported_files.append(result['filename'])
 
         # 确保进度条显示100%
         if progress_callback:
             progress_callback(total_queries, total_queries)
 
+        log_http_stats("批量导出 HTTP连接统计")
+        log_rate_stats(self.api_key, "批量导出 限速调度统计")
+        self.log_key_pool_stats("批量导出 密钥池统计")
+        log_cache_stats("批量导出 查询缓存统计")
         return export_results, error_logs, exported_files
 
+    def batch_export_to_zip(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None,
+                            resume=True, max_workers=BATCH_EXPORT_WORKERS, query_progress_callback=None,
+                            engine=ENGINE_PAGE, export_format=EXPORT_FORMAT_CSV, base_name="batch_export",
+                            compression=ZIP_BATCH_COMPRESSION, level=ZIP_DEFLATE_LEVEL):
+        # 批量导出直接写入单个 ZIP，最后一页写完即可下载，无需再读回各个文件二次压缩
+        # 返回 (下载地址或路径, 导出结果, 错误日志, 错误)
+        filename, zip_path, sink, error = self._create_zip_sink(queries, base_name, compression, level)
+        if error:
+            return None, [], [], error
+        try:
+            export_results, error_logs, exported_files = self.batch_export_queries(
+                queries, fields, page_size, progress_callback, resume, max_workers,
+                query_progress_callback, engine, export_format, zip_sink=sink
+            )
+        finally:
+            sink.close()
+        return self._zip_outcome(filename, zip_path, export_results, error_logs, exported_files)
+
+    def _create_zip_sink(self, queries, base_name, compression, level):
+        # 返回 (文件名, 路径, ZipBatchSink, 错误)
+        filename, zip_path = self._export_path("\n".join(queries), prefix=base_name, ext=".zip")
+        try:
+            return filename, zip_path, ZipBatchSink(zip_path, compression, level), None
+        except Exception as e:
+            self._discard_export(zip_path)
+            logger.error(f"创建 ZIP 失败: {e}")
+            return None, None, None, str(e)
+
+    def _zip_outcome(self, filename, zip_path, export_results, error_logs, exported_files):
+        if not exported_files:
+            self._discard_export(zip_path)
+            return None, export_results, error_logs, "没有成功导出的查询"
+        return self._export_location(filename, zip_path), export_results, error_logs, None
+
+    def batch_export_merged(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None,
+                            resume=True, max_workers=BATCH_EXPORT_WORKERS, query_progress_callback=None,
+                            engine=ENGINE_PAGE, export_format=EXPORT_FORMAT_CSV, key_fields=DEDUP_KEY_FIELDS):
+        # 所有查询的结果按 key_fields 合并去重后写成一个文件，并附上每个资产命中的查询
+        # 返回 (下载地址或路径, 导出结果, 错误日志, 错误, {'rows': 原始行数, 'unique': 去重后行数})
+        jobs = [query.strip() for query in queries]
+        merger = BatchMerger(jobs, key_fields)
+        try:
+            export_results, error_logs, _ = self.batch_export_queries(
+                queries, fields, page_size, progress_callback, resume, max_workers,
+                query_progress_callback, engine, export_format, merger=merger
+            )
+            stats = {'rows': merger.total_rows, 'unique': merger.unique_count}
+            if not merger.unique_count:
+                return None, export_results, error_logs, "没有成功导出的查询", stats
+            location, error = self._write_merged(merger, jobs, export_format)
+            return location, export_results, error_logs, error, stats
+        finally:
+            merger.close()
+
+    def _write_merged(self, merger, jobs, export_format):
+        # 返回 (下载地址或路径, 错误)
+        writer_class = get_result_writer(export_format)
+        filename, full_path = self._export_path("\n".join(jobs), prefix="batch_merged", ext=writer_class.extension)
+        try:
+            merger.write(full_path, export_format)
+        except Exception as e:
+            self._discard_export(full_path)
+            logger.error(f"写入合并文件失败: {e}")
+            return None, str(e)
+        return self._export_location(filename, full_path), None
+
+    # === 异步接口：与上面的阻塞方法行为一致，运行在共享事件循环上，等待期间不占用线程 ===
+
+    async def _async_request_api(self, path, params):
+        client = get_async_client()
+        pool = self._key_pool()
+        cursor = params.get("next")
+        attempt = 0
+        while True:
+            if pool is not None:
+                api_key = await pool.acquire_async(self.scheduler_session, cursor)
+                if api_key is None:
+                    return None, "密钥池中没有可用的密钥"
+            else:
+                api_key = self.api_key
+                await rate_scheduler.acquire_async(api_key, self.scheduler_session)
+            for server_attempt in range(ASYNC_SERVER_RETRIES + 1):
+                try:
+                    response = await client.get(path, params=dict(params, key=api_key))
+                except httpx.TransportError:
+                    if server_attempt == ASYNC_SERVER_RETRIES:
+                        raise
+                    await asyncio.sleep(2 ** server_attempt)
+                    continue
+                if response.status_code < 500 or server_attempt == ASYNC_SERVER_RETRIES:
+                    break
+                await asyncio.sleep(2 ** server_attempt)
+            if response.status_code == 429 and attempt < RATE_LIMIT_MAX_RETRIES:
+                attempt += 1
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                logger.warning(f"触发限速 (429)，该密钥所有会话暂停 {retry_after:.1f} 秒后重新排队")
+                rate_scheduler.penalize(api_key, retry_after)
+                continue
+            result, error, switch_key = self._handle_api_response(pool, api_key, response, cursor)
+            if not switch_key:
+                return result, error
+
+    async def async_fofa_search(self, query, fields="host,ip,port", page=1, size=10, use_cache=None):
+        try:
+            cache = get_response_cache() if (self.use_cache if use_cache is None else use_cache) else None
+            cache_key = None
+            if cache is not None:
+                cache_key = ResponseCache.make_key(self._cache_scope(), query, fields, page, size)
+                # SQLite 读写放到线程中，避免阻塞共享事件循环上的其他会话
+                cached = await asyncio.to_thread(cache.get, cache_key)
+                if cached is not None:
+                    cached['consumed_fpoint'] = 0
+                    logger.info(f"命中缓存: {query}, 字段: {fields}, 页码: {page}, 每页: {size}")
+                    return cached, None
+            params = {
+                "key": self.api_key,
+                "qbase64": base64.b64encode(query.encode('utf-8')).decode('utf-8'),
+                "fields": fields,
+                "page": page,
+                "size": size
+            }
+            logger.info(f"正在异步查询: {query}, 字段: {fields}, 页码: {page}, 每页: {size}")
+            result, error = await self._async_request_api("/api/v1/search/all", params)
+            if error:
+                return None, error
+            logger.info(f"成功获取第 {page} 页数据，共 {len(result.get('results', []))} 条记录")
+            if cache is not None:
+                await asyncio.to_thread(cache.put, cache_key, result)
+            if self.use_asset_db:
+                # 写入队列满时会等待，放到线程中避免阻塞事件循环
+                await asyncio.to_thread(self._record_assets, query, fields, result)
+            return result, None
+        except Exception as e:
+            logger.error(f"异步请求出错: {str(e)}")
+            return None, str(e)
+
+    async def async_fofa_search_next(self, query, fields="host,ip,port", size=1000, next_cursor=None):
+        try:
+            params = {
+                "key": self.api_key,
+                "qbase64": base64.b64encode(query.encode('utf-8')).decode('utf-8'),
+                "fields": fields,
+                "size": size
+            }
+            if next_cursor:
+                params["next"] = next_cursor
+            result, error = await self._async_request_api("/api/v1/search/next", params)
+            if not error and self.use_asset_db:
+                await asyncio.to_thread(self._record_assets, query, fields, result)
+            return result, error
+        except Exception as e:
+            logger.error(f"异步请求出错: {str(e)}")
+            return None, str(e)
+
+    async def _async_iter_result_pages(self, query, fields="host,ip,port", page_size=1000,
+                                       max_concurrency=PAGE_FETCH_WORKERS, limit=FULL_FETCH_LIMIT,
+                                       engine=ENGINE_PAGE, journal=None, page_errors=None, meta=None):
+        # 异步生成器，按页码顺序产出 (页码, 结果)；总数和字段列表写入 meta
+        # 页面日志的读写都放到线程中执行
+        meta = {} if meta is None else meta
+        first_results = None
+        if engine == ENGINE_CURSOR:
+            batch, error = await self.async_fofa_search_next(query, fields, page_size)
+        else:
+            if journal is not None and journal.total is not None:
+                first_results = await asyncio.to_thread(journal.load_page, 1)
+            if first_results is not None:
+                batch, error = {'size': journal.total, 'fields': journal.fields_list, 'results': first_results}, None
+            else:
+                batch, error = await self.async_fofa_search(query, fields, 1, page_size)
+        if error or not batch:
+            meta['error'] = error or "无法获取初始数据"
+            return
+        total = batch.get('size', 0)
+        meta['total'] = total
+        meta['fields_list'] = batch.get('fields') or fields.split(',')
+        if total > limit:
+            meta['fields_list'] = None
+            meta['error'] = f"数据量过大: {total} 条，超过 {limit} 条限制，请缩小查询范围"
+            return
+        if total == 0:
+            meta['error'] = "没有找到匹配的结果"
+            return
+
+        if engine == ENGINE_CURSOR:
+            batch_no = 1
+            while batch:
+                results = batch.get('results', [])
+                if results:
+                    yield batch_no, results
+                next_cursor = batch.get('next')
+                if not results or not next_cursor:
+                    return
+                batch, error = await self.async_fofa_search_next(query, fields, page_size, next_cursor)
+                batch_no += 1
+                if error:
+                    logger.error(f"获取第 {batch_no} 批游标数据失败: {error}")
+                    if page_errors is not None:
+                        page_errors.append((batch_no, error))
+                    return
+            return
+
+        if journal is not None and first_results is None:
+            await asyncio.to_thread(journal.set_totals, total, meta['fields_list'])
+            await asyncio.to_thread(journal.save_page, 1, batch.get('results', []))
+        yield 1, batch.get('results', [])
+
+        total_pages = (total + page_size - 1) // page_size
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def fetch(page):
+            if journal is not None:
+                results = await asyncio.to_thread(journal.load_page, page)
+                if results is not None:
+                    return results, None
+            async with semaphore:
+                page_data, error = await self.async_fofa_search(query, fields, page, page_size)
+            if error:
+                return None, error
+            results = (page_data or {}).get('results', [])
+            if journal is not None:
+                await asyncio.to_thread(journal.save_page, page, results)
+            return results, None
+
+        # 有限的预取窗口，按页码顺序产出
+        window = max(1, max_concurrency) * 2
+        tasks = {}
+        next_page = 2
+        try:
+            for page in range(2, total_pages + 1):
+                while next_page <= total_pages and next_page < page + window:
+                    tasks[next_page] = asyncio.ensure_future(fetch(next_page))
+                    next_page += 1
+                results, error = await tasks.pop(page)
+                if error:
+                    logger.error(f"获取第 {page} 页数据失败: {error}")
+                    if page_errors is not None:
+                        page_errors.append((page, error))
+                    continue
+                yield page, results
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def async_get_all_results(self, query, fields="host,ip,port", page_size=1000,
+                                    max_concurrency=PAGE_FETCH_WORKERS, resume=True, engine=ENGINE_PAGE):
+        # 与 get_all_results 返回值一致
+        journal = await asyncio.to_thread(self._page_journal, query, fields, page_size, resume, engine)
+        meta = {}
+        page_errors = []
+        all_results = None
+        async for _, results in self._async_iter_result_pages(
+            query, fields, page_size, max_concurrency, engine=engine, journal=journal, page_errors=page_errors,
+            meta=meta
+        ):
+            if all_results is None:
+                all_results = ResultStore(meta['fields_list'])
+            all_results.extend(results)
+        if meta.get('error'):
+            fields_list = meta.get('fields_list')
+            return ([] if fields_list is not None else None), fields_list, meta['error'], []
+        failed_pages = self._log_failed_pages(query, page_errors)
+        if journal is not None:
+            await asyncio.to_thread(journal.clear_if_complete)
+        if all_results is None:
+            all_results = ResultStore(meta['fields_list'])
+        logger.info(f"异步全量数据获取完成，共 {len(all_results)} 条记录，列式存储约 {all_results.nbytes() // 1024} KB")
+        log_rate_stats(self.api_key)
+        return all_results, meta['fields_list'], None, failed_pages
+
+    async def async_batch_preview_queries(self, queries, fields="host,ip,port", on_result=None,
+                                          max_concurrency=BATCH_PREVIEW_WORKERS):
+        # on_result 在共享事件循环线程上调用，不能在其中做阻塞操作（如直接刷新界面）
+        groups = {}
+        for i, query in enumerate(queries):
+            query = query.strip()
+            if query:
+                groups.setdefault(normalize_query(query), []).append((i, query))
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency * self.key_count()))
+        outcomes = {}
+        error_by_index = {}
+
+        async def preview(members):
+            async with semaphore:
+                result, error = await self.async_fofa_search(members[0][1], fields, page=1, size=1)
+            total = 0 if error else result.get('size', 0)
+            for i, query in members:
+                outcome = {
+                    'query': query,
+                    'total': total,
+                    'error': error,
+                    'valid': error is None and total <= BATCH_EXPORT_LIMIT and total > 0
+                }
+                outcomes[i] = outcome
+                if error:
+                    error_by_index[i] = f"查询 {i+1}: {query} - 错误: {error}"
+                if on_result:
+                    on_result(i, outcome)
+
+        await asyncio.gather(*(preview(members) for members in groups.values()))
+        log_rate_stats(self.api_key, "异步批量预览 限速调度统计")
+        return [outcomes[i] for i in sorted(outcomes)], [error_by_index[i] for i in sorted(error_by_index)]
+
+    async def _async_export_single_query(self, index, query, fields, page_size, resume=True,
+                                         query_progress_callback=None, engine=ENGINE_PAGE,
+                                         export_format=EXPORT_FORMAT_CSV, zip_sink=None, merger=None):
+        def failed(message, logs):
+            return {'query': query, 'success': False, 'filename': None, 'record_count': 0, 'error': message}, logs
+
+        preview_result, error = await self.async_fofa_search(query, fields, page=1, size=1)
+        if error:
+            return failed(error, [f"查询 {index+1}: {query} - 预览失败: {error}"])
+        total = preview_result.get('size', 0)
+        if total > BATCH_EXPORT_LIMIT:
+            return failed(f"数据量过大: {total}条", [f"查询 {index+1}: {query} - 数据量过大: {total}条"])
+        if total == 0:
+            return failed("没有找到结果", [f"查询 {index+1}: {query} - 没有找到结果"])
+
+        # 页面日志、导出文件和合并去重的读写都放到线程中执行，事件循环只负责网络等待
+        journal = await asyncio.to_thread(self._resume_journal, query, fields, page_size, total, resume, engine)
+
+        page_errors = []
+        meta = {}
+        record_count = 0
+        writer = None
+        target = None
+        full_path = None
+        try:
+            writer_class = get_result_writer(export_format)
+            if merger is not None:
+                filename = None
+            elif zip_sink is not None:
+                filename = zip_sink.reserve_name(query, ext=writer_class.extension)
+            else:
+                filename, full_path = await asyncio.to_thread(self._export_path, query, ext=writer_class.extension)
+
+            def open_writer(fields_list):
+                # ZIP 条目在拿到第一页后才创建，没有数据的查询不会留下空条目
+                nonlocal target
+                target = zip_sink.open_entry(filename) if zip_sink is not None else full_path
+                return writer_class(target, fields_list, query)
+
+            async for _, results in self._async_iter_result_pages(
+                query, fields, page_size, BATCH_PAGE_WORKERS, BATCH_EXPORT_LIMIT,
+                engine=engine, journal=journal, page_errors=page_errors, meta=meta
+            ):
+                if not results:
+                    continue
+                if merger is not None:
+                    await asyncio.to_thread(merger.add_rows, index, meta['fields_list'], results)
+                else:
+                    # 等待 ZIP 写入槽位、压缩和写盘都在线程中进行
+                    if writer is None:
+                        writer = await asyncio.to_thread(open_writer, meta['fields_list'])
+                    await asyncio.to_thread(writer.write_rows, results)
+                record_count += len(results)
+                if query_progress_callback:
+                    query_progress_callback(index, record_count, total)
+        except Exception as e:
+            if isinstance(target, ZipEntryStream):
+                # 中途失败的查询不在 ZIP 中留下不完整的条目
+                target.abort()
+            if writer is not None:
+                await asyncio.to_thread(writer.close)
+                writer = None
+            await asyncio.to_thread(self._discard_export, full_path)
+            return failed(str(e), [f"查询 {index+1}: {query} - 导出失败: {str(e)}"])
+        finally:
+            if writer is not None:
+                await asyncio.to_thread(writer.close)
+            elif isinstance(target, ZipEntryStream):
+                await asyncio.to_thread(target.close)
+
+        logs = [f"查询 {index+1}: {query} - 第{page}页失败: {page_error}" for page, page_error in page_errors]
+        if meta.get('error') or record_count == 0:
+            await asyncio.to_thread(self._discard_export, full_path)
+            message = meta.get('error') or "未获取到任何数据"
+            return failed(message, logs + [f"查询 {index+1}: {query} - {message}"])
+        if journal is not None:
+            await asyncio.to_thread(journal.clear_if_complete)
+        if merger is not None:
+            location = None
+        elif zip_sink is not None:
+            location = filename
+        else:
+            location = self._export_location(filename, full_path)
+        return {
+            'query': query,
+            'success': True,
+            'filename': location,
+            'record_count': record_count,
+            'error': None
+        }, logs
+
+    async def async_batch_export_queries(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None,
+                                         resume=True, max_concurrency=BATCH_EXPORT_WORKERS,
+                                         query_progress_callback=None, engine=ENGINE_PAGE,
+                                         export_format=EXPORT_FORMAT_CSV, zip_sink=None, merger=None):
+        # 与 batch_export_queries 参数和返回值一致，所有查询作为协程在共享事件循环上并发执行
+        total_queries = len(queries)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency * self.key_count()))
+        outcomes = {}
+        query_fractions = {}
+
+        def report_progress():
+            if progress_callback:
+                progress_callback(len(outcomes) + sum(query_fractions.values()), total_queries)
+
+        def on_query_progress(index, fetched, total):
+            query_fractions[index] = min(fetched / total, 1.0) if total else 0.0
+            if query_progress_callback:
+                query_progress_callback(index, fetched, total)
+            report_progress()
+
+        async def run(index, query):
+            async with semaphore:
+                try:
+                    outcome = await self._async_export_single_query(
+                        index, query, fields, page_size, resume, on_query_progress, engine, export_format,
+                        zip_sink, merger
+                    )
+                except Exception as e:
+                    outcome = (
+                        {'query': query, 'success': False, 'filename': None, 'record_count': 0, 'error': str(e)},
+                        [f"查询 {index+1}: {query} - 处理异常: {str(e)}"]
+                    )
+            outcomes[index] = outcome
+            query_fractions.pop(index, None)
+            report_progress()
+
+        if progress_callback:
+            progress_callback(0, total_queries)
+        await asyncio.gather(*(run(i, q.strip()) for i, q in enumerate(queries) if q.strip()))
+
+        export_results, error_logs, exported_files = [], [], []
+        for index in sorted(outcomes):
+            result, logs = outcomes[index]
+            export_results.append(result)
+            error_logs.extend(logs)
+            if result['success'] and result['filename']:
+                exported_files.append(result['filename'])
+        if progress_callback:
+            progress_callback(total_queries, total_queries)
+        log_rate_stats(self.api_key, "异步批量导出 限速调度统计")
+        self.log_key_pool_stats("异步批量导出 密钥池统计")
+        return export_results, error_logs, exported_files
+
+    async def async_batch_export_to_zip(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None,
+                                        resume=True, max_concurrency=BATCH_EXPORT_WORKERS,
+                                        query_progress_callback=None, engine=ENGINE_PAGE,
+                                        export_format=EXPORT_FORMAT_CSV, base_name="batch_export",
+                                        compression=ZIP_BATCH_COMPRESSION, level=ZIP_DEFLATE_LEVEL):
+        filename, zip_path, sink, error = self._create_zip_sink(queries, base_name, compression, level)
+        if error:
+            return None, [], [], error
+        try:
+            export_results, error_logs, exported_files = await self.async_batch_export_queries(
+                queries, fields, page_size, progress_callback, resume, max_concurrency,
+                query_progress_callback, engine, export_format, zip_sink=sink
+            )
+        finally:
+            # 关闭时要写回暂存的条目，放到线程中避免阻塞事件循环
+            await asyncio.to_thread(sink.close)
+        return self._zip_outcome(filename, zip_path, export_results, error_logs, exported_files)
+
+    async def async_batch_export_merged(self, queries, fields="host,ip,port", page_size=10000, progress_callback=None,
+                                        resume=True, max_concurrency=BATCH_EXPORT_WORKERS,
+                                        query_progress_callback=None, engine=ENGINE_PAGE,
+                                        export_format=EXPORT_FORMAT_CSV, key_fields=DEDUP_KEY_FIELDS):
+        jobs = [query.strip() for query in queries]
+        merger = BatchMerger(jobs, key_fields)
+        try:
+            export_results, error_logs, _ = await self.async_batch_export_queries(
+                queries, fields, page_size, progress_callback, resume, max_concurrency,
+                query_progress_callback, engine, export_format, merger=merger
+            )
+            stats = {'rows': merger.total_rows, 'unique': merger.unique_count}
+            if not merger.unique_count:
+                return None, export_results, error_logs, "没有成功导出的查询", stats
+            location, error = await asyncio.to_thread(self._write_merged, merger, jobs, export_format)
+            return location, export_results, error_logs, error, stats
+        finally:
+            await asyncio.to_thread(merger.close)
 
 def main(page: ft.Page):
     # 设置页面属性
@@ -639,6 +4355,34 @@ def main(page: ft.Page):
         width=180,
     )
 
+    # 导出格式
+    export_format_dropdown = ft.Dropdown(
+        label="导出格式",
+        value=EXPORT_FORMAT_CSV,
+        options=[
+            ft.dropdown.Option(EXPORT_FORMAT_CSV, "CSV"),
+            ft.dropdown.Option(EXPORT_FORMAT_CSV_GZIP, "CSV (gzip)"),
+            ft.dropdown.Option(EXPORT_FORMAT_CSV_ZSTD, "CSV (zstd)"),
+            ft.dropdown.Option(EXPORT_FORMAT_NDJSON, "NDJSON"),
+            ft.dropdown.Option(EXPORT_FORMAT_NDJSON_GZIP, "NDJSON (gzip)"),
+            ft.dropdown.Option(EXPORT_FORMAT_NDJSON_ZSTD, "NDJSON (zstd)"),
+            ft.dropdown.Option(EXPORT_FORMAT_PARQUET, "Parquet"),
+            ft.dropdown.Option(EXPORT_FORMAT_ARROW, "Arrow IPC"),
+        ],
+        width=160,
+    )
+
+    # 全量拉取引擎
+    engine_dropdown = ft.Dropdown(
+        label="分页方式",
+        value=ENGINE_PAGE,
+        options=[
+            ft.dropdown.Option(ENGINE_PAGE, "页码分页"),
+            ft.dropdown.Option(ENGINE_CURSOR, "游标分页 (search/next)"),
+        ],
+        width=200,
+    )
+
     # 状态与进度
     status_text = ft.Text("准备就绪", color=ft.colors.BLUE)
     progress_bar = ft.ProgressBar(width=600, visible=False)
@@ -667,8 +4411,11 @@ def main(page: ft.Page):
     too_much_data_dialog = ft.AlertDialog(
         modal=True,
         title=ft.Text("数据量过大警告"),
-        content=ft.Text("数据量超过10万条限制，无法获取全量数据，请缩小查询范围。"),
-        actions=[ft.TextButton("确定", on_click=lambda _: close_too_much_data_dialog())]
+        content=ft.Text("数据量超过10万条限制，无法直接获取全量数据。请缩小查询范围，或使用自动分区导出（按时间、国家、端口切分后合并去重）。"),
+        actions=[
+            ft.TextButton("自动分区导出", on_click=lambda e: partitioned_export(e)),
+            ft.TextButton("确定", on_click=lambda _: close_too_much_data_dialog())
+        ]
     )
 
     def close_too_much_data_dialog():
@@ -712,12 +4459,13 @@ def main(page: ft.Page):
         page.overlay.remove(fields_dialog)
 
     # 批量模式对话框
+    batch_preview_action = ft.TextButton("预览")  # 异步处理器在 batch_preview 定义后绑定
     batch_mode_dialog = ft.AlertDialog(
         modal=True,
         title=ft.Text("批量查询模式"),
         content=ft.Column([], scroll=ft.ScrollMode.AUTO),
         actions=[
-            ft.TextButton("预览", on_click=lambda _: batch_preview()),
+            batch_preview_action,
             ft.TextButton("导出", on_click=lambda _: batch_export()),
             ft.TextButton("关闭", on_click=lambda _: close_batch_mode_dialog())
         ]
@@ -754,10 +4502,20 @@ def main(page: ft.Page):
 
     batch_progress_bar = ft.ProgressBar(width=600, visible=False)
 
+    # 合并去重：所有查询的结果按键字段去重后写成一个文件
+    batch_merge_checkbox = ft.Checkbox(label="合并去重为单个文件", value=False)
+    batch_key_fields = ft.TextField(
+        label="去重字段",
+        value=",".join(DEDUP_KEY_FIELDS),
+        width=260,
+        dense=True,
+    )
+
     def show_batch_mode_dialog():
         batch_mode_dialog.content.controls.clear()
         batch_mode_dialog.content.controls.extend([
             batch_query_field,
+            ft.Row([batch_merge_checkbox, batch_key_fields], spacing=12, wrap=True),
             ft.Container(height=10),
             ft.Text("预览结果:", weight=ft.FontWeight.BOLD),
             ft.Container(
@@ -783,9 +4541,9 @@ def main(page: ft.Page):
         page.update()
         page.overlay.remove(batch_mode_dialog)
 
-    def batch_preview():
-        if not api_key_field.value:
-            update_status("请输入API密钥", ft.colors.RED)
+    async def batch_preview(e=None):
+        if not has_api_key():
+            update_status("请输入API密钥或在密钥池中添加密钥", ft.colors.RED)
             return
         if not batch_query_field.value:
             update_status("请输入批量查询语句", ft.colors.RED)
@@ -794,7 +4552,7 @@ def main(page: ft.Page):
             update_status("请至少选择一个查询字段", ft.colors.RED)
             return
 
-        api_key = api_key_field.value.strip()
+        api_key = (api_key_field.value or "").strip()
         queries = [q.strip() for q in batch_query_field.value.strip().split('\n') if q.strip()]
         fields = ",".join(sorted(selected_fields))
         app.api_key = api_key
@@ -802,35 +4560,61 @@ def main(page: ft.Page):
         batch_preview_results.rows.clear()
         batch_error_logs.value = ""
         batch_error_logs.visible = False
-        page.update()
 
-        update_status("正在批量预览查询...", ft.colors.ORANGE)
-        preview_results, errors = app.batch_preview_queries(queries, fields)
-        for i, result in enumerate(preview_results):
-            status_text = "有效" if result['valid'] else "无效"
-            status_color = ft.colors.GREEN if result['valid'] else ft.colors.RED
-            if result['error']:
-                status_text = f"错误: {result['error']}"
-                status_color = ft.colors.RED
+        # 先为每个查询占位，结果到达后逐行填充
+        total_cells = []
+        status_cells = []
+        for i, query in enumerate(queries):
+            total_text = ft.Text("-")
+            status_cell = ft.Text("查询中...", color=ft.colors.GREY)
+            total_cells.append(total_text)
+            status_cells.append(status_cell)
             batch_preview_results.rows.append(
                 ft.DataRow(
                     cells=[
                         ft.DataCell(ft.Text(str(i + 1))),
-                        ft.DataCell(ft.Text(result['query'], selectable=True)),
-                        ft.DataCell(ft.Text(str(result['total']))),
-                        ft.DataCell(ft.Text(status_text, color=status_color))
+                        ft.DataCell(ft.Text(query, selectable=True)),
+                        ft.DataCell(total_text),
+                        ft.DataCell(status_cell)
                     ]
                 )
             )
+        page.update()
+
+        async def fill_preview_row(i, result):
+            status_text = "有效" if result['valid'] else "无效"
+            status_color = ft.colors.GREEN if result['valid'] else ft.colors.RED
+            if result['error']:
+                status_text = f"错误: {result['error']}"
+                status_color = ft.colors.RED
+            # 合并刷新后只推送这两个单元格
+            throttle.set(total_cells[i], value=str(result['total']))
+            throttle.set(status_cells[i], value=status_text, color=status_color)
+
+        def on_preview_result(i, result):
+            # 回调来自共享事件循环线程，page.update 会等待一次 websocket 往返，
+            # 转交给 Flet 的事件循环执行，不阻塞其他会话的请求
+            page.run_task(fill_preview_row, i, result)
+
+        throttle = ProgressThrottle(page)
+
+        update_status("正在批量预览查询...", ft.colors.ORANGE)
+        # 在共享事件循环上并发预览，不为每个请求占用线程
+        preview_results, errors = await run_on_async_loop(
+            app.async_batch_preview_queries(queries, fields, on_result=on_preview_result)
+        )
+        throttle.flush()
         if errors:
             batch_error_logs.value = "\n".join(errors)
             batch_error_logs.visible = True
         page.update()
         update_status("批量预览完成", ft.colors.GREEN)
 
+    batch_preview_action.on_click = batch_preview
+
     def batch_export():
-        if not api_key_field.value:
-            update_status("请输入API密钥", ft.colors.RED)
+        if not has_api_key():
+            update_status("请输入API密钥或在密钥池中添加密钥", ft.colors.RED)
             return
         if not batch_query_field.value:
             update_status("请输入批量查询语句", ft.colors.RED)
@@ -839,30 +4623,97 @@ def main(page: ft.Page):
             update_status("请至少选择一个查询字段", ft.colors.RED)
             return
 
-        api_key = api_key_field.value.strip()
+        api_key = (api_key_field.value or "").strip()
         queries = [q.strip() for q in batch_query_field.value.strip().split('\n') if q.strip()]
         fields = ",".join(sorted(selected_fields))
+        engine = engine_dropdown.value
+        export_format = export_format_dropdown.value
+        merge = batch_merge_checkbox.value
+        key_fields = [f.strip() for f in (batch_key_fields.value or "").split(",") if f.strip()]
         app.api_key = api_key
 
+        async def run_batch_export(job):
+            # 作为协程任务在共享事件循环上运行，所有查询的等待都不占用线程
+            def on_progress(current, total):
+                job.update(current=current, total=total)
+
+            def on_query_progress(index, fetched, total):
+                job.update_entry('queries', index, (fetched, total))
+
+            if merge:
+                return await app.async_batch_export_merged(
+                    queries, fields, page_size=10000, progress_callback=on_progress,
+                    query_progress_callback=on_query_progress, engine=engine, export_format=export_format,
+                    key_fields=key_fields or DEDUP_KEY_FIELDS
+                )
+            if is_web:
+                # Web 模式下边拉取边写入同一个 ZIP，最后一页写完即可下载
+                return await app.async_batch_export_to_zip(
+                    queries, fields, page_size=10000, progress_callback=on_progress,
+                    query_progress_callback=on_query_progress, engine=engine, export_format=export_format
+                ) + (None,)
+            export_results, error_logs, _ = await app.async_batch_export_queries(
+                queries, fields, page_size=10000, progress_callback=on_progress,
+                query_progress_callback=on_query_progress, engine=engine, export_format=export_format
+            )
+            return None, export_results, error_logs, None, None
+
+        job = submit_job("batch_export", run_batch_export, {'queries': queries, 'merge': merge})
+        if job is None:
+            return
+        page.run_task(finish_batch_export, job.id)
+
+    def fill_batch_rows(queries):
+        # 每个查询一行，导出过程中实时显示各自的进度
+        batch_preview_results.rows.clear()
+        cells = []
+        for i, query in enumerate(queries):
+            count_text = ft.Text("0")
+            status_cell = ft.Text("排队中", color=ft.colors.GREY)
+            cells.append((count_text, status_cell))
+            batch_preview_results.rows.append(
+                ft.DataRow(
+                    cells=[
+                        ft.DataCell(ft.Text(str(i + 1))),
+                        ft.DataCell(ft.Text(query, selectable=True)),
+                        ft.DataCell(count_text),
+                        ft.DataCell(status_cell)
+                    ]
+                )
+            )
+        return cells
+
+    async def finish_batch_export(job_id):
+        snapshot = job_manager.status(job_id)
+        if snapshot is None:
+            return
+        query_cells = fill_batch_rows(snapshot['params']['queries'])
         batch_progress_bar.visible = True
         batch_progress_bar.value = 0
-        batch_preview_results.rows.clear()
         batch_error_logs.value = ""
         batch_error_logs.visible = False
         page.update()
 
-        update_status("正在批量导出数据...", ft.colors.ORANGE)
+        def on_progress(snapshot, throttle):
+            progress = snapshot['progress']
+            if progress.get('total'):
+                throttle.set(batch_progress_bar, value=min(progress['current'] / progress['total'], 1.0))
+            for index, (fetched, total) in progress.get('queries', {}).items():
+                count_text, status_cell = query_cells[index]
+                throttle.set(count_text, value=f"{fetched}/{total}")
+                throttle.set(status_cell, value="导出中", color=ft.colors.ORANGE)
 
-        # 定义进度回调函数
-        def update_batch_progress(current, total):
-            progress = min(current / total, 1.0)
-            batch_progress_bar.value = progress
-            page.update()
-
-        export_results, error_logs, exported_files = app.batch_export_queries(
-            queries, fields, page_size=10000, progress_callback=update_batch_progress
-        )
+        job = await watch_job(job_id, "正在批量导出数据...", on_progress)
+        batch_progress_bar.visible = False
+        if job is None:
+            update_status("批量导出任务已过期", ft.colors.RED)
+            return
+        if job.status == JOB_FAILED:
+            update_status(f"批量导出失败: {job.error}", ft.colors.RED)
+            return
+        download_url, export_results, error_logs, zip_error, merge_stats = job.result
 
+        batch_preview_results.rows.clear()
         for i, result in enumerate(export_results):
             status_text = "成功" if result['success'] else "失败"
             status_color = ft.colors.GREEN if result['success'] else ft.colors.RED
@@ -884,15 +4735,24 @@ def main(page: ft.Page):
             batch_error_logs.value = "\n".join(error_logs)
             batch_error_logs.visible = True
 
-        batch_progress_bar.visible = False
         page.update()
 
         success_count = sum(1 for r in export_results if r['success'])
         total_count = len(export_results)
 
-        if is_web and exported_files:
-            # 打包 ZIP
-            download_url, zip_error = app.create_zip_for_batch(exported_files)
+        if merge_stats is not None:
+            if zip_error:
+                update_status(f"合并导出失败: {zip_error}", ft.colors.RED)
+            else:
+                results_container.visible = True
+                results_title_container.visible = True
+                show_export_result(download_url)
+                update_status(
+                    f"合并导出完成: {success_count}/{total_count} 个查询成功，"
+                    f"原始 {merge_stats['rows']} 条，去重后 {merge_stats['unique']} 条",
+                    ft.colors.GREEN
+                )
+        elif is_web and success_count:
             if zip_error:
                 update_status(f"批量导出完成，但 ZIP 失败: {zip_error}", ft.colors.RED)
             else:
@@ -920,6 +4780,423 @@ def main(page: ft.Page):
         else:
             update_status(f"批量导出完成: {success_count}/{total_count} 个查询成功", ft.colors.GREEN)
 
+    # === 后台任务：提交后记录任务 ID，界面轮询状态；浏览器重连后可凭 ID 取回结果 ===
+    def remember_job(kind, job_id):
+        try:
+            stored = page.client_storage.get(JOB_STORAGE_KEY) or {}
+            stored[kind] = job_id
+            page.client_storage.set(JOB_STORAGE_KEY, stored)
+        except Exception as ex:
+            logger.warning(f"保存任务 ID 失败: {ex}")
+
+    def submit_job(kind, func, params):
+        try:
+            job = job_manager.submit(kind, func, owner=session_id, params=params)
+        except RuntimeError as ex:
+            update_status(str(ex), ft.colors.RED)
+            return None
+        remember_job(kind, job.id)
+        return job
+
+    async def watch_job(job_id, message, on_progress=None):
+        # 轮询直到任务结束；任务已过期时返回 None
+        # on_progress(快照, throttle) 通过 throttle.set 修改控件，只有变化的控件会被推送
+        throttle = ProgressThrottle(page)
+        while True:
+            snapshot = job_manager.status(job_id)
+            if snapshot is None:
+                return None
+            if snapshot['status'] == JOB_QUEUED:
+                throttle.set(status_text, value=f"任务排队中，前面还有 {snapshot['queue_position'] - 1} 个任务",
+                             color=ft.colors.ORANGE)
+            else:
+                if on_progress:
+                    on_progress(snapshot, throttle)
+                throttle.set(status_text, value=message, color=ft.colors.ORANGE)
+            if snapshot['status'] in (JOB_DONE, JOB_FAILED):
+                throttle.flush()
+                return job_manager.get(job_id)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    # === 保存的查询：增量同步到本地快照 ===
+    saved_name_field = ft.TextField(label="名称", width=200, dense=True)
+    saved_queries_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("名称")),
+            ft.DataColumn(ft.Text("查询语句")),
+            ft.DataColumn(ft.Text("上次同步")),
+            ft.DataColumn(ft.Text("快照记录数"), numeric=True),
+            ft.DataColumn(ft.Text("上次增量")),
+            ft.DataColumn(ft.Text("操作")),
+        ],
+        rows=[],
+    )
+    saved_progress_bar = ft.ProgressBar(width=600, visible=False)
+
+    def refresh_saved_queries():
+        saved_queries_table.rows.clear()
+        for entry in saved_query_store.entries():
+            name = entry['name']
+            if entry.get('last_sync'):
+                delta = f"+{entry.get('last_new', 0)} / 更新 {entry.get('last_updated', 0)}"
+            else:
+                delta = "-"
+            saved_queries_table.rows.append(
+                ft.DataRow(
+                    cells=[
+                        ft.DataCell(ft.Text(name)),
+                        ft.DataCell(ft.Text(entry['query'], selectable=True)),
+                        ft.DataCell(ft.Text((entry.get('last_sync') or "从未同步").replace("T", " "))),
+                        ft.DataCell(ft.Text(str(entry.get('record_count', 0)))),
+                        ft.DataCell(ft.Text(delta)),
+                        ft.DataCell(ft.Row([
+                            ft.IconButton(ft.icons.SYNC, tooltip="增量同步", on_click=lambda _, n=name: sync_saved(n)),
+                            ft.IconButton(ft.icons.DOWNLOAD, tooltip="导出快照", on_click=lambda _, n=name: export_saved(n)),
+                            ft.IconButton(ft.icons.DELETE, tooltip="删除", on_click=lambda _, n=name: remove_saved(n)),
+                        ], spacing=0)),
+                    ]
+                )
+            )
+
+    def show_saved_queries_dialog():
+        refresh_saved_queries()
+        page.overlay.append(saved_queries_dialog)
+        saved_queries_dialog.open = True
+        page.update()
+
+    def close_saved_queries_dialog():
+        saved_queries_dialog.open = False
+        page.update()
+        page.overlay.remove(saved_queries_dialog)
+
+    def save_current_query():
+        name = (saved_name_field.value or "").strip()
+        query = (query_field.value or "").strip()
+        if not name or not query:
+            update_status("请填写名称和查询语句", ft.colors.RED)
+            return
+        if not selected_fields:
+            update_status("请至少选择一个查询字段", ft.colors.RED)
+            return
+        saved_query_store.save(name, query, ",".join(sorted(selected_fields)))
+        saved_name_field.value = ""
+        refresh_saved_queries()
+        update_status(f"已保存查询: {name}", ft.colors.GREEN)
+
+    def remove_saved(name):
+        saved_query_store.remove(name)
+        refresh_saved_queries()
+        update_status(f"已删除保存的查询: {name}", ft.colors.GREEN)
+
+    def export_saved(name):
+        location, error = app.export_snapshot(name)
+        if error:
+            update_status(f"导出快照失败: {error}", ft.colors.RED)
+            return
+        results_container.visible = True
+        results_title_container.visible = True
+        show_export_result(location)
+        update_status(f"快照已导出: {name}", ft.colors.GREEN)
+
+    def sync_saved(name):
+        if not has_api_key():
+            update_status("请输入API密钥或在密钥池中添加密钥", ft.colors.RED)
+            return
+        app.api_key = (api_key_field.value or "").strip()
+        engine = engine_dropdown.value
+
+        def run_sync(job):
+            return app.sync_saved_query(
+                name, progress_callback=lambda current, total: job.update(current=current, total=total),
+                engine=engine
+            )
+
+        job = submit_job("sync", run_sync, {'name': name})
+        if job is None:
+            return
+        page.run_task(finish_sync, job.id)
+
+    async def finish_sync(job_id):
+        snapshot = job_manager.status(job_id)
+        if snapshot is None:
+            return
+        name = snapshot['params']['name']
+        saved_progress_bar.visible = True
+        saved_progress_bar.value = None
+        page.update()
+
+        def on_progress(snapshot, throttle):
+            progress = snapshot['progress']
+            if progress.get('total'):
+                throttle.set(saved_progress_bar, value=min(progress['current'] / progress['total'], 1.0))
+
+        job = await watch_job(job_id, f"正在同步: {name}", on_progress)
+        saved_progress_bar.visible = False
+        if job is None:
+            update_status("同步任务已过期", ft.colors.RED)
+            return
+        stats, error = (None, job.error) if job.status == JOB_FAILED else job.result
+        refresh_saved_queries()
+        if error:
+            update_status(f"同步失败: {name} - {error}", ft.colors.RED)
+            return
+        mode = "增量" if stats['incremental'] else "首次全量"
+        message = (f"{mode}同步完成: {name}，拉取 {stats['fetched']} 条，新增 {stats['new']}，"
+                   f"更新 {stats['updated']}，快照共 {stats['record_count']} 条")
+        if stats['page_errors']:
+            update_status(f"{message}；{stats['page_errors']} 页失败，下次同步将重新拉取", ft.colors.ORANGE)
+        else:
+            update_status(message, ft.colors.GREEN)
+
+    saved_queries_dialog = ft.AlertDialog(
+        modal=True,
+        title=ft.Text("保存的查询"),
+        content=ft.Column([
+            ft.Row([
+                saved_name_field,
+                ft.ElevatedButton("保存当前查询", icon=ft.icons.BOOKMARK_ADD, on_click=lambda _: save_current_query()),
+            ], spacing=12),
+            ft.Text("同步时只拉取上次同步以来更新的记录，并按 ip/port/host 合并进本地快照", size=12, color=ft.colors.GREY),
+            ft.Row([saved_queries_table], scroll=ft.ScrollMode.ADAPTIVE),
+            saved_progress_bar,
+        ], scroll=ft.ScrollMode.AUTO, width=700),
+        actions=[
+            ft.TextButton("关闭", on_click=lambda _: close_saved_queries_dialog())
+        ]
+    )
+
+    # === 密钥池：多个账号的密钥按预计等待时间轮询，仅桌面模式可用 ===
+    def has_api_key():
+        if (api_key_field.value or "").strip():
+            return True
+        return app.use_key_pool and not is_web and get_key_pool().usable_count() > 0
+
+    key_pool_checkbox = ft.Checkbox(
+        label="使用密钥池轮询（池中没有可用密钥时使用上方填写的密钥）", value=app.use_key_pool,
+        on_change=lambda e: setattr(app, 'use_key_pool', bool(e.control.value))
+    )
+    pool_key_field = ft.TextField(label="API密钥", width=260, dense=True, password=True, can_reveal_password=True)
+    pool_label_field = ft.TextField(label="备注（账号）", width=160, dense=True)
+    key_pool_info_text = ft.Text("", size=12, color=ft.colors.GREY)
+    key_pool_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("备注")),
+            ft.DataColumn(ft.Text("密钥")),
+            ft.DataColumn(ft.Text("状态")),
+            ft.DataColumn(ft.Text("剩余F点"), numeric=True),
+            ft.DataColumn(ft.Text("剩余查询次数"), numeric=True),
+            ft.DataColumn(ft.Text("请求数"), numeric=True),
+            ft.DataColumn(ft.Text("出错"), numeric=True),
+            ft.DataColumn(ft.Text("操作")),
+        ],
+        rows=[],
+    )
+    status_colors = {"可用": ft.colors.GREEN, "暂停": ft.colors.ORANGE, "已耗尽": ft.colors.RED}
+
+    def refresh_key_pool():
+        pool = get_key_pool()
+        key_pool_table.rows.clear()
+        for entry in pool.entries():
+            key = entry['key']
+            key_pool_table.rows.append(
+                ft.DataRow(cells=[
+                    ft.DataCell(ft.Text(entry['label'] or "-")),
+                    ft.DataCell(ft.Text(entry['masked'])),
+                    ft.DataCell(ft.Text(entry['status'], color=status_colors[entry['status']],
+                                        tooltip=entry['last_error'] or None)),
+                    ft.DataCell(ft.Text("-" if entry['remaining'] is None else str(entry['remaining']))),
+                    ft.DataCell(ft.Text("-" if entry['remaining_queries'] is None else str(entry['remaining_queries']))),
+                    ft.DataCell(ft.Text(str(entry['requests']))),
+                    ft.DataCell(ft.Text(str(entry['errors']))),
+                    ft.DataCell(ft.Row([
+                        ft.IconButton(ft.icons.REFRESH, tooltip="查询额度", on_click=lambda _, k=key: refresh_pool_quota([k])),
+                        ft.IconButton(ft.icons.RESTART_ALT, tooltip="重新启用", on_click=lambda _, k=key: reset_pool_key(k)),
+                        ft.IconButton(ft.icons.DELETE, tooltip="删除", on_click=lambda _, k=key: remove_pool_key(k)),
+                    ], spacing=0)),
+                ])
+            )
+        key_pool_info_text.value = f"共 {len(pool)} 个密钥，可用 {pool.usable_count()} 个"
+
+    def show_key_pool_dialog():
+        if is_web:
+            return
+        refresh_key_pool()
+        page.overlay.append(key_pool_dialog)
+        key_pool_dialog.open = True
+        page.update()
+
+    def close_key_pool_dialog():
+        key_pool_dialog.open = False
+        page.update()
+        page.overlay.remove(key_pool_dialog)
+
+    def add_pool_key():
+        key = (pool_key_field.value or "").strip()
+        if not key:
+            update_status("请输入要添加的API密钥", ft.colors.RED)
+            return
+        try:
+            get_key_pool().add(key, (pool_label_field.value or "").strip())
+        except Exception as ex:
+            logger.error(f"保存密钥池失败: {ex}")
+            update_status(f"保存密钥池失败: {str(ex)}", ft.colors.RED)
+            return
+        pool_key_field.value = ""
+        pool_label_field.value = ""
+        refresh_key_pool()
+        update_status("密钥已加入密钥池", ft.colors.GREEN)
+        refresh_pool_quota([key])
+
+    def remove_pool_key(key):
+        get_key_pool().remove(key)
+        refresh_key_pool()
+        update_status(f"已从密钥池删除 {mask_api_key(key)}", ft.colors.GREEN)
+
+    def reset_pool_key(key):
+        get_key_pool().reset(key)
+        refresh_key_pool()
+        page.update()
+
+    def refresh_pool_quota(keys=None):
+        pool = get_key_pool()
+        keys = keys if keys is not None else [entry['key'] for entry in pool.entries()]
+
+        async def run():
+            errors = []
+            for key in keys:
+                error = await asyncio.to_thread(pool.refresh_quota, key)
+                if error:
+                    errors.append(f"{mask_api_key(key)}: {error}")
+            refresh_key_pool()
+            if errors:
+                update_status("查询额度失败: " + "；".join(errors), ft.colors.ORANGE)
+            else:
+                update_status("密钥额度已更新", ft.colors.GREEN)
+
+        page.run_task(run)
+
+    key_pool_dialog = ft.AlertDialog(
+        modal=True,
+        title=ft.Text("密钥池"),
+        content=ft.Column([
+            key_pool_checkbox,
+            ft.Row([
+                pool_key_field,
+                pool_label_field,
+                ft.ElevatedButton("添加", icon=ft.icons.ADD, on_click=lambda _: add_pool_key()),
+                ft.TextButton("刷新全部额度", icon=ft.icons.REFRESH, on_click=lambda _: refresh_pool_quota()),
+            ], spacing=12, wrap=True),
+            ft.Text("每个密钥独立限速，请求分给排队最短的密钥；额度耗尽或失效的密钥自动停用，连续出错的密钥暂停一段时间",
+                    size=12, color=ft.colors.GREY),
+            key_pool_info_text,
+            ft.Row([key_pool_table], scroll=ft.ScrollMode.ADAPTIVE),
+        ], scroll=ft.ScrollMode.AUTO, width=800),
+        actions=[
+            ft.TextButton("关闭", on_click=lambda _: close_key_pool_dialog())
+        ]
+    )
+
+    # === 本地资产库：按 ip/port/host/domain 查找历史拉取过的资产 ===
+    asset_record_checkbox = ft.Checkbox(
+        label="记录查询结果到资产库", value=app.use_asset_db,
+        on_change=lambda e: setattr(app, 'use_asset_db', bool(e.control.value))
+    )
+    asset_ip_field = ft.TextField(label="IP（以 . 结尾按网段前缀）", width=200, dense=True)
+    asset_port_field = ft.TextField(label="端口", width=90, dense=True)
+    asset_host_field = ft.TextField(label="主机", width=200, dense=True)
+    asset_domain_field = ft.TextField(label="域名（含子域名）", width=180, dense=True)
+    asset_query_field = ft.TextField(label="来源查询包含", width=200, dense=True)
+    asset_info_text = ft.Text("", size=12, color=ft.colors.GREY)
+    asset_table = ft.DataTable(
+        columns=[
+            ft.DataColumn(ft.Text("ip")),
+            ft.DataColumn(ft.Text("port"), numeric=True),
+            ft.DataColumn(ft.Text("host")),
+            ft.DataColumn(ft.Text("domain")),
+            ft.DataColumn(ft.Text("首次发现")),
+            ft.DataColumn(ft.Text("最近发现")),
+            ft.DataColumn(ft.Text("命中的查询")),
+        ],
+        rows=[],
+    )
+
+    def format_seen(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+    def refresh_asset_stats():
+        asset_db = get_asset_db()
+        if asset_db is None:
+            asset_info_text.value = "资产库不可用"
+            return
+        stats = asset_db.stats()
+        asset_info_text.value = f"资产库共 {stats['assets']} 个资产，来自 {stats['queries']} 条查询"
+
+    def search_assets():
+        asset_db = get_asset_db()
+        if asset_db is None:
+            update_status("资产库不可用", ft.colors.RED)
+            return
+        port = (asset_port_field.value or "").strip()
+        if port and not port.isdigit():
+            update_status("端口必须是数字", ft.colors.RED)
+            return
+        # 先等待队列中尚未落盘的页面写入，保证刚拉取的结果可以查到
+        asset_db.flush()
+        started = time.perf_counter()
+        total, assets = asset_db.search(
+            ip=(asset_ip_field.value or "").strip() or None,
+            port=port or None,
+            host=(asset_host_field.value or "").strip() or None,
+            domain=(asset_domain_field.value or "").strip() or None,
+            query=(asset_query_field.value or "").strip() or None,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        asset_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(asset['ip'], selectable=True)),
+                ft.DataCell(ft.Text(str(asset['port']))),
+                ft.DataCell(ft.Text(asset['host'], selectable=True)),
+                ft.DataCell(ft.Text(asset['domain'])),
+                ft.DataCell(ft.Text(format_seen(asset['first_seen']))),
+                ft.DataCell(ft.Text(format_seen(asset['last_seen']))),
+                ft.DataCell(ft.Text("\n".join(asset['queries']), selectable=True)),
+            ])
+            for asset in assets
+        ]
+        shown = f"，显示最近的 {len(assets)} 条" if total > len(assets) else ""
+        asset_info_text.value = f"匹配 {total} 个资产{shown}，耗时 {elapsed:.1f} ms"
+        page.update()
+
+    def show_asset_db_dialog():
+        refresh_asset_stats()
+        page.overlay.append(asset_db_dialog)
+        asset_db_dialog.open = True
+        page.update()
+
+    def close_asset_db_dialog():
+        asset_db_dialog.open = False
+        page.update()
+        page.overlay.remove(asset_db_dialog)
+
+    asset_db_dialog = ft.AlertDialog(
+        modal=True,
+        title=ft.Text("资产库"),
+        content=ft.Column([
+            asset_record_checkbox,
+            ft.Row([asset_ip_field, asset_port_field, asset_host_field], spacing=12, wrap=True),
+            ft.Row([
+                asset_domain_field,
+                asset_query_field,
+                ft.ElevatedButton("搜索", icon=ft.icons.SEARCH, on_click=lambda _: search_assets()),
+            ], spacing=12, wrap=True),
+            asset_info_text,
+            ft.Row([asset_table], scroll=ft.ScrollMode.ADAPTIVE),
+        ], scroll=ft.ScrollMode.AUTO, width=800),
+        actions=[
+            ft.TextButton("关闭", on_click=lambda _: close_asset_db_dialog())
+        ]
+    )
+
     def update_status(message, color=ft.colors.BLUE):
         status_text.value = message
         status_text.color = color
@@ -1037,7 +5314,7 @@ def main(page: ft.Page):
                     alignment=ft.alignment.center
                 )
             )
-        if total_results > 100000:
+        if total_results > FULL_FETCH_LIMIT:
             results_container.content.controls.append(
                 ft.Container(
                     content=ft.Row([
@@ -1053,6 +5330,127 @@ def main(page: ft.Page):
             )
         page.update()
 
+    def build_results_browser(store, fields_list):
+        # 分页浏览全量结果：表格中只保留当前页的行，翻页时只推送表格和分页栏
+        pager = ResultPager(store)
+        data_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text("序号", weight=ft.FontWeight.BOLD), numeric=True),
+                *[ft.DataColumn(ft.Text(field, weight=ft.FontWeight.BOLD)) for field in fields_list]
+            ],
+            rows=[],
+            border=ft.border.all(1, ft.colors.GREY_300),
+            heading_row_color=ft.colors.BLUE_GREY_100,
+            data_row_max_height=100,
+        )
+        page_label = ft.Text(size=13)
+        first_button = ft.IconButton(ft.icons.FIRST_PAGE, tooltip="首页", on_click=lambda _: go_to(0))
+        prev_button = ft.IconButton(ft.icons.CHEVRON_LEFT, tooltip="上一页", on_click=lambda _: go_to(pager.page - 1))
+        next_button = ft.IconButton(ft.icons.CHEVRON_RIGHT, tooltip="下一页", on_click=lambda _: go_to(pager.page + 1))
+        last_button = ft.IconButton(ft.icons.LAST_PAGE, tooltip="末页", on_click=lambda _: go_to(pager.page_count - 1))
+        jump_field = ft.TextField(label="跳转到页", width=100, dense=True, on_submit=lambda e: jump())
+        page_size_dropdown = ft.Dropdown(
+            label="每页行数",
+            width=110,
+            dense=True,
+            value=str(pager.page_size),
+            options=[ft.dropdown.Option(str(size)) for size in RESULTS_PAGE_SIZES],
+            on_change=lambda e: change_page_size(),
+        )
+        pager_row = ft.Row(
+            [first_button, prev_button, page_label, next_button, last_button, jump_field, page_size_dropdown],
+            spacing=8,
+            wrap=True,
+            vertical_alignment=ft.CrossAxisAlignment.CENTER,
+        )
+
+        # 筛选与排序在内存索引上完成，结果作为行号视图交给分页器
+        index = ResultIndex(store)
+        filter_field = ft.TextField(
+            label="筛选",
+            hint_text="关键词  字段:子串  字段=值  port>=8000  lastupdatetime>=2024-01-01",
+            expand=True,
+            dense=True,
+            on_submit=lambda e: apply_filter(),
+        )
+        sort_dropdown = ft.Dropdown(
+            label="排序字段",
+            width=160,
+            dense=True,
+            value="",
+            options=[ft.dropdown.Option("", "原始顺序")] + [ft.dropdown.Option(field) for field in fields_list],
+        )
+        descending_checkbox = ft.Checkbox(label="降序", value=False)
+        filter_info = ft.Text(size=12, color=ft.colors.GREY)
+        filter_row = ft.Row(
+            [
+                filter_field,
+                sort_dropdown,
+                descending_checkbox,
+                ft.ElevatedButton("应用", icon=ft.icons.FILTER_ALT, on_click=lambda _: apply_filter()),
+            ],
+            spacing=8,
+            wrap=True,
+            vertical_alignment=ft.CrossAxisAlignment.CENTER,
+        )
+
+        def render(push=True):
+            data_table.rows = [
+                ft.DataRow(
+                    cells=[
+                        ft.DataCell(ft.Text(str(index + 1), weight=ft.FontWeight.BOLD)),
+                        *[ft.DataCell(ft.Text(value, selectable=True)) for value in row]
+                    ],
+                    color=ft.colors.BLUE_GREY_50 if index % 2 == 1 else None
+                ) for index, row in pager.window()
+            ]
+            page_label.value = f"第 {pager.page + 1} / {pager.page_count} 页，共 {len(pager)} 条"
+            first_button.disabled = prev_button.disabled = pager.page == 0
+            next_button.disabled = last_button.disabled = pager.page >= pager.page_count - 1
+            if push:
+                page.update(data_table, pager_row)
+
+        def go_to(target):
+            pager.set_page(target)
+            render()
+
+        def jump():
+            try:
+                go_to(int(jump_field.value) - 1)
+            except (TypeError, ValueError):
+                pass
+
+        def change_page_size():
+            pager.set_page_size(int(page_size_dropdown.value))
+            render()
+
+        def apply_filter():
+            start = time.perf_counter()
+            try:
+                rows = index.search(filter_field.value or "", sort_dropdown.value or None, descending_checkbox.value)
+            except ValueError as ex:
+                filter_info.value = str(ex)
+                filter_info.color = ft.colors.RED
+                page.update(filter_info)
+                return
+            pager.set_rows(rows)
+            filter_info.value = f"匹配 {len(pager)} / {len(store)} 条，用时 {(time.perf_counter() - start) * 1000:.0f} ms"
+            filter_info.color = ft.colors.GREY
+            render(push=False)
+            page.update(data_table, pager_row, filter_info)
+
+        render(push=False)
+        table_container = ft.Container(
+            content=ft.Row(controls=[data_table], scroll=ft.ScrollMode.ADAPTIVE, expand=False),
+            padding=10,
+            bgcolor=ft.colors.WHITE,
+            border_radius=5,
+            border=ft.border.all(1, ft.colors.GREY_200),
+            shadow=ft.BoxShadow(spread_radius=1, blur_radius=2, color=ft.colors.GREY_300, offset=ft.Offset(0, 1)),
+            width=min(2000, page.width - 100) if page.width else 2000,
+        )
+        return ft.Column([filter_row, filter_info, pager_row, table_container], spacing=10)
+
     def show_full_results(count):
         results_container.content.controls.clear()
         success_card = ft.Card(
@@ -1070,6 +5468,13 @@ def main(page: ft.Page):
             elevation=2
         )
         results_container.content.controls.append(success_card)
+        if count:
+            results_container.content.controls.append(
+                ft.Container(
+                    content=build_results_browser(app.results_data, app.fields_list),
+                    margin=ft.margin.only(top=10)
+                )
+            )
 
         if is_web:
             # Web 模式：提示导出后生成链接
@@ -1119,7 +5524,7 @@ def main(page: ft.Page):
                             content=ft.Column([
                                 ft.Text("点击下方按钮下载文件:", size=14),
                                 ft.ElevatedButton(
-                                    "下载 CSV",
+                                    "下载文件",
                                     icon=ft.icons.DOWNLOAD,
                                     url=download_url,
                                     style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
@@ -1173,8 +5578,8 @@ def main(page: ft.Page):
         page.update()
 
     def preview_search(e):
-        if not api_key_field.value:
-            update_status("请输入API密钥", ft.colors.RED)
+        if not has_api_key():
+            update_status("请输入API密钥或在密钥池中添加密钥", ft.colors.RED)
             return
         if not query_field.value:
             update_status("请输入查询语句", ft.colors.RED)
@@ -1183,7 +5588,7 @@ def main(page: ft.Page):
             update_status("请至少选择一个查询字段", ft.colors.RED)
             return
 
-        api_key = api_key_field.value.strip()
+        api_key = (api_key_field.value or "").strip()
         query = query_field.value.strip()
         fields = ",".join(sorted(selected_fields))
         app.api_key = api_key
@@ -1213,11 +5618,11 @@ def main(page: ft.Page):
         show_preview_results(result, query, fields)
         update_status("预览数据获取成功", ft.colors.GREEN)
 
-    def full_search(e):
+    async def full_search(e):
         if not app.current_query:
             update_status("请先获取预览数据", ft.colors.RED)
             return
-        if app.total_results > 100000:
+        if app.total_results > FULL_FETCH_LIMIT:
             page.overlay.append(too_much_data_dialog)
             too_much_data_dialog.open = True
             page.update()
@@ -1233,16 +5638,36 @@ def main(page: ft.Page):
             return
 
         app.page_size = page_size
+        query, fields, engine = app.current_query, app.current_fields, engine_dropdown.value
+
+        async def run_full_search(job):
+            return await app.async_get_all_results(query, fields, page_size, engine=engine)
+
+        job = submit_job("full_search", run_full_search, {'query': query, 'fields': fields})
+        if job is None:
+            return
+        await finish_full_search(job.id)
+
+    async def finish_full_search(job_id):
         results_container.visible = True
         results_title_container.visible = True
-        page.update()
-
         progress_bar.visible = True
-        update_status("正在获取全量数据...", ft.colors.ORANGE)
+        progress_bar.value = None
         page.update()
 
-        all_data, fields_list, error = app.get_all_results(app.current_query, app.current_fields, app.page_size)
+        job = await watch_job(job_id, "正在获取全量数据...")
         progress_bar.visible = False
+        if job is None:
+            update_status("全量获取任务已过期", ft.colors.RED)
+            return
+        if job.status == JOB_FAILED:
+            all_data, fields_list, error, failed_pages = None, None, job.error, []
+        elif job.result_taken:
+            update_status("全量获取的结果已被取回，请重新获取", ft.colors.RED)
+            return
+        else:
+            # 结果集可能很大，交给界面后任务不再保留
+            all_data, fields_list, error, failed_pages = job.take_result()
 
         if error:
             update_status(f"获取全量数据失败: {error}", ft.colors.RED)
@@ -1271,42 +5696,200 @@ def main(page: ft.Page):
             page.update()
             return
 
+        # 重连后恢复的任务也要还原查询条件，之后的导出才能对应上
+        app.current_query = job.params['query']
+        app.current_fields = job.params['fields']
         app.results_data = all_data
         app.fields_list = fields_list
         show_full_results(len(all_data))
+        if failed_pages:
+            update_status(
+                f"全量数据不完整：{describe_failed_pages(failed_pages)}拉取失败，已获取 {len(all_data)} 条，"
+                f"重新获取时只补拉失败的页", ft.colors.ORANGE
+            )
+            return
         update_status("全量数据获取成功", ft.colors.GREEN)
 
-    def export_results(e):
+    def describe_failed_pages(failed_pages, shown=10):
+        pages_text = ", ".join(str(p) for p in failed_pages[:shown])
+        more = f" 等 {len(failed_pages)} 页" if len(failed_pages) > shown else ""
+        return f"第 {pages_text} 页{more}"
+
+    async def export_results(e):
         if not app.results_data:
             update_status("没有数据可导出", ft.colors.RED)
             return
 
+        data, fields_list, query = app.results_data, app.fields_list, app.current_query
+        export_format = export_format_dropdown.value
+        total_records = len(data)
+
+        def run_export(job):
+            return app.export_to_csv(
+                data, fields_list, query,
+                progress_callback=lambda current: job.update(current=current, total=total_records),
+                export_format=export_format
+            )
+
+        job = submit_job("export", run_export, {'query': query})
+        if job is None:
+            return
+        await finish_export(job.id)
+
+    async def finish_export(job_id):
         results_container.visible = True
         results_title_container.visible = True
         progress_bar.visible = True
         progress_bar.value = 0
         page.update()
 
-        update_status("正在导出数据...", ft.colors.ORANGE)
+        def on_progress(snapshot, throttle):
+            progress = snapshot['progress']
+            if progress.get('total'):
+                throttle.set(progress_bar, value=min(progress['current'] / progress['total'], 1.0))
+
+        job = await watch_job(job_id, "正在导出数据...", on_progress)
+        progress_bar.visible = False
+        if job is None:
+            update_status("导出任务已过期", ft.colors.RED)
+            return
+        filename, error = (None, job.error) if job.status == JOB_FAILED else job.result
+
+        if error:
+            update_status(f"导出失败: {error}", ft.colors.RED)
+            return
 
-        # 模拟进度更新
-        total_records = len(app.results_data)
-        chunk_size = max(1, total_records // 100)  # 最多100次进度更新
+        show_export_result(filename)
+        update_status("导出成功", ft.colors.GREEN)
 
-        def update_progress(current):
-            progress = min(current / total_records, 1.0)
-            progress_bar.value = progress
+    def fetch_and_export_results(e):
+        if not app.current_query:
+            update_status("请先获取预览数据", ft.colors.RED)
+            return
+        if app.total_results > FULL_FETCH_LIMIT:
+            page.overlay.append(too_much_data_dialog)
+            too_much_data_dialog.open = True
             page.update()
+            return
+
+        try:
+            page_size = int(page_size_field.value or "1000")
+            if not (1 <= page_size <= 10000):
+                update_status("每页结果数量必须在1-10000之间", ft.colors.RED)
+                return
+        except ValueError:
+            update_status("请输入有效的数字", ft.colors.RED)
+            return
+
+        app.page_size = page_size
+        query, fields = app.current_query, app.current_fields
+        engine, export_format = engine_dropdown.value, export_format_dropdown.value
+
+        def run_fetch_export(job):
+            return app.fetch_and_export(
+                query, fields, page_size,
+                progress_callback=lambda current, total: job.update(current=current, total=total),
+                engine=engine, export_format=export_format
+            )
+
+        job = submit_job("fetch_export", run_fetch_export, {'query': query})
+        if job is None:
+            return
+        page.run_task(finish_fetch_export, job.id)
+
+    def update_job_progress(snapshot, throttle):
+        # 总数未知时显示不确定进度
+        progress = snapshot['progress']
+        if 'current' in progress:
+            total = progress.get('total')
+            throttle.set(progress_bar, value=min(progress['current'] / total, 1.0) if total else None)
 
-        filename, error = app.export_to_csv(app.results_data, app.fields_list, app.current_query, progress_callback=update_progress)
+    async def finish_fetch_export(job_id):
+        results_container.visible = True
+        results_title_container.visible = True
+        progress_bar.visible = True
+        progress_bar.value = 0
+        page.update()
+
+        job = await watch_job(job_id, "正在获取并导出数据...", update_job_progress)
         progress_bar.visible = False
+        if job is None:
+            update_status("导出任务已过期", ft.colors.RED)
+            return
+        filename, record_count, error, failed_pages = (
+            (None, 0, job.error, []) if job.status == JOB_FAILED else job.result
+        )
 
         if error:
-            update_status(f"导出失败: {error}", ft.colors.RED)
+            update_status(f"获取并导出失败: {error}", ft.colors.RED)
             return
 
         show_export_result(filename)
-        update_status("导出成功", ft.colors.GREEN)
+        if failed_pages:
+            update_status(
+                f"导出不完整：{describe_failed_pages(failed_pages)}拉取失败，已导出 {record_count} 条",
+                ft.colors.ORANGE
+            )
+            return
+        update_status(f"获取并导出成功，共 {record_count} 条记录", ft.colors.GREEN)
+
+    def partitioned_export(e):
+        close_too_much_data_dialog()
+        try:
+            page_size = int(page_size_field.value or "1000")
+            if not (1 <= page_size <= 10000):
+                update_status("每页结果数量必须在1-10000之间", ft.colors.RED)
+                return
+        except ValueError:
+            update_status("请输入有效的数字", ft.colors.RED)
+            return
+
+        app.page_size = page_size
+        query, fields = app.current_query, app.current_fields
+        engine, export_format = engine_dropdown.value, export_format_dropdown.value
+
+        def run_partitioned_export(job):
+            return app.export_partitioned(
+                query, fields, page_size,
+                progress_callback=lambda current, total: job.update(current=current, total=total),
+                engine=engine, export_format=export_format
+            )
+
+        job = submit_job("partitioned_export", run_partitioned_export, {'query': query})
+        if job is None:
+            return
+        page.run_task(finish_partitioned_export, job.id)
+
+    async def finish_partitioned_export(job_id):
+        results_container.visible = True
+        results_title_container.visible = True
+        progress_bar.visible = True
+        progress_bar.value = None
+        page.update()
+
+        # 切分阶段还不知道总量，进度条保持不确定状态
+        job = await watch_job(job_id, "正在切分查询并分区导出...", update_job_progress)
+        progress_bar.visible = False
+        if job is None:
+            update_status("分区导出任务已过期", ft.colors.RED)
+            return
+        if job.status == JOB_FAILED:
+            filename, record_count, error, failures = None, 0, job.error, []
+        else:
+            filename, record_count, error, failures = job.result
+
+        if error:
+            update_status(f"分区导出失败: {error}", ft.colors.RED)
+            return
+
+        show_export_result(filename)
+        if failures:
+            update_status(
+                f"分区导出不完整：{len(failures)} 处拉取失败，已导出 {record_count} 条。首个错误: {failures[0]}",
+                ft.colors.ORANGE
+            )
+            return
+        update_status(f"分区导出成功，去重后共 {record_count} 条记录", ft.colors.GREEN)
 
     def save_api_key_handler(e):
         key = api_key_field.value.strip()
@@ -1339,6 +5922,12 @@ def main(page: ft.Page):
         on_click=export_results,
         style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8), elevation=2)
     )
+    fetch_export_button = ft.ElevatedButton(
+        "获取并导出",
+        icon=ft.icons.CLOUD_DOWNLOAD,
+        on_click=fetch_and_export_results,
+        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8), elevation=2)
+    )
     save_key_button = ft.ElevatedButton(
         "保存密钥",
         icon=ft.icons.SAVE,
@@ -1357,15 +5946,36 @@ def main(page: ft.Page):
         on_click=lambda _: show_batch_mode_dialog(),
         style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8), elevation=2)
     )
+    saved_queries_button = ft.ElevatedButton(
+        "保存的查询",
+        icon=ft.icons.BOOKMARKS,
+        on_click=lambda _: show_saved_queries_dialog(),
+        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8), elevation=2)
+    )
+
+    key_pool_button = ft.ElevatedButton(
+        "密钥池",
+        icon=ft.icons.KEY,
+        on_click=lambda _: show_key_pool_dialog(),
+        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8), elevation=2),
+        visible=not is_web
+    )
+    asset_db_button = ft.ElevatedButton(
+        "资产库",
+        icon=ft.icons.STORAGE,
+        on_click=lambda _: show_asset_db_dialog(),
+        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8), elevation=2)
+    )
 
     # === 优化布局：左右分栏 ===
     left_panel = ft.Container(
         content=ft.Column([
             api_key_field,
             query_field,
-            ft.Row([page_size_field, save_key_button], spacing=12),
-            ft.Row([preview_button, full_search_button, export_button], spacing=12, wrap=True),
-            ft.Row([batch_mode_button, fields_button], spacing=12),
+            ft.Row([page_size_field, save_key_button, key_pool_button], spacing=12, wrap=True),
+            ft.Row([engine_dropdown, export_format_dropdown], spacing=12, wrap=True),
+            ft.Row([preview_button, full_search_button, export_button, fetch_export_button], spacing=12, wrap=True),
+            ft.Row([batch_mode_button, saved_queries_button, asset_db_button, fields_button], spacing=12, wrap=True),
             status_text,
             progress_bar,
         ], spacing=16),
@@ -1410,6 +6020,30 @@ def main(page: ft.Page):
         )
     )
 
+    async def restore_jobs():
+        # 浏览器重连（新会话）后按保存的任务 ID 恢复进度轮询或直接展示结果
+        try:
+            stored = page.client_storage.get(JOB_STORAGE_KEY) or {}
+        except Exception as ex:
+            logger.warning(f"读取任务 ID 失败: {ex}")
+            return
+        finishers = {
+            "full_search": finish_full_search,
+            "export": finish_export,
+            "batch_export": finish_batch_export,
+            "fetch_export": finish_fetch_export,
+            "partitioned_export": finish_partitioned_export,
+            "sync": finish_sync,
+        }
+        jobs = [job_manager.get(job_id) for kind, job_id in stored.items() if kind in finishers]
+        for job in sorted((job for job in jobs if job is not None), key=lambda job: job.created_at):
+            if job.result_taken:
+                # 结果已在之前的页面中展示并释放
+                continue
+            page.run_task(finishers[job.kind], job.id)
+
+    page.run_task(restore_jobs)
+
 
 if __name__ == "__main__":
     # 检查命令行参数
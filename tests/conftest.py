@@ -0,0 +1,36 @@
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 先配置根日志器，main 导入时的 basicConfig 就不会生效：测试日志只输出到终端并由 pytest 捕获，
+# 不会写入仓库根目录下的 fofa_gui.log
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+import main  # noqa: E402
+from fofa_stub import FofaStub  # noqa: E402
+
+
+@pytest.fixture
+def fofa_stub(monkeypatch):
+    stub = FofaStub().start()
+    main.configure_http_client(base_url=stub.url)
+    # 测试不等待真实的限速间隔
+    monkeypatch.setattr(main, "rate_scheduler", main.RateLimitScheduler(rate=1000, capacity=100))
+    yield stub
+    main.configure_http_client()
+    stub.stop()
+
+
+@pytest.fixture
+def app(fofa_stub, tmp_path, monkeypatch):
+    # 导出文件、页面日志等都写在临时目录中
+    monkeypatch.chdir(tmp_path)
+    instance = main.FofaGUIApp()
+    instance.api_key = "test-key"
+    instance.use_cache = False
+    instance.use_key_pool = False
+    return instance
@@ -0,0 +1,105 @@
+"""本地模拟的 FOFA API，供测试在不访问外网的情况下驱动分页、游标和密钥池逻辑。"""
+import base64
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def make_rows(count, start=0):
+    return [[f"h{i}.example.com", f"10.0.{i // 256 % 256}.{i % 256}", str(80 + i % 3)] for i in range(start, start + count)]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self._send(self.server.stub.handle(url.path, params))
+
+    def _send(self, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FofaStub:
+    """按查询语句返回预设结果。
+
+    datasets 以查询语句为键保存行数据；resolver 可替换为函数，按查询语句动态返回行。
+    key_errors 让指定密钥的所有请求返回 FOFA 的错误码，page_errors 让指定 (查询, 页码) 返回错误。
+    fields 不为 None 时在搜索结果中附带该字段列表，模拟返回的列顺序与请求不同的情况。
+    """
+
+    def __init__(self):
+        self.datasets = {}
+        self.resolver = None
+        self.key_errors = {}
+        self.page_errors = set()
+        self.fields = None
+        self.account = {"fofa_point": 1000, "remain_api_query": 100}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._httpd.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def keys_used(self):
+        with self._lock:
+            return [params.get("key") for _, params in self.requests]
+
+    @staticmethod
+    def error(errno, errmsg):
+        return {"error": True, "errno": errno, "errmsg": f"[{errno}] {errmsg}"}
+
+    def rows_for(self, query):
+        if self.resolver is not None:
+            return self.resolver(query)
+        return self.datasets.get(query, [])
+
+    def handle(self, path, params):
+        with self._lock:
+            self.requests.append((path, params))
+        key = params.get("key")
+        if key in self.key_errors:
+            return self.error(*self.key_errors[key])
+        if path == "/api/v1/info/my":
+            return dict(self.account, error=False)
+        query = base64.b64decode(params["qbase64"]).decode("utf-8")
+        rows = self.rows_for(query)
+        size = int(params["size"])
+        if path == "/api/v1/search/all":
+            page = int(params["page"])
+            start = (page - 1) * size
+        else:
+            start = int(params.get("next") or 0)
+            page = start // size + 1
+        if (query, page) in self.page_errors:
+            return self.error(50000, "模拟的页面错误")
+        batch = rows[start:start + size]
+        body = {"error": False, "size": len(rows), "page": page, "results": batch, "consumed_fpoint": len(batch)}
+        if self.fields is not None:
+            body["fields"] = self.fields
+        if path == "/api/v1/search/next":
+            body["next"] = str(start + size) if start + size < len(rows) else ""
+        return body
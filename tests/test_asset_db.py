@@ -0,0 +1,51 @@
+import pytest
+
+import main
+from fofa_stub import make_rows
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = main.AssetDatabase(str(tmp_path / "assets.db"))
+    yield database
+    database.close()
+
+
+def test_search_by_ip_prefix_and_wildcard(db):
+    db.record_page("q1", ["host", "ip", "port"], make_rows(300))
+    db.flush()
+
+    assert db.search(ip="10.0.1.")[0] == 44
+    assert db.search(ip="10.0.1.*")[0] == 44
+    assert db.search(ip="10.0.0.7")[0] == 1
+    assert db.search(ip="*")[0] == 300
+    assert db.search(ip="*", port=80)[0] == 100
+
+
+def test_search_lists_source_queries(db):
+    db.record_page("q1", ["host", "ip", "port"], make_rows(3))
+    db.record_page("q2", ["host", "ip", "port"], make_rows(1))
+    db.flush()
+
+    _, assets = db.search(host="h0.example.com")
+
+    assert sorted(assets[0]['queries']) == ["q1", "q2"]
+    assert db.search(query="q2")[0] == 1
+
+
+def test_writer_survives_unexpected_errors(db, monkeypatch):
+    record = main.AssetDatabase._record
+
+    def broken_record(fields_list, row, seen):
+        if row[0] == "bad":
+            raise TypeError("unexpected row")
+        return record(fields_list, row, seen)
+    monkeypatch.setattr(main.AssetDatabase, "_record", staticmethod(broken_record))
+
+    db.record_page("q1", ["host", "ip", "port"], [["bad", "1.1.1.1", "80"]])
+    db.flush()
+    db.record_page("q1", ["host", "ip", "port"], make_rows(5))
+    db.flush()
+
+    assert db._writer.is_alive()
+    assert db.stats()['assets'] == 5
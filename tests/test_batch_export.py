@@ -0,0 +1,82 @@
+import csv
+import threading
+import zipfile
+
+import main
+from fofa_stub import make_rows
+
+
+def test_async_batch_export_writes_each_query(app, fofa_stub):
+    fofa_stub.datasets["a"] = make_rows(30)
+    fofa_stub.datasets["b"] = make_rows(12, start=100)
+    progress = []
+
+    results, logs, files = main.run_async(app.async_batch_export_queries(
+        ["a", "b", "empty"], page_size=10, resume=False,
+        progress_callback=lambda current, total: progress.append((current, total))
+    ))
+
+    assert [r['record_count'] for r in results] == [30, 12, 0]
+    assert not results[2]['success']
+    assert len(files) == 2
+    with open(files[0], newline='', encoding='utf-8-sig') as f:
+        assert len(list(csv.reader(f))) == 31
+    assert progress[-1] == (3, 3)
+    assert all(current <= total for current, total in progress)
+
+
+def test_async_batch_export_to_zip_skips_empty_queries(app, fofa_stub):
+    fofa_stub.datasets["a"] = make_rows(20)
+    fofa_stub.datasets["b"] = make_rows(5)
+
+    location, results, _, error = main.run_async(app.async_batch_export_to_zip(
+        ["a", "empty", "b"], page_size=10, resume=False
+    ))
+
+    assert error is None
+    with zipfile.ZipFile(location) as archive:
+        assert len(archive.namelist()) == 2
+    assert [r['success'] for r in results] == [True, False, True]
+
+
+def test_async_batch_export_merged_deduplicates(app, fofa_stub):
+    fofa_stub.datasets["a"] = make_rows(20)
+    fofa_stub.datasets["b"] = make_rows(20, start=10)
+
+    location, _, _, error, stats = main.run_async(app.async_batch_export_merged(
+        ["a", "b"], page_size=10, resume=False
+    ))
+
+    assert error is None
+    assert stats == {'rows': 40, 'unique': 30}
+    with open(location, newline='', encoding='utf-8-sig') as f:
+        assert len(list(csv.reader(f))) == 31
+
+
+def test_async_export_runs_file_io_off_the_event_loop(app, fofa_stub, tmp_path, monkeypatch):
+    # 缓存、页面日志和导出文件的读写都不能占用共享事件循环线程
+    threads = []
+
+    def record(cls, name):
+        method = getattr(cls, name)
+
+        def wrapper(self, *args, **kwargs):
+            threads.append((name, threading.current_thread().name))
+            return method(self, *args, **kwargs)
+        monkeypatch.setattr(cls, name, wrapper)
+
+    record(main.ResponseCache, "get")
+    record(main.ResponseCache, "put")
+    record(main.PageJournal, "save_page")
+    record(main.get_result_writer(main.EXPORT_FORMAT_CSV), "write_rows")
+    monkeypatch.setattr(main, "_response_cache", main.ResponseCache(path=str(tmp_path / "cache.db")))
+    fofa_stub.datasets["a"] = make_rows(30)
+    fofa_stub.datasets["b"] = make_rows(30)
+
+    app.use_cache = True
+    main.run_async(app.async_batch_export_queries(["a"], page_size=10))
+    app.use_cache = False
+    main.run_async(app.async_batch_export_queries(["b"], page_size=10))
+
+    assert {name for name, _ in threads} == {"get", "put", "save_page", "write_rows"}
+    assert all(thread != "fofa-async-loop" for _, thread in threads)
@@ -0,0 +1,102 @@
+import http.client
+import os
+import time
+
+import pytest
+
+from download_server import DownloadServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    download_server = DownloadServer(host="127.0.0.1", port=0, root=str(tmp_path / "root"))
+    download_server.add_session_dir("s1", str(tmp_path))
+    download_server.start()
+    yield download_server
+    download_server.stop()
+
+
+def _request(server, path, headers=None, method="GET"):
+    conn = http.client.HTTPConnection("127.0.0.1", server._httpd.server_address[1], timeout=30)
+    conn.request(method, path, headers=headers or {})
+    response = conn.getresponse()
+    return conn, response
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    data = os.urandom(256 * 1024)
+    (tmp_path / "result.csv").write_bytes(data)
+    return data
+
+
+def test_full_get(server, data_file):
+    conn, response = _request(server, "/s1/result.csv")
+
+    assert response.status == 200
+    assert response.getheader("Content-Length") == str(len(data_file))
+    assert "result.csv" in response.getheader("Content-Disposition")
+    assert response.read() == data_file
+    conn.close()
+
+
+def test_range_request(server, data_file):
+    conn, response = _request(server, "/s1/result.csv", {"Range": "bytes=100-199"})
+
+    assert response.status == 206
+    assert response.getheader("Content-Range") == f"bytes 100-199/{len(data_file)}"
+    assert response.read() == data_file[100:200]
+
+    # 同一长连接上继续请求末尾区间
+    conn.request("GET", "/s1/result.csv", headers={"Range": "bytes=-10"})
+    response = conn.getresponse()
+    assert response.status == 206 and response.read() == data_file[-10:]
+    conn.close()
+
+
+def test_unsatisfiable_range(server, data_file):
+    conn, response = _request(server, "/s1/result.csv", {"Range": f"bytes={len(data_file)}-"})
+
+    assert response.status == 416
+    assert response.getheader("Content-Range") == f"bytes */{len(data_file)}"
+    response.read()
+    conn.close()
+
+
+def test_if_none_match(server, data_file):
+    conn, response = _request(server, "/s1/result.csv", method="HEAD")
+    etag = response.getheader("ETag")
+    response.read()
+    conn.close()
+
+    conn, response = _request(server, "/s1/result.csv", {"If-None-Match": etag})
+
+    assert response.status == 304 and response.read() == b""
+    conn.close()
+
+
+def test_other_session_and_traversal_are_rejected(server, data_file):
+    for path in ("/s2/result.csv", "/s1/..%2Fresult.csv", "/s1/missing.csv"):
+        conn, response = _request(server, path)
+        assert response.status == 404
+        response.read()
+        conn.close()
+
+
+def test_slow_reader_receives_whole_file(server, tmp_path):
+    # 文件远大于套接字缓冲区，客户端读取中途暂停时服务器必须等待可写，而不是中断连接
+    size = 64 * 1024 * 1024
+    with open(tmp_path / "large.bin", "wb") as f:
+        f.truncate(size)
+    conn, response = _request(server, "/s1/large.bin")
+
+    received = len(response.read(64 * 1024))
+    time.sleep(1.5)
+    while True:
+        chunk = response.read(1024 * 1024)
+        if not chunk:
+            break
+        received += len(chunk)
+
+    assert received == size
+    conn.close()
@@ -0,0 +1,92 @@
+import os
+import zipfile
+
+import pytest
+
+import main
+from fofa_stub import make_rows
+
+
+def _export_files(app):
+    directory = app._export_dir()
+    return sorted(os.listdir(directory))
+
+
+@pytest.fixture
+def failing_writer(monkeypatch):
+    def write_rows(self, rows):
+        raise OSError("磁盘已满")
+    monkeypatch.setattr(main.CsvResultWriter, "write_rows", write_rows)
+
+
+def test_parallel_export_paths_are_unique(app):
+    paths = {app._export_path("q")[1] for _ in range(5)}
+
+    assert len(paths) == 5
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_failed_export_to_csv_leaves_no_file(app, failing_writer):
+    location, error = app.export_to_csv(make_rows(10), ["host", "ip", "port"], "q")
+
+    assert location is None and "磁盘已满" in error
+    assert _export_files(app) == []
+
+
+def test_failed_stream_export_leaves_no_file(app, fofa_stub, failing_writer):
+    fofa_stub.datasets["q"] = make_rows(10)
+
+    location, _, error, _ = app.fetch_and_export("q", page_size=5, resume=False)
+
+    assert location is None and error
+    assert _export_files(app) == []
+
+
+def test_failed_batch_query_leaves_no_file(app, fofa_stub, failing_writer):
+    fofa_stub.datasets["q"] = make_rows(10)
+
+    results, logs, files = app.batch_export_queries(["q"], page_size=5, resume=False)
+
+    assert not results[0]['success'] and files == []
+    assert _export_files(app) == []
+
+
+def test_partitioned_export_without_rows_leaves_no_file(app, fofa_stub, monkeypatch):
+    fofa_stub.datasets["p1"] = make_rows(10)
+    fofa_stub.page_errors.add(("p1", 1))
+    monkeypatch.setattr(main.QueryPartitioner, "partition", lambda self, query: ([("p1", 10)], None))
+
+    location, _, error, _ = app.export_partitioned("q", page_size=5)
+
+    assert location is None and error
+    assert _export_files(app) == []
+
+
+def test_text_writer_requires_format_rows(tmp_path):
+    class IncompleteWriter(main.TextResultWriter):
+        extension = ".txt"
+
+    with pytest.raises(TypeError):
+        IncompleteWriter(str(tmp_path / "out.txt"), ["host"], "q")
+    assert not (tmp_path / "out.txt").exists()
+
+
+def test_zip_batch_skips_queries_without_rows(app, fofa_stub, monkeypatch):
+    fofa_stub.datasets["ok"] = make_rows(12)
+    fofa_stub.datasets["bad"] = make_rows(12)
+    fofa_stub.page_errors.update({("bad", 2), ("bad", 3)})
+    search = app.fofa_search
+
+    def empty_first_page(query, fields, page=1, size=100, **kwargs):
+        # 第一页有总数但没有行，之后的页面全部失败：该查询最终没有任何数据
+        if query == "bad" and page == 1:
+            return {'size': 12, 'results': []}, None
+        return search(query, fields, page=page, size=size, **kwargs)
+    monkeypatch.setattr(app, "fofa_search", empty_first_page)
+
+    location, results, _, error = app.batch_export_to_zip(["bad", "ok"], page_size=5, resume=False, max_workers=1)
+
+    assert error is None
+    assert [r['success'] for r in results] == [False, True]
+    with zipfile.ZipFile(location) as archive:
+        assert archive.namelist() == [results[1]['filename']]
@@ -0,0 +1,71 @@
+import main
+from fofa_stub import make_rows
+
+
+def test_page_engine_fetches_all_pages_in_order(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(2350)
+
+    results, fields_list, error, failed_pages = app.get_all_results("app=nginx", page_size=500, resume=False)
+
+    assert error is None and failed_pages == []
+    assert fields_list == ["host", "ip", "port"]
+    assert list(results) == make_rows(2350)
+    pages = sorted(int(params["page"]) for path, params in fofa_stub.requests if path == "/api/v1/search/all")
+    assert pages == [1, 2, 3, 4, 5]
+
+
+def test_cursor_engine_follows_next_until_exhausted(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(1200)
+
+    results, _, error, _ = app.get_all_results("app=nginx", page_size=500, resume=False, engine=main.ENGINE_CURSOR)
+
+    assert error is None
+    assert list(results) == make_rows(1200)
+    cursors = [params.get("next") for path, params in fofa_stub.requests if path == "/api/v1/search/next"]
+    assert cursors == [None, "500", "1000"]
+
+
+def test_page_engine_reports_failed_pages(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(1500)
+    fofa_stub.page_errors.add(("app=nginx", 2))
+    page_errors = []
+
+    total, _, pages, error = app.open_result_stream("app=nginx", page_size=500, page_errors=page_errors)
+    fetched = [page for page, _ in pages]
+
+    assert error is None and total == 1500
+    assert fetched == [1, 3]
+    assert [page for page, _ in page_errors] == [2]
+
+
+def test_full_fetch_returns_failed_pages(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(2000)
+    fofa_stub.page_errors.update({("app=nginx", 2), ("app=nginx", 4)})
+
+    results, _, error, failed_pages = app.get_all_results("app=nginx", page_size=500, resume=False)
+
+    assert error is None
+    assert failed_pages == [2, 4]
+    assert len(results) == 1000
+
+
+def test_async_full_fetch_returns_failed_pages(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(2000)
+    fofa_stub.page_errors.add(("app=nginx", 3))
+
+    results, _, error, failed_pages = main.run_async(
+        app.async_get_all_results("app=nginx", page_size=500, resume=False)
+    )
+
+    assert error is None and failed_pages == [3]
+    assert len(results) == 1500
+
+
+def test_stream_export_returns_failed_pages(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(1500)
+    fofa_stub.page_errors.add(("app=nginx", 2))
+
+    location, record_count, error, failed_pages = app.fetch_and_export("app=nginx", page_size=500, resume=False)
+
+    assert error is None and location
+    assert record_count == 1000 and failed_pages == [2]
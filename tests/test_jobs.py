@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def _wait(manager, job):
+    deadline = time.monotonic() + 5
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return manager.get(job.id)
+
+
+def test_thread_job_result_and_progress():
+    manager = main.JobManager(workers=1)
+
+    def work(job):
+        job.update(current=1, total=2)
+        return threading.current_thread().name
+
+    job = _wait(manager, manager.submit("export", work))
+
+    assert job.status == main.JOB_DONE
+    assert job.result.startswith("fofa-job")
+    assert manager.status(job.id)['progress'] == {'current': 1, 'total': 2}
+
+
+def test_coroutine_job_runs_on_shared_loop():
+    manager = main.JobManager()
+
+    async def work(job):
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop()
+
+    job = _wait(manager, manager.submit("full_search", work))
+
+    assert job.status == main.JOB_DONE
+    assert job.result is main.get_async_loop()
+
+
+def test_failed_job_keeps_error():
+    manager = main.JobManager()
+
+    async def work(job):
+        raise RuntimeError("boom")
+
+    job = _wait(manager, manager.submit("full_search", work))
+
+    assert job.status == main.JOB_FAILED and job.error == "boom"
+
+
+def test_queued_jobs_report_position_and_limit():
+    manager = main.JobManager(workers=1, max_pending=2)
+    release = threading.Event()
+    first = manager.submit("export", lambda job: release.wait(5))
+    second = manager.submit("export", lambda job: None)
+
+    with pytest.raises(RuntimeError):
+        manager.submit("export", lambda job: None)
+    while manager.status(first.id)['status'] == main.JOB_QUEUED:
+        time.sleep(0.01)
+    assert manager.status(second.id)['queue_position'] == 1
+
+    release.set()
+    assert _wait(manager, first).status == main.JOB_DONE
+    assert _wait(manager, second).status == main.JOB_DONE
+
+
+def test_finished_jobs_are_capped_per_owner_and_globally():
+    manager = main.JobManager(max_results=3, max_results_per_owner=2)
+    jobs = [_wait(manager, manager.submit("export", lambda job: "done", owner=owner))
+            for owner in ("a", "a", "a", "b", "c")]
+
+    retained = [job.id for job in jobs if manager.get(job.id) is not None]
+
+    # a 只保留最近的两个；全局最多三个，最早结束的 a 任务先被丢弃
+    assert retained == [jobs[2].id, jobs[3].id, jobs[4].id]
+
+
+def test_expired_jobs_are_dropped_when_another_job_finishes():
+    manager = main.JobManager(ttl=0)
+    first = _wait(manager, manager.submit("export", lambda job: "done"))
+    time.sleep(0.01)
+    _wait(manager, manager.submit("export", lambda job: "done"))
+
+    assert manager.get(first.id) is None
+
+
+def test_take_result_releases_the_result():
+    manager = main.JobManager()
+    job = _wait(manager, manager.submit("full_search", lambda job: ["row"] * 3))
+
+    assert job.take_result() == ["row"] * 3
+    assert job.result is None and job.result_taken
+    assert manager.status(job.id)['status'] == main.JOB_DONE
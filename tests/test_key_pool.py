@@ -0,0 +1,106 @@
+import pytest
+
+import main
+from fofa_stub import make_rows
+
+KEYS = ["key-a", "key-b", "key-c"]
+
+
+@pytest.fixture
+def pool(app, tmp_path, monkeypatch):
+    key_pool = main.KeyPool(path=str(tmp_path / "keys.enc"))
+    for key in KEYS:
+        key_pool.add(key)
+    monkeypatch.setattr(main, "_key_pool", key_pool)
+    app.use_key_pool = True
+    return key_pool
+
+
+def _status(pool, key):
+    return next(entry['status'] for entry in pool.entries() if entry['key'] == key)
+
+
+def test_fofa_error_code_prefers_errno_field():
+    assert main.fofa_error_code({"errno": 820031, "errmsg": "F点余额不足"}) == 820031
+    assert main.fofa_error_code({"errmsg": "[-700] Account Invalid"}) == -700
+    assert main.fofa_error_code({"errmsg": "查询语法错误: port=-700"}) is None
+    assert main.fofa_error_code({"errmsg": "未知错误"}) is None
+
+
+def test_requests_rotate_across_keys(app, fofa_stub, pool):
+    fofa_stub.datasets["q"] = make_rows(5)
+
+    for _ in range(6):
+        assert app.fofa_search("q", size=5)[1] is None
+
+    assert fofa_stub.keys_used() == KEYS * 2
+
+
+def test_exhausted_key_leaves_rotation(app, fofa_stub, pool):
+    fofa_stub.datasets["q"] = make_rows(5)
+    fofa_stub.key_errors["key-a"] = (820031, "F点余额不足")
+
+    result, error = app.fofa_search("q", size=5)
+
+    assert error is None and len(result['results']) == 5
+    assert fofa_stub.keys_used() == ["key-a", "key-b"]
+    assert _status(pool, "key-a") == "已耗尽"
+    assert pool.usable_count() == 2
+
+
+def test_error_text_alone_does_not_exhaust_key(pool):
+    assert not pool.report_error("key-b", "[45012] 查询语法错误: port=-700", 45012)
+    assert not pool.report_error("key-b", "HTTP 502")
+    assert _status(pool, "key-b") == "可用"
+
+
+def test_refresh_quota(fofa_stub, pool):
+    assert pool.refresh_quota("key-a") is None
+    assert pool.entries()[0]['remaining'] == 1000
+
+    fofa_stub.account = {"fofa_point": 0, "remain_api_query": 0}
+    assert pool.refresh_quota("key-b") is None
+    assert _status(pool, "key-b") == "已耗尽"
+
+    fofa_stub.key_errors["key-c"] = (-700, "Account Invalid")
+    assert pool.refresh_quota("key-c") == "[-700] Account Invalid"
+    assert _status(pool, "key-c") == "已耗尽"
+
+
+def test_cursor_pages_stay_on_the_issuing_key(app, fofa_stub, pool):
+    fofa_stub.datasets["q"] = make_rows(1200)
+
+    results, _, error, _ = app.get_all_results("q", page_size=500, resume=False, engine=main.ENGINE_CURSOR)
+
+    assert error is None and len(results) == 1200
+    next_keys = [params["key"] for path, params in fofa_stub.requests if path == "/api/v1/search/next"]
+    assert len(next_keys) == 3 and len(set(next_keys)) == 1
+
+
+def test_cache_scope_does_not_depend_on_form_key(app, pool):
+    app.api_key = ""
+    assert app._cache_scope() == main.KEY_POOL_CACHE_SCOPE
+
+    app.use_key_pool = False
+    app.api_key = "test-key"
+    assert app._cache_scope() == "test-key"
+
+
+def test_pool_is_opt_in_and_desktop_only(fofa_stub, pool, monkeypatch):
+    assert not main.KEY_POOL_ENABLED
+    assert main.FofaGUIApp()._key_pool() is None
+
+    monkeypatch.setattr(main, "KEY_POOL_ENABLED", True)
+    assert main.FofaGUIApp()._key_pool() is pool
+    web_app = main.FofaGUIApp(is_web=True, session_id="web-session")
+    assert not web_app.use_key_pool
+    web_app.use_key_pool = True
+    assert web_app._key_pool() is None and web_app.key_count() == 1
+
+
+def test_refresh_quota_waits_for_key_rate_limit(fofa_stub, pool, monkeypatch):
+    acquired = []
+    monkeypatch.setattr(pool.scheduler, "acquire", lambda key, session_id=None: acquired.append(key))
+
+    assert pool.refresh_quota("key-b") is None
+    assert acquired == ["key-b"]
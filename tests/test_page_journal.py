@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+import main
+from fofa_stub import make_rows
+
+
+def _make_journal(root, name, created):
+    path = root / name
+    path.mkdir(parents=True)
+    (path / "meta.json").write_text(json.dumps({"created": created}), encoding="utf-8")
+    (path / "page_000001.json").write_text("[]", encoding="utf-8")
+    return path
+
+
+def test_sweep_removes_only_expired_journals(tmp_path):
+    root = tmp_path / "journal"
+    old = _make_journal(root, "old", time.time() - main.JOURNAL_MAX_AGE - 60)
+    fresh = _make_journal(root, "fresh", time.time())
+    broken = root / "broken"
+    broken.mkdir()
+    stale = time.time() - main.JOURNAL_MAX_AGE - 60
+    os.utime(broken, (stale, stale))
+
+    assert main.sweep_page_journals(str(root)) == 2
+    assert not old.exists() and not broken.exists()
+    assert fresh.exists()
+
+
+def test_opening_a_journal_sweeps_abandoned_queries(tmp_path):
+    root = tmp_path / "journal"
+    abandoned = _make_journal(root, "abandoned", time.time() - main.JOURNAL_MAX_AGE - 60)
+
+    main.PageJournal("app=nginx", "host,ip,port", 100, root=str(root))
+
+    assert not abandoned.exists()
+
+
+def test_resume_journals_pages_without_cache(app, fofa_stub):
+    fofa_stub.datasets["app=nginx"] = make_rows(1500)
+    fofa_stub.page_errors.add(("app=nginx", 2))
+
+    _, _, _, failed_pages = app.get_all_results("app=nginx", page_size=500)
+    assert failed_pages == [2]
+
+    fofa_stub.page_errors.clear()
+    fofa_stub.requests.clear()
+    results, _, error, failed_pages = app.get_all_results("app=nginx", page_size=500)
+
+    assert error is None and failed_pages == [] and len(results) == 1500
+    # 已写入日志的页面不再请求，只补拉失败的第 2 页（以及确认总量的第 1 页）
+    pages = sorted(int(params["page"]) for path, params in fofa_stub.requests if path == "/api/v1/search/all")
+    assert 3 not in pages and 2 in pages
+
+
+def test_no_journal_when_response_cache_holds_pages(app, fofa_stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "_response_cache", main.ResponseCache(path=str(tmp_path / "cache.db")))
+    app.use_cache = True
+    fofa_stub.datasets["app=nginx"] = make_rows(1000)
+
+    results, _, error, _ = app.get_all_results("app=nginx", page_size=500)
+
+    assert error is None and len(results) == 1000
+    assert not os.path.exists(main.JOURNAL_DIR)
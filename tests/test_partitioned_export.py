@@ -0,0 +1,95 @@
+import csv
+import re
+from datetime import date, timedelta
+
+import main
+from fofa_stub import make_rows
+
+_WINDOW_RE = re.compile(r'after="([\d-]+)" && before="([\d-]+)"')
+
+
+class _CountingApp:
+    """只实现 QueryPartitioner 需要的 fofa_search，按 after/before 窗口统计预设记录的数量"""
+
+    def __init__(self, dates):
+        self.dates = dates
+
+    def fofa_search(self, query, fields, page=1, size=1):
+        after, before = (date.fromisoformat(v) for v in _WINDOW_RE.search(query).groups())
+        return {'size': sum(1 for d in self.dates if after < d < before)}, None
+
+
+def test_partitioner_splits_into_non_overlapping_windows_under_limit():
+    start = date(2020, 1, 1)
+    dates = [start + timedelta(days=i % 400) for i in range(1000)]
+    partitioner = main.QueryPartitioner(_CountingApp(dates), limit=100)
+
+    partitions, error = partitioner.partition("app=nginx")
+
+    assert error is None
+    assert all(0 < count <= 100 for _, count in partitions)
+    assert sum(count for _, count in partitions) == len(dates)
+
+
+def _use_partitions(monkeypatch, partitions):
+    monkeypatch.setattr(main.QueryPartitioner, "partition", lambda self, query: (partitions, None))
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.reader(f))
+
+
+def test_partitioned_export_removes_rows_shared_between_partitions(app, fofa_stub, monkeypatch):
+    fofa_stub.datasets["p1"] = make_rows(300)
+    fofa_stub.datasets["p2"] = make_rows(300, start=200)
+    _use_partitions(monkeypatch, [("p1", 300), ("p2", 300)])
+
+    location, count, error, failures = app.export_partitioned("q", page_size=100)
+
+    assert error is None and failures == []
+    assert count == 500
+    rows = _read_csv(location)
+    assert len(rows) == 501
+    assert len({tuple(row) for row in rows[1:]}) == 500
+
+
+def test_partitioned_export_reports_failed_partition_pages(app, fofa_stub, monkeypatch):
+    fofa_stub.datasets["p1"] = make_rows(300)
+    fofa_stub.datasets["p2"] = make_rows(300, start=1000)
+    fofa_stub.page_errors.add(("p2", 2))
+    _use_partitions(monkeypatch, [("p1", 300), ("p2", 300)])
+
+    location, count, error, failures = app.export_partitioned("q", page_size=100)
+
+    assert error is None
+    assert count == 500
+    assert len(failures) == 1 and failures[0].startswith("p2: 第2页失败")
+    assert len(_read_csv(location)) == 501
+
+
+def test_partitioned_export_fails_when_nothing_was_written(app, fofa_stub, monkeypatch):
+    fofa_stub.page_errors.add(("p1", 1))
+    fofa_stub.datasets["p1"] = make_rows(10)
+    _use_partitions(monkeypatch, [("p1", 10)])
+
+    location, count, error, failures = app.export_partitioned("q", page_size=100)
+
+    assert location is None and count == 0
+    assert error and failures
+
+
+def test_partitioned_export_deduplicates_by_asset_key(app, fofa_stub, monkeypatch):
+    # 同一资产在两个分区中标题不同，只导出一次；表头使用 FOFA 返回的字段顺序
+    fofa_stub.fields = ["ip", "port", "host", "title"]
+    fofa_stub.datasets["p1"] = [[ip, port, host, "old"] for host, ip, port in make_rows(50)]
+    fofa_stub.datasets["p2"] = [[ip, port, host, "new"] for host, ip, port in make_rows(50, start=25)]
+    _use_partitions(monkeypatch, [("p1", 50), ("p2", 50)])
+
+    location, count, error, _ = app.export_partitioned("q", fields="host,ip,port,title", page_size=20)
+
+    assert error is None and count == 75
+    rows = _read_csv(location)
+    assert rows[0][:4] == ["ip", "port", "host", "title"]
+    assert len(rows) == 76
+    assert {row[2] for row in rows[1:]} == {f"h{i}.example.com" for i in range(75)}
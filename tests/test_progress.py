@@ -0,0 +1,45 @@
+import flet as ft
+
+import main
+
+
+class _RecordingPage:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, *controls):
+        self.updates.append(controls)
+
+
+def test_throttle_clears_progress_bar_after_value():
+    page = _RecordingPage()
+    bar = ft.ProgressBar()
+    throttle = main.ProgressThrottle(page, hz=1000)
+
+    throttle.set(bar, value=0.5)
+    throttle.flush()
+    throttle.set(bar, value=None)
+    throttle.flush()
+    throttle.set(bar, value=None)
+    throttle.flush()
+
+    assert main._control_value(bar, "value") is None
+    assert len(page.updates) == 2
+
+
+def test_throttle_merges_updates_within_interval():
+    page = _RecordingPage()
+    bar = ft.ProgressBar()
+    text = ft.Text()
+    throttle = main.ProgressThrottle(page, hz=0.001)
+
+    throttle.flush()
+    for step in range(10):
+        throttle.set(bar, value=step / 10)
+        throttle.set(text, value=f"{step}/10")
+    throttle.flush()
+
+    # 第一次更新立即推送，其余的合并到 flush 时一次推送
+    assert len(page.updates) == 2
+    assert page.updates[0] == (bar,) and set(page.updates[1]) == {bar, text}
+    assert bar.value == 0.9 and text.value == "9/10"
@@ -0,0 +1,48 @@
+import main
+
+
+def test_float_column_keeps_missing_and_nan_apart():
+    store = main.ResultStore(["ip", "latitude"])
+    store.extend([["1.1.1.1", "31.2"], ["1.1.1.2", ""], ["1.1.1.3", "nan"], ["1.1.1.4", None]])
+
+    assert isinstance(store.columns[1], main._FloatColumn)
+    assert store.column("latitude") == ["31.2", "", "nan", ""]
+
+
+def test_numeric_column_falls_back_to_dictionary():
+    store = main.ResultStore(["port", "longitude"])
+    store.extend([["80", "1.5"], ["080", "1.50"], ["", ""]])
+
+    assert [type(column) for column in store.columns] == [main._DictColumn, main._DictColumn]
+    assert list(store) == [["80", "1.5"], ["080", "1.50"], ["", ""]]
+
+
+def test_float_sort_places_missing_first():
+    store = main.ResultStore(["latitude"])
+    store.extend([["2.5"], [""], ["-1.0"]])
+
+    order = main.ResultIndex(store)._sorted("latitude")[0]
+
+    assert list(order) == [1, 2, 0]
+
+
+def test_float_nan_sorts_after_numbers_and_is_out_of_range():
+    store = main.ResultStore(["latitude"])
+    store.extend([["nan"], ["2.5"], [""], ["-1.0"]])
+    index = main.ResultIndex(store)
+
+    assert index.search(sort_field="latitude") == [2, 3, 1, 0]
+    assert index.search("latitude>=-5") == [1, 3]
+    assert index.search("latitude<3") == [1, 3]
+
+
+def test_sort_reflects_rows_added_after_first_use():
+    store = main.ResultStore(["port"])
+    store.extend([["443"], ["80"]])
+    index = main.ResultIndex(store)
+    assert index.search(sort_field="port") == [1, 0]
+
+    store.extend([["22"], ["8080"]])
+
+    assert index.search(sort_field="port") == [2, 1, 0, 3]
+    assert index.search("port>100") == [0, 3]
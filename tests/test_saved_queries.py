@@ -0,0 +1,52 @@
+import csv
+
+import pytest
+
+import main
+from fofa_stub import make_rows
+
+
+@pytest.fixture
+def store(tmp_path):
+    return main.SavedQueryStore(path=str(tmp_path / "saved.json"), snapshot_dir=str(tmp_path / "snapshots"))
+
+
+def _snapshot(store, name):
+    with open(store.snapshot_path(name), newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_merge_snapshot_streams_rows_and_deduplicates(store):
+    rows = iter(make_rows(5) + make_rows(2))
+
+    assert store.merge_snapshot("s", ["host", "ip", "port"], rows) == (5, 0, 5)
+    assert len(_snapshot(store, "s")) == 6
+
+
+def test_merge_snapshot_remaps_old_header(store):
+    store.merge_snapshot("s", ["host", "ip", "port"], make_rows(3))
+    delta = [["10.0.0.1", "81", "h1.example.com", "new title"]]
+
+    new, updated, total = store.merge_snapshot("s", ["ip", "port", "host", "title"], delta)
+
+    assert (new, updated, total) == (0, 1, 3)
+    rows = _snapshot(store, "s")
+    assert rows[0] == ["ip", "port", "host", "title"]
+    assert rows[1] == delta[0]
+    assert sorted(rows[2:]) == [["10.0.0.0", "80", "h0.example.com", ""], ["10.0.0.2", "82", "h2.example.com", ""]]
+
+
+def test_sync_saved_query_merges_incremental_results(app, fofa_stub, store):
+    full = make_rows(25)
+    changed = [["h3.example.com", "10.0.0.3", "80"], ["new.example.com", "10.0.9.9", "443"]]
+    fofa_stub.resolver = lambda query: changed if "after=" in query else full
+    store.save("watch", "app=x", "host,ip,port")
+
+    stats, error = app.sync_saved_query("watch", page_size=10, store=store)
+    assert error is None
+    assert (stats['incremental'], stats['fetched'], stats['record_count']) == (False, 25, 25)
+
+    stats, error = app.sync_saved_query("watch", page_size=10, store=store)
+    assert error is None
+    assert (stats['incremental'], stats['new'], stats['updated'], stats['record_count']) == (True, 1, 1, 26)
+    assert store.get("watch")['last_new'] == 1
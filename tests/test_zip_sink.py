@@ -0,0 +1,72 @@
+import threading
+import zipfile
+
+import pytest
+
+import main
+from fofa_stub import make_rows
+
+
+def _entry(sink, name, data):
+    entry = sink.open_entry(name)
+    entry.write(data)
+    return entry
+
+
+def test_aborted_entries_are_removed_from_archive(tmp_path):
+    path = str(tmp_path / "out.zip")
+    sink = main.ZipBatchSink(path)
+
+    _entry(sink, "a.csv", b"a" * 1000).close()
+    direct = _entry(sink, "b.csv", b"b" * 1000)       # 持有写入权，直接写入 ZIP
+    spooled = _entry(sink, "c.csv", b"c" * 1000)      # 等待写入权，先写入缓冲
+    spooled.abort()
+    direct.abort()
+    _entry(sink, "d.csv", b"d" * 1000).close()
+    sink.close()
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.csv", "d.csv"]
+        assert archive.read("d.csv") == b"d" * 1000
+
+
+def test_close_discards_entries_left_open(tmp_path):
+    path = str(tmp_path / "out.zip")
+    sink = main.ZipBatchSink(path)
+    _entry(sink, "a.csv", b"a").close()
+    _entry(sink, "left-open.csv", b"x" * 100)
+
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    closer.join(timeout=5)
+
+    assert not closer.is_alive()
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == ["a.csv"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_query_failing_midway_leaves_no_zip_entry(app, fofa_stub, monkeypatch, use_async):
+    fofa_stub.datasets["ok"] = make_rows(12)
+    fofa_stub.datasets["bad"] = make_rows(12, start=100)
+    write_rows = main.CsvResultWriter.write_rows
+
+    def fail_on_later_page(self, rows):
+        if rows and rows[0][0] == "h105.example.com":
+            raise OSError("磁盘已满")
+        return write_rows(self, rows)
+    monkeypatch.setattr(main.CsvResultWriter, "write_rows", fail_on_later_page)
+
+    if use_async:
+        location, results, _, error = main.run_async(app.async_batch_export_to_zip(
+            ["bad", "ok"], page_size=5, resume=False, max_concurrency=1
+        ))
+    else:
+        location, results, _, error = app.batch_export_to_zip(["bad", "ok"], page_size=5, resume=False, max_workers=1)
+
+    assert error is None
+    assert [r['success'] for r in results] == [False, True]
+    with zipfile.ZipFile(location) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [results[1]['filename']]